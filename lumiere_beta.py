@@ -34,18 +34,30 @@ bl_info = {
     "category": "Render"}
 
 import bpy, bgl, os, blf
+from bpy.app.handlers import persistent
 from bpy_extras import view3d_utils
 from mathutils import Vector, Matrix, Quaternion, Euler
+from mathutils.bvhtree import BVHTree
 from bpy.types import PropertyGroup, UIList, Panel, Operator
 from bpy.props import IntProperty, FloatProperty, BoolProperty, FloatVectorProperty, EnumProperty, StringProperty, CollectionProperty, PointerProperty
 from bpy_extras.object_utils import AddObjectHelper, object_data_add
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, deque, OrderedDict
 from bpy_extras.view3d_utils import location_3d_to_region_2d
 import textwrap
 import math
 import bmesh
+import numpy as np
 import time
 import json
+import heapq
+import struct
+import mmap
+import re
+import bisect
+import difflib
+import hashlib
+import subprocess
+import tempfile
 
 #########################################################################################################
 
@@ -158,6 +170,14 @@ class LumierePrefs(bpy.types.AddonPreferences):
                                   max = 1.0,
                                   default = (1.0, 0.09, 0.3, 0.8))                                 
 
+    #Refresh rate of the interactive mode
+    bpy.types.Scene.Modal_rate = IntProperty(
+                               name="Refresh rate",
+                               description="Maximum number of updates per second of the interactive mode, 0 for no limit",
+                               min=0,
+                               max=240,
+                               default=60)
+
     category = bpy.props.StringProperty(
             name="Category",
             description="Choose a name for the category of the panel",
@@ -186,6 +206,7 @@ class LumierePrefs(bpy.types.AddonPreferences):
         row.prop(self, "category")
         row = layout.row()
         row.prop(scene, "HUD_color", text="HUD Color")
+        row.prop(scene, "Modal_rate")
         # split = row.split(0.5, align=False)
         # split.prop(self, "category")
         # split.prop(scene, "HUD_color", text="HUD Color")
@@ -548,8 +569,13 @@ def target_constraint(self, context, name):
 def remove_constraint(self, context, name):
     """Remove the empty and the constraint of the object for the orbit mode"""
     obj_light = context.object
-    bpy.data.objects[obj_light.name].select = True
-    bpy.ops.object.visual_transform_apply()
+
+#---Apply the visual transform of the constraint to the light
+    matrix = obj_light.matrix_world.copy()
+    if obj_light.parent is not None:
+        matrix = (obj_light.parent.matrix_world * obj_light.matrix_parent_inverse).inverted() * matrix
+    obj_light.matrix_basis = matrix
+
     empty = context.scene.objects.get(name + "_Empty") 
     obj_light.constraints['Track To'].influence = 0
     obj_light['dir'] = (obj_light.location - Vector(obj_light['hit'])).normalized() 
@@ -577,6 +603,206 @@ def update_constraint(self, context, event, name):
     
 #########################################################################################################
 
+#########################################################################################################
+# global variable to store the acceleration structures for the raycast in :
+# "nodes" : top level hierarchy over the bounding boxes of the visible meshes
+# "key" : visible meshes used to build the hierarchy, None to collect them again
+# "view" : scene, visible layers and number of objects when the visible meshes were collected
+# "trees" : {object name : (mesh key, BVHTree in object space)}
+# "matrices" : {object name : (world matrix, inverted matrix, normal matrix)}
+Lumiere_bvh = {"nodes": None, "key": None, "view": None, "trees": {}, "matrices": {}}
+
+def bvh_object_matrices(obj):
+    """Return the cached world, inverted and normal matrices of the object"""
+
+    cached = Lumiere_bvh["matrices"].get(obj.name)
+    if cached is None:
+        matrix = obj.matrix_world.copy()
+        matrix_inv = matrix.inverted()
+        cached = (matrix, matrix_inv, matrix_inv.transposed().to_3x3())
+        Lumiere_bvh["matrices"][obj.name] = cached
+
+    return(cached)
+
+def bvh_mesh_key(obj):
+    """Return the state of the mesh used to know if its tree is still valid"""
+
+    return((obj.data.name, len(obj.data.vertices), len(obj.data.polygons),
+            tuple((mod.name, mod.type, mod.show_viewport) for mod in obj.modifiers)))
+
+def bvh_object_tree(context, obj):
+    """Return the cached BVHTree of the object in object space, build it if needed"""
+
+    key = bvh_mesh_key(obj)
+    cached = Lumiere_bvh["trees"].get(obj.name)
+    if cached is None or cached[0] != key:
+        tree = BVHTree.FromObject(obj, context.scene)
+        cached = (key, tree)
+        Lumiere_bvh["trees"][obj.name] = cached
+
+    return(cached[1])
+
+def bvh_world_bounds(obj):
+    """Return the min and max corners of the bounding box of the object in world space"""
+
+    matrix = bvh_object_matrices(obj)[0]
+    corners = [matrix * Vector(corner) for corner in obj.bound_box]
+    bmin = Vector([min(c[axis] for c in corners) for axis in range(3)])
+    bmax = Vector([max(c[axis] for c in corners) for axis in range(3)])
+
+    return(bmin, bmax)
+
+def bvh_build(items):
+    """Build the hierarchy of bounding boxes : (bmin, bmax, object name, left node, right node)"""
+
+    bmin = Vector([min(it[0][axis] for it in items) for axis in range(3)])
+    bmax = Vector([max(it[1][axis] for it in items) for axis in range(3)])
+
+    if len(items) == 1:
+        return((bmin, bmax, items[0][2], None, None))
+
+#---Split on the median of the longest axis
+    axis = max(range(3), key = lambda a: bmax[a] - bmin[a])
+    items = sorted(items, key = lambda it: it[0][axis] + it[1][axis])
+    half = len(items) // 2
+
+    return((bmin, bmax, None, bvh_build(items[:half]), bvh_build(items[half:])))
+
+def bvh_ray_box(origin, inv_dir, bmin, bmax):
+    """Return the distance where the ray enter the box, None if it misses it"""
+
+    tmin = 0.0
+    tmax = float("inf")
+    for axis in range(3):
+        t1 = (bmin[axis] - origin[axis]) * inv_dir[axis]
+        t2 = (bmax[axis] - origin[axis]) * inv_dir[axis]
+        if t1 > t2:
+            t1, t2 = t2, t1
+        tmin = max(tmin, t1)
+        tmax = min(tmax, t2)
+        if tmin > tmax:
+            return(None)
+
+    return(tmin)
+
+def bvh_scene_nodes(context):
+    """Return the hierarchy of the visible meshes, rebuild it if the scene changed"""
+
+#---The visible meshes are only collected again if bvh_tag_update forgot them or the view changed
+    scene = context.scene
+    view = (scene.name, tuple(getattr(context.space_data, "layers", scene.layers)), len(scene.objects))
+    if Lumiere_bvh["key"] is None or Lumiere_bvh["view"] != view:
+        key = tuple(obj.name for obj in context.visible_objects if obj.type == 'MESH' and "Lumiere" not in obj.data.name)
+        if key != Lumiere_bvh["key"]:
+            Lumiere_bvh["nodes"] = None
+        Lumiere_bvh["key"] = key
+        Lumiere_bvh["view"] = view
+
+    if Lumiere_bvh["nodes"] is None:
+        objects = [bpy.data.objects.get(name) for name in Lumiere_bvh["key"]]
+        items = [bvh_world_bounds(obj) + (obj.name,) for obj in objects if obj is not None]
+        Lumiere_bvh["nodes"] = bvh_build(items) if items else None
+
+    return(Lumiere_bvh["nodes"])
+
+def raycast_bvh(context, light, ray_origin, view_vector, ray_max):
+    """Return the closest object hit by the ray : (object, matrices, hit, normal) with hit and normal in object space"""
+
+    def obj_ray_cast(obj):
+    #---Get the ray relative to the object
+        matrices = bvh_object_matrices(obj)
+        matrix, matrix_inv = matrices[0], matrices[1]
+        ray_origin_obj = matrix_inv * ray_origin
+        ray_direction_obj = (matrix_inv * (ray_origin + view_vector)) - ray_origin_obj
+
+    #---Cast the ray on the cached tree
+        hit, normal, face_index, distance = bvh_object_tree(context, obj).ray_cast(ray_origin_obj, ray_direction_obj)
+        if hit is None:
+            return(None)
+
+        return((obj, matrices, hit, normal), ((matrix * hit) - ray_origin).length)
+
+#---Only the target object
+    if light.Lumiere.objtarget != "":
+        result = obj_ray_cast(bpy.data.objects[light.Lumiere.objtarget])
+        return(result[0] if result is not None else None)
+
+    root = bvh_scene_nodes(context)
+    if root is None:
+        return(None)
+
+    inv_dir = [1.0 / v if v != 0 else 1e30 for v in view_vector]
+    best = None
+    best_distance = ray_max
+
+#---Visit the boxes from near to far, stop when the next box is behind the closest hit
+    order = 0
+    heap = []
+    distance = bvh_ray_box(ray_origin, inv_dir, root[0], root[1])
+    if distance is not None:
+        heapq.heappush(heap, (distance, order, root))
+
+    while heap:
+        distance, _, node = heapq.heappop(heap)
+        if distance > best_distance:
+            break
+
+        if node[2] is not None:
+            obj = bpy.data.objects.get(node[2])
+            result = obj_ray_cast(obj) if obj is not None else None
+            if result is not None and result[1] < best_distance:
+                best, best_distance = result
+        else:
+            for child in (node[3], node[4]):
+                distance = bvh_ray_box(ray_origin, inv_dir, child[0], child[1])
+                if distance is not None and distance <= best_distance:
+                    order += 1
+                    heapq.heappush(heap, (distance, order, child))
+
+    return(best)
+
+@persistent
+def bvh_tag_update(scene):
+    """Forget the hierarchy and the trees of the meshes moved or edited"""
+
+    if not bpy.data.objects.is_updated:
+        return
+
+#---Only the meshes of the hierarchy and of the caches, the lights are never in them
+    updated = False
+    names = set(Lumiere_bvh["key"] or ()).union(Lumiere_bvh["trees"], Lumiere_bvh["matrices"])
+    for name in names:
+        obj = bpy.data.objects.get(name)
+        if obj is None:
+            updated = True
+            Lumiere_bvh["key"] = None
+            Lumiere_bvh["matrices"].pop(name, None)
+            Lumiere_bvh["trees"].pop(name, None)
+        elif obj.is_updated or obj.is_updated_data:
+            updated = True
+            Lumiere_bvh["nodes"] = None
+            Lumiere_bvh["matrices"].pop(name, None)
+            if obj.is_updated_data:
+                Lumiere_bvh["trees"].pop(name, None)
+
+#---No mesh of the hierarchy and no light updated : an object was shown or hidden, collect the visible meshes again
+    if not updated:
+        lights = (bpy.data.objects.get(name) for name in Lumiere_lights.get(scene.name, {}).values())
+        if not any(ob is not None and ob.is_updated for ob in lights):
+            Lumiere_bvh["key"] = None
+
+@persistent
+def bvh_reset(dummy):
+    """Forget all the acceleration structures after undo / redo / loading a file"""
+
+    Lumiere_bvh["nodes"] = None
+    Lumiere_bvh["key"] = None
+    Lumiere_bvh["view"] = None
+    Lumiere_bvh["trees"].clear()
+    Lumiere_bvh["matrices"].clear()
+
+#########################################################################################################
+
 #########################################################################################################
 def raycast_light(self, range, context, coord, ray_max=1000.0):
     """Compute the location and rotation of the light from the angle or normal of the targeted face off the object"""
@@ -593,65 +819,39 @@ def raycast_light(self, range, context, coord, ray_max=1000.0):
     ray_origin = view3d_utils.region_2d_to_origin_3d(self.region, self.rv3d, (coord))
     ray_target = ray_origin + view_vector
 
-#---Select the object 
-    def visible_objects_and_duplis():
-        if light.Lumiere.objtarget != "":
-            obj = bpy.data.objects[light.Lumiere.objtarget]
-            yield (obj, obj.matrix_world.copy())
-        else :
-            for obj in context.visible_objects:
-                if obj.type == 'MESH' and "Lumiere" not in obj.data.name:
-                    yield (obj, obj.matrix_world.copy())
-
-#---Cast the ray
-    def obj_ray_cast(obj, matrix):
-    #---Get the ray relative to the object
-        matrix_inv = matrix.inverted()
-        ray_origin_obj = matrix_inv * ray_origin
-        ray_target_obj = matrix_inv * ray_target
-        ray_direction_obj = ray_target_obj - ray_origin_obj
-
-    #---Cast the ray
-        success, hit, normal, face_index = obj.ray_cast(ray_origin_obj, ray_direction_obj)
-
-        return  success, hit, normal
-
-#---Find the closest object
+#---Find the closest object from the cached bounding volume hierarchy
     best_length_squared = ray_max * ray_max
-    best_obj = None
+    best = raycast_bvh(context, light, ray_origin, view_vector, ray_max)
 
 #---Position of the light from the object
-    for obj, matrix in visible_objects_and_duplis():
-        i = 1
-
-        success, hit, normal = obj_ray_cast(obj, matrix)
+    if best is not None:
+        obj, (matrix, matrix_inv, normal_matrix), hit, normal = best
+        length_squared = ((matrix * hit) - ray_origin).length_squared
+
+    if 0 < length_squared < best_length_squared:
+    #---Define direction based on the normal of the object or the view angle
+        if self.reflect_angle == "Normal": 
+            direction = normal_matrix * normal
+        else:
+            direction = (view_vector).reflect(normal_matrix * normal)
         
-        if success :
-        #---Define direction based on the normal of the object or the view angle
-            if self.reflect_angle == "Normal" and (i == 1): 
-                direction = (normal * matrix.inverted())
-            else:
-                direction = (view_vector).reflect(normal * matrix.inverted())
-            
-            if light.Lumiere.invert_ray:
-                direction *= -1
-            
-        #---Define range
-            hit_world = (matrix * hit) + (range * direction)
-
-            length_squared = ((matrix * hit) - ray_origin).length_squared
-
-            if length_squared < best_length_squared:
-                best_length_squared = length_squared
-                self.matrix = matrix
-                self.hit = hit
-                self.hit_world = hit_world
-                self.direction = direction
-                self.target_name = obj.name
-
-            #---Parent the light to the target object
-                light.parent = obj
-                light.matrix_parent_inverse = obj.matrix_world.inverted()
+        if light.Lumiere.invert_ray:
+            direction *= -1
+        
+    #---Define range
+        hit_world = (matrix * hit) + (range * direction)
+
+        self.matrix = matrix
+        self.hit = hit
+        self.hit_world = hit_world
+        self.direction = direction
+        self.target_name = obj.name
+
+    #---Parent the light to the target object
+        light.parent = obj
+        light.matrix_parent_inverse = matrix_inv
+    else:
+        length_squared = 0
                 
 #---Define location, rotation and scale
     if length_squared > 0 :
@@ -755,25 +955,385 @@ def repeat_group_mat(mat, name_group):
 #########################################################################################################
 
 #########################################################################################################
-def projector_mat():
+# version of the node templates, increase it when the nodes built by a template change
+Lumiere_templates_version = 2
+
+# names of the nodes in the previous templates : {new name : old name}
+Lumiere_templates_legacy = {"Projector_Color": "Transparent BSDF.001"}
+
+def get_template_mat(name, build):
+    """Return the template material with this name, build its nodes if it's missing or outdated"""
+
+    mat = bpy.data.materials.get(name)
+    if mat is None:
+        mat = bpy.data.materials.new(name)
+        mat.use_nodes = True
+    #---Kept in the file without any user, hidden from the lists by the dot
+        mat.use_fake_user = True
+
+    if mat.get("lumiere_version") != Lumiere_templates_version:
+        mat.node_tree.nodes.clear()
+        build(mat)
+        mat["lumiere_version"] = Lumiere_templates_version
+
+    return(mat)
+
+def get_template_group(name, build):
+    """Return the shared node group with this name, build its nodes if it's missing or outdated"""
+
+    group = bpy.data.node_groups.get(name)
+    if group is None:
+        group = bpy.data.node_groups.new(type="ShaderNodeTree", name=name)
+        group.use_fake_user = True
+
+    if group.get("lumiere_version") != Lumiere_templates_version:
+        group.nodes.clear()
+        group.inputs.clear()
+        group.outputs.clear()
+        build(group)
+        group["lumiere_version"] = Lumiere_templates_version
+
+    return(group)
+
+def add_template_group(mat, name, build, node_name):
+    """Add an instance of the shared node group in the material"""
+
+    group_node = mat.node_tree.nodes.new("ShaderNodeGroup")
+    group_node.node_tree = get_template_group(name, build)
+    group_node.name = node_name
+
+    return(group_node)
+
+def instance_template_mat(template, mat_name):
+    """Copy the template as the material of the light, the values of the old material are kept"""
+
+    mat = template.copy()
+    mat.use_fake_user = False
+
+    old_mat = bpy.data.materials.get(mat_name)
+    if old_mat is not None:
+        migrate_template_mat(old_mat, mat)
+        old_mat.user_remap(mat)
+        bpy.data.materials.remove(old_mat, do_unlink=True)
+    mat.name = mat_name
+
+    return(mat)
+
+def migrate_template_mat(old_mat, mat):
+    """Copy the values of the light from its previous material, the nodes are matched by name"""
+
+    if old_mat.node_tree is None:
+        return
+
+    old_nodes = old_mat.node_tree.nodes
+    for node in mat.node_tree.nodes:
+        old = old_nodes.get(node.name) or old_nodes.get(Lumiere_templates_legacy.get(node.name, ""))
+        if old is None or old.bl_idname != node.bl_idname:
+            continue
+        for old_input, new_input in zip(old.inputs, node.inputs):
+            if hasattr(new_input, "default_value") and old_input.name == new_input.name:
+                new_input.default_value = old_input.default_value
+        for attr in ("image", "gradient_type", "blend_type", "rotation", "translation", "scale"):
+            if hasattr(node, attr):
+                setattr(node, attr, getattr(old, attr))
+        if node.bl_idname == 'ShaderNodeValToRGB':
+            old_ramp, ramp = old.color_ramp, node.color_ramp
+            ramp.interpolation = old_ramp.interpolation
+            while len(ramp.elements) < len(old_ramp.elements):
+                ramp.elements.new(0)
+            while len(ramp.elements) > len(old_ramp.elements):
+                ramp.elements.remove(ramp.elements[-1])
+            for old_element, element in zip(old_ramp.elements, ramp.elements):
+                element.position = old_element.position
+                element.color = old_element.color
+
+#---Repeat of the first softbox template, built with math nodes
+    repeat = mat.node_tree.nodes.get("Repeat_Texture")
+    if repeat is not None and old_nodes.get("Repeat_Texture") is None:
+        for index, name in ((1, "Math"), (2, "Math.002")):
+            if name in old_nodes:
+                repeat.inputs[index].default_value = old_nodes[name].inputs[1].default_value
+
+@persistent
+def template_upgrade(dummy):
+    """Rebuild the materials of the lights made from a previous template after loading a file"""
+
+    context = bpy.context
+
+    for cobj in context.scene.objects:
+        if cobj.type == 'EMPTY' or not cobj.data.name.startswith("Lumiere"):
+            continue
+        try:
+            mat = bpy.data.materials.get("Mat_SOFTBOX_" + cobj.data.name)
+            if cobj.Lumiere.typlight == "Panel" and mat is not None and mat.get("lumiere_version") != Lumiere_templates_version:
+                update_mat(cobj.Lumiere, context)
+            mat = bpy.data.materials.get("Mat_PROJECTOR_" + cobj.data.name)
+            if cobj.Lumiere.projector and mat is not None and mat.get("lumiere_version") != Lumiere_templates_version:
+                update_projector_mat(cobj.Lumiere, context)
+        except Exception as error:
+            print("Error to report : ", error)
+#########################################################################################################
+
+#########################################################################################################
+def image_adjust_group(group):
+    """Shared nodes of the image adjustments : Bright/Contrast, Gamma and Hue Saturation Value"""
+
+    group.inputs.new("NodeSocketColor", "Color")
+    group.inputs.new("NodeSocketFloat", "Bright")
+    group.inputs.new("NodeSocketFloat", "Contrast")
+    group.inputs.new("NodeSocketFloat", "Gamma")
+    group.inputs.new("NodeSocketFloatFactor", "Hue")
+    group.inputs.new("NodeSocketFloat", "Saturation")
+    group.inputs.new("NodeSocketFloat", "Value")
+    group.outputs.new("NodeSocketColor", "Color")
+
+    input_node = group.nodes.new("NodeGroupInput")
+    input_node.location = (-500, 0)
+    output_node = group.nodes.new("NodeGroupOutput")
+    output_node.location = (500, 0)
+
+#---Bright / Contrast
+    bright = group.nodes.new(type = 'ShaderNodeBrightContrast')
+    group.links.new(input_node.outputs["Color"], bright.inputs["Color"])
+    group.links.new(input_node.outputs["Bright"], bright.inputs["Bright"])
+    group.links.new(input_node.outputs["Contrast"], bright.inputs["Contrast"])
+    bright.location = (-300.0, 0.0)
+
+#---Gamma
+    gamma = group.nodes.new(type = 'ShaderNodeGamma')
+    group.links.new(bright.outputs[0], gamma.inputs["Color"])
+    group.links.new(input_node.outputs["Gamma"], gamma.inputs["Gamma"])
+    gamma.location = (-100.0, 0.0)
+
+#---Hue / Saturation / Value
+    hue = group.nodes.new(type = 'ShaderNodeHueSaturation')
+    group.links.new(gamma.outputs[0], hue.inputs["Color"])
+    group.links.new(input_node.outputs["Hue"], hue.inputs["Hue"])
+    group.links.new(input_node.outputs["Saturation"], hue.inputs["Saturation"])
+    group.links.new(input_node.outputs["Value"], hue.inputs["Value"])
+    hue.location = (100.0, 0.0)
+    group.links.new(hue.outputs[0], output_node.inputs["Color"])
+
+def image_adjust_defaults(group_node):
+    """Neutral values of the image adjustments"""
+
+    for name, value in (("Bright", 0), ("Contrast", 0), ("Gamma", 1), ("Hue", .5), ("Saturation", 1), ("Value", 1)):
+        group_node.inputs[name].default_value = value
+#########################################################################################################
+
+#########################################################################################################
+def softbox_shading_group(group):
+    """Shared shaders of the panel light : emission or diffuse reflector, transparent mask and backface"""
+
+    group.inputs.new("NodeSocketColor", "Color")
+    group.inputs.new("NodeSocketFloat", "Strength")
+    group.inputs.new("NodeSocketFloatFactor", "Mask")
+    group.inputs.new("NodeSocketColor", "Mask Color")
+    group.inputs.new("NodeSocketColor", "Diffuse Color")
+    group.inputs.new("NodeSocketFloatFactor", "Reflector")
+    group.inputs.new("NodeSocketColor", "Transparent Color")
+    group.outputs.new("NodeSocketShader", "Shader")
+    group.outputs.new("NodeSocketShader", "Emission")
+
+    input_node = group.nodes.new("NodeGroupInput")
+    input_node.location = (-600, 0)
+    output_node = group.nodes.new("NodeGroupOutput")
+    output_node.location = (600, 0)
+
+#---Emission Node
+    emit = group.nodes.new(type = 'ShaderNodeEmission')
+    group.links.new(input_node.outputs["Color"], emit.inputs["Color"])
+    group.links.new(input_node.outputs["Strength"], emit.inputs["Strength"])
+    emit.location = (-200, -100)
+
+#---Diffuse Node
+    diffuse = group.nodes.new(type = 'ShaderNodeBsdfDiffuse')
+    group.links.new(input_node.outputs["Diffuse Color"], diffuse.inputs["Color"])
+    diffuse.location = (-200, -200)
+
+#---Mix Emission / Diffuse for the reflector
+    surface = group.nodes.new(type="ShaderNodeMixShader")
+    group.links.new(input_node.outputs["Reflector"], surface.inputs[0])
+    group.links.new(emit.outputs[0], surface.inputs[1])
+    group.links.new(diffuse.outputs[0], surface.inputs[2])
+    surface.location = (0, -150)
+
+#---Invert Node
+    invert = group.nodes.new(type="ShaderNodeInvert")
+    group.links.new(input_node.outputs["Mask"], invert.inputs["Fac"])
+    group.links.new(input_node.outputs["Mask Color"], invert.inputs["Color"])
+    invert.location = (-200, 75)
+
+#---Transparent Node
+    trans = group.nodes.new(type="ShaderNodeBsdfTransparent")
+    group.links.new(input_node.outputs["Transparent Color"], trans.inputs["Color"])
+    trans.location = (-200, -25)
+
+#---Mix Shader Node 1
+    mix1 = group.nodes.new(type="ShaderNodeMixShader")
+    group.links.new(invert.outputs[0], mix1.inputs[0])
+    group.links.new(trans.outputs[0], mix1.inputs[1])
+    group.links.new(surface.outputs[0], mix1.inputs[2])
+    mix1.location = (200, 0)
+
+#---Geometry Node : Backface
+    backface = group.nodes.new(type = 'ShaderNodeNewGeometry')
+    backface.location = (200, 250)
+
+#---Mix Shader Node 2
+    mix2 = group.nodes.new(type="ShaderNodeMixShader")
+    group.links.new(backface.outputs[6], mix2.inputs[0])
+    group.links.new(trans.outputs[0], mix2.inputs[1])
+    group.links.new(mix1.outputs[0], mix2.inputs[2])
+    mix2.location = (400, 0)
+
+    group.links.new(mix2.outputs[0], output_node.inputs["Shader"])
+    group.links.new(emit.outputs[0], output_node.inputs["Emission"])
+#########################################################################################################
+
+#########################################################################################################
+def projector_adjust_group(group):
+    """Shared nodes of the projector texture : Saturation, Gamma, Bright/Contrast and Invert"""
+
+    group.inputs.new("NodeSocketColor", "Color")
+    group.inputs.new("NodeSocketFloatFactor", "Saturation")
+    group.inputs.new("NodeSocketFloat", "Gamma")
+    group.inputs.new("NodeSocketFloat", "Bright")
+    group.inputs.new("NodeSocketFloat", "Contrast")
+    group.inputs.new("NodeSocketFloatFactor", "Invert")
+    group.outputs.new("NodeSocketColor", "Color")
+
+    input_node = group.nodes.new("NodeGroupInput")
+    input_node.location = (-500, 0)
+    output_node = group.nodes.new("NodeGroupOutput")
+    output_node.location = (500, 0)
+
+#---Saturation
+    saturation = group.nodes.new(type = 'ShaderNodeMixRGB')
+    saturation.blend_type = 'SATURATION'
+    saturation.inputs['Color2'].default_value = [1,1,1,1]
+    group.links.new(input_node.outputs["Saturation"], saturation.inputs['Fac'])
+    group.links.new(input_node.outputs["Color"], saturation.inputs['Color1'])
+    saturation.location = (-300.0, 40.0)
+
+#---Gamma
+    gamma = group.nodes.new(type = 'ShaderNodeGamma')
+    group.links.new(saturation.outputs[0], gamma.inputs["Color"])
+    group.links.new(input_node.outputs["Gamma"], gamma.inputs["Gamma"])
+    gamma.location = (-120.0, 0.0)
+
+#---Bright / Contrast
+    bright = group.nodes.new(type = 'ShaderNodeBrightContrast')
+    group.links.new(gamma.outputs[0], bright.inputs["Color"])
+    group.links.new(input_node.outputs["Bright"], bright.inputs["Bright"])
+    group.links.new(input_node.outputs["Contrast"], bright.inputs["Contrast"])
+    bright.location = (60.0, 20.0)
+
+#---Invert Node
+    invert = group.nodes.new(type="ShaderNodeInvert")
+    group.links.new(input_node.outputs["Invert"], invert.inputs["Fac"])
+    group.links.new(bright.outputs[0], invert.inputs["Color"])
+    invert.location = (240.0, 0.0)
+    group.links.new(invert.outputs[0], output_node.inputs["Color"])
+#########################################################################################################
+
+#########################################################################################################
+def projector_shading_group(group):
+    """Shared shaders of the projector : backface, light path and thickness of the edges"""
+
+    group.inputs.new("NodeSocketShader", "Shader")
+    group.outputs.new("NodeSocketShader", "Shader")
+
+    input_node = group.nodes.new("NodeGroupInput")
+    input_node.location = (300, 0)
+    output_node = group.nodes.new("NodeGroupOutput")
+    output_node.location = (1400, 0)
+
+#---Geometry Node 2
+    geometry2 = group.nodes.new(type="ShaderNodeNewGeometry")
+    geometry2.location = (520.0, 200.0)
+
+#---Transparent Node
+    trans = group.nodes.new(type="ShaderNodeBsdfTransparent")
+    trans.location = (520.0, -20.0)
+
+#---Mix Shader Node
+    mix = group.nodes.new(type="ShaderNodeMixShader")
+    mix.location = (700.0, 20.0)
+    #Link BackFacing
+    group.links.new(geometry2.outputs[6], mix.inputs[0])
+    #Link Transparent 
+    group.links.new(trans.outputs[0], mix.inputs[1])
+    #Link the shader of the projector
+    group.links.new(input_node.outputs["Shader"], mix.inputs[2])
+
+#---Light Path
+    light_path = group.nodes.new(type="ShaderNodeLightPath")
+    light_path.location = (700.0, 300.0)
+
+#---ADD Math
+    add = group.nodes.new(type = 'ShaderNodeMath')
+    group.links.new(light_path.outputs[0], add.inputs[0])
+    group.links.new(light_path.outputs[3], add.inputs[1])
+    add.operation = 'ADD'
+    add.location = (880.0, 300.0) 
+
+#---Geometry
+    geometry = group.nodes.new(type = 'ShaderNodeNewGeometry')
+    geometry.location = (340.0, -200.0)
+    
+#---Grandient Node 
+    grad3 = group.nodes.new(type="ShaderNodeTexGradient")
+    group.links.new(geometry.outputs[5], grad3.inputs[0])
+    grad3.gradient_type = 'QUADRATIC'
+    grad3.location = (520.0, -200.0)
+    
+#---Color ramp
+    edge_colramp = group.nodes.new(type="ShaderNodeValToRGB")
+    edge_colramp.color_ramp.elements[1].position = 0.025
+    group.links.new(grad3.outputs[0], edge_colramp.inputs[0])
+    edge_colramp.location = (700.0, -120.0)
+    
+#---Translucent Node
+    translucent = group.nodes.new(type="ShaderNodeBsdfTranslucent")
+    group.links.new(edge_colramp.outputs[0], translucent.inputs[0])
+    translucent.location = (1000.0, -120.0)
+    
+#---Edge Mix Shader Node
+    edge_mix = group.nodes.new(type="ShaderNodeMixShader")
+    edge_mix.location = (1200.0, 20.0)
+    #Light path
+    group.links.new(add.outputs[0], edge_mix.inputs[0])
+    #Link Transparent 
+    group.links.new(mix.outputs[0], edge_mix.inputs[1])
+    #Link Translucent
+    group.links.new(translucent.outputs[0], edge_mix.inputs[2])
+
+    group.links.new(edge_mix.outputs[0], output_node.inputs["Shader"])
+#########################################################################################################
+
+#########################################################################################################
+def projector_mat(cobj=None):
     """Cycles material nodes for the front projector"""
     
     bpy.context.scene.render.engine = 'CYCLES'
 
+#---Shared black material for the base
+    get_template_mat("BASE_PROJECTOR_mat", base_projector_mat_nodes)
+
+#---Create a new material for cycles Engine from the template
+    if cobj is None:
+        cobj = bpy.context.scene.objects.active
+    mat_name, mat = get_mat_name(cobj.data.name)
+    return(instance_template_mat(get_template_mat(".Lumiere_template_projector", projector_mat_nodes), mat_name))
+
+def base_projector_mat_nodes(mat):
+    """Nodes of the black material of the base projector"""
+
 #------------------------------
 #BLACK MATERIAL 1 : BASE PROJECTOR
 #------------------------------
 
-#---Create black material if not exist.
-    mat = bpy.data.materials.get("BASE_PROJECTOR_mat")
-    
-    if mat is not None: 
-        mat.node_tree.nodes.clear()
-    else: 
-        mat = bpy.data.materials.new("BASE_PROJECTOR_mat")
-        mat.use_nodes= True
-        mat.node_tree.nodes.clear()
-
 #---Geometry
     geometry = mat.node_tree.nodes.new(type = 'ShaderNodeNewGeometry')
     geometry.location = (-60.0, 520.0)
@@ -808,22 +1368,13 @@ def projector_mat():
     output.location = (280.0, 300.0)
     mat.node_tree.links.new(diffuse1.outputs[0], output.inputs['Surface'])
 
+def projector_mat_nodes(mat):
+    """Nodes of the transparent material of the projector"""
+
 #----------------------------------
 #TRANSPARENT MATERIAL 2 : PROJECTOR
 #----------------------------------
 
-#---Create a new material for cycles Engine.
-    cobj = bpy.context.scene.objects.active
-    mat_name, mat = get_mat_name(cobj.data.name)
-
-    if mat is not None: 
-        mat.node_tree.nodes.clear()
-    else: 
-        mat = bpy.data.materials.new(mat_name)
-        
-    mat.use_nodes= True
-    # Clear default nodes
-    mat.node_tree.nodes.clear() 
     mat.alpha = 0.5
 
 #----------------
@@ -853,30 +1404,12 @@ def projector_mat():
     texture.projection = 'BOX'
     texture.location = (-380.0, 80.0)
 
-#---Saturation
-    saturation = mat.node_tree.nodes.new(type = 'ShaderNodeMixRGB')
-    saturation.inputs['Fac'].default_value = 0
-    saturation.inputs['Color1'].default_value = [1,1,1,1]
-    saturation.inputs['Color2'].default_value = [1,1,1,1]
-    mat.node_tree.links.new(texture.outputs[0], saturation.inputs[1])
-    saturation.blend_type = 'SATURATION'
-    saturation.location = (-200.0, 40.0)
-
-#---Gamma
-    gamma = mat.node_tree.nodes.new(type = 'ShaderNodeGamma')
-    mat.node_tree.links.new(saturation.outputs[0], gamma.inputs[0])
-    gamma.location = (-20.0, 0.0)
-
-#---Bright / Contrast
-    bright = mat.node_tree.nodes.new(type = 'ShaderNodeBrightContrast')
-    mat.node_tree.links.new(gamma.outputs[0], bright.inputs[0])
-    bright.location = (160.0, 20.0)
-
-#---Invert Node
-    invert = mat.node_tree.nodes.new(type="ShaderNodeInvert")
-    invert.inputs['Fac'].default_value = 0
-    mat.node_tree.links.new(bright.outputs[0], invert.inputs[1])
-    invert.location = (340.0, 0.0)
+#---Saturation, Gamma, Bright / Contrast and Invert shared group
+    adjust = add_template_group(mat, ".Lumiere_projector_adjust", projector_adjust_group, "Projector_Adjust")
+    for name, value in (("Saturation", 0), ("Gamma", 1), ("Bright", 0), ("Contrast", 0), ("Invert", 0)):
+        adjust.inputs[name].default_value = value
+    mat.node_tree.links.new(texture.outputs[0], adjust.inputs["Color"])
+    adjust.location = (-100.0, 40.0)
 
 #-----------------
 #GRADIENT MATERIAL
@@ -915,104 +1448,45 @@ def projector_mat():
 #OUTPUT
 #-------
 
-#---Geometry Node 2
-    geometry2 = mat.node_tree.nodes.new(type="ShaderNodeNewGeometry")
-    geometry2.location = (520.0, 200.0)
-    
-#---Transparent Node
-    trans = mat.node_tree.nodes.new(type="ShaderNodeBsdfTransparent")
-    trans.location = (520.0, -20.0)
-
-#---Transparent Node 2
+#---Transparent Node : color, gradient or texture of the projector
     trans2 = mat.node_tree.nodes.new(type="ShaderNodeBsdfTransparent")
-    #mat.node_tree.links.new(invert.outputs[0], trans2.inputs[0])
+    trans2.name = "Projector_Color"
     trans2.location = (520.0, -100.0)
-    
-#---Mix Shader Node
-    mix = mat.node_tree.nodes.new(type="ShaderNodeMixShader")
-    mix.location = (700.0, 20.0)
-    #Link BackFacing
-    mat.node_tree.links.new(geometry2.outputs[6], mix.inputs[0])
-    #Link Transparent 
-    mat.node_tree.links.new(trans.outputs[0], mix.inputs[1])
-    #Link Transparent 2 
-    mat.node_tree.links.new(trans2.outputs[0], mix.inputs[2])
-
-#---Light Path
-    light_path = mat.node_tree.nodes.new(type="ShaderNodeLightPath")
-    light_path.location = (700.0, 300.0)
-
-#---ADD Math
-    add = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
-    mat.node_tree.links.new(light_path.outputs[0], add.inputs[0])
-    mat.node_tree.links.new(light_path.outputs[3], add.inputs[1])
-    add.operation = 'ADD'
-    add.location = (880.0, 300.0) 
-
 
-#--------------
-#EDGE THICKNESS
-#--------------
-
-#---Geometry
-    geometry = mat.node_tree.nodes.new(type = 'ShaderNodeNewGeometry')
-    geometry.location = (340.0, -200.0)
-    
-#---Grandient Node 
-    grad3 = mat.node_tree.nodes.new(type="ShaderNodeTexGradient")
-    mat.node_tree.links.new(geometry.outputs[5], grad3.inputs[0])
-    grad3.gradient_type = 'QUADRATIC'
-    grad3.location = (520.0, -200.0)
-    
-#---Color ramp
-    edge_colramp = mat.node_tree.nodes.new(type="ShaderNodeValToRGB")
-    edge_colramp.color_ramp.elements[1].position = 0.025
-    mat.node_tree.links.new(grad3.outputs[0], edge_colramp.inputs[0])
-    edge_colramp.location = (700.0, -120.0)
-    
-#---Translucent Node
-    trans = mat.node_tree.nodes.new(type="ShaderNodeBsdfTranslucent")
-    mat.node_tree.links.new(edge_colramp.outputs[0], trans.inputs[0])
-    trans.location = (1000.0, -120.0)
-    
-#---Edge Mix Shader Node
-    edge_mix = mat.node_tree.nodes.new(type="ShaderNodeMixShader")
-    edge_mix.location = (1200.0, 20.0)
-    #Light path
-    edge_mix.inputs[0].default_value = 1
-    mat.node_tree.links.new(add.outputs[0], edge_mix.inputs[0])
-    #Link Transparent 
-    mat.node_tree.links.new(mix.outputs[0], edge_mix.inputs[1])
-    #Link Translucent
-    mat.node_tree.links.new(trans.outputs[0], edge_mix.inputs[2])
+#---Backface, light path and edges shared group
+    shading = add_template_group(mat, ".Lumiere_projector_shading", projector_shading_group, "Projector_Shading")
+    mat.node_tree.links.new(trans2.outputs[0], shading.inputs["Shader"])
+    shading.location = (900.0, 20.0)
 
-#-------
-#OUTPUT
-#-------
-        
 #---Output Shader Node
     output = mat.node_tree.nodes.new(type = 'ShaderNodeOutputMaterial')
-    output.location = (1420.0, 20.0)
-    mat.node_tree.links.new(edge_mix.outputs[0], output.inputs['Surface'])
+    output.location = (1120.0, 20.0)
+    mat.node_tree.links.new(shading.outputs[0], output.inputs['Surface'])
     
 #########################################################################################################
 
 #########################################################################################################
-def softbox_mat(cobj):
+def softbox_mat(cobj, light=None):
     """Cycles material nodes for the panel light"""
     
-#---Create a new material for cycles Engine.
+#---Create a new material for cycles Engine from the template
     bpy.context.scene.render.engine = 'CYCLES'
-    # cobj = bpy.context.scene.objects.active
+    if light is None:
+        light = bpy.context.active_object
     mat_name, mat = get_mat_name(cobj.data.name)
     cobj["typgradient"] = 1
-    
-    if mat is not None: 
-        mat.node_tree.nodes.clear()
-    else: 
-        mat = bpy.data.materials.new(mat_name)
-    mat.use_nodes= True
-    mat.node_tree.nodes.clear() # Clear default nodes
+    mat = instance_template_mat(get_template_mat(".Lumiere_template_softbox", softbox_mat_nodes), mat_name)
+
+#---Color of the light
+    shading = mat.node_tree.nodes["Softbox_Shading"]
+    shading.inputs["Color"].default_value = light.Lumiere.lightcolor
+    shading.inputs["Diffuse Color"].default_value = light.Lumiere.lightcolor
+
+    return(mat)
+
+def softbox_mat_nodes(mat):
+    """Nodes of the material of the panel light"""
+
     mat.alpha = 0.5
 
 #---Texture Coordinate
@@ -1034,48 +1508,16 @@ def softbox_mat(cobj):
     mat.node_tree.links.new(textmap.outputs[0], grad.inputs[0])
     grad.location = (-2300.0000, -200.0000)
     
-#---Separate RGB
-    sepRGB = mat.node_tree.nodes.new(type = 'ShaderNodeSeparateRGB')
-    mat.node_tree.links.new(grad.outputs[0], sepRGB.inputs[0])
-    sepRGB.location = (-2080.0, -200.0) 
-    
-#---Multiply 01 = R
-    multiplyR = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
-    mat.node_tree.links.new(sepRGB.outputs[0], multiplyR.inputs[0])
-    multiplyR.operation = 'MULTIPLY'
-    multiplyR.inputs[1].default_value = 1
-    multiplyR.location = (-1880.0, -120.0)
-
-#---Modulo 01 = R
-    moduloR = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
-    mat.node_tree.links.new(multiplyR.outputs[0], moduloR.inputs[0])
-    moduloR.operation = 'MODULO'
-    moduloR.inputs[1].default_value = 1
-    moduloR.location = (-1700.0, -120.0) 
-    
-#---Multiply 02 = G
-    multiplyG = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
-    mat.node_tree.links.new(sepRGB.outputs[1], multiplyG.inputs[0])
-    multiplyG.operation = 'MULTIPLY'
-    multiplyG.inputs[1].default_value = 1
-    multiplyG.location = (-1880.0, -300.0) 
-    
-#---Modulo 02 = G
-    moduloG = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
-    mat.node_tree.links.new(multiplyG.outputs[0], moduloG.inputs[0])
-    moduloG.operation = 'MODULO'
-    moduloG.inputs[1].default_value = 1
-    moduloG.location = (-1700.0000, -300.0000) 
-    
-#---Combine RGB
-    combRGB = mat.node_tree.nodes.new(type = 'ShaderNodeCombineRGB')
-    mat.node_tree.links.new(moduloR.outputs[0], combRGB.inputs[0])
-    mat.node_tree.links.new(moduloG.outputs[0], combRGB.inputs[1])
-    combRGB.location = (-1520.0000, -200.0000) 
+#---Repeat group shared with the projector : R and G multiplied and wrapped
+    repeat = repeat_group_mat(mat, "Repeat_Texture")
+    repeat.inputs[1].default_value = 1
+    repeat.inputs[2].default_value = 1
+    mat.node_tree.links.new(grad.outputs[0], repeat.inputs[0])
+    repeat.location = (-1880.0, -200.0)
 
 #---Grandient Node Linear
     linear_grad = mat.node_tree.nodes.new(type="ShaderNodeTexGradient")
-    mat.node_tree.links.new(combRGB.outputs[0], linear_grad.inputs[0])
+    mat.node_tree.links.new(repeat.outputs[0], linear_grad.inputs[0])
     linear_grad.location = (-1340.0000, -200.0000)   
 
 #---Object info
@@ -1112,20 +1554,11 @@ def softbox_mat(cobj):
     texture.projection = 'BOX'
     texture.location = (-1340.0, 160.0)
 
-#---Bright / Contrast
-    bright = mat.node_tree.nodes.new(type = 'ShaderNodeBrightContrast')
-    mat.node_tree.links.new(texture.outputs[0], bright.inputs[0])
-    bright.location = (-1120.0, 80.0)
-
-#---Gamma
-    gamma = mat.node_tree.nodes.new(type = 'ShaderNodeGamma')
-    mat.node_tree.links.new(bright.outputs[0], gamma.inputs[0])
-    gamma.location = (-940.0, 60.0)
-
-#---Hue / Saturation / Value
-    hue = mat.node_tree.nodes.new(type = 'ShaderNodeHueSaturation')
-    mat.node_tree.links.new(gamma.outputs[0], hue.inputs[4])
-    hue.location = (-760.0, 80.0)
+#---Bright / Contrast, Gamma and Hue / Saturation / Value shared group
+    adjust = add_template_group(mat, ".Lumiere_image_adjust", image_adjust_group, "Image_Adjust")
+    image_adjust_defaults(adjust)
+    mat.node_tree.links.new(texture.outputs[0], adjust.inputs["Color"])
+    adjust.location = (-1000.0, 80.0)
     
 #---Random Energy
     random_energy = mat.node_tree.nodes.new(type = 'ShaderNodeMath')
@@ -1145,57 +1578,19 @@ def softbox_mat(cobj):
     falloff.inputs[0].default_value = 10
     falloff.location = (-400.0, -180.0)
 
-#---Invert Node
-    invert = mat.node_tree.nodes.new(type="ShaderNodeInvert")
-    invert.location = (-200,75) 
-
-#---Transparent Node
-    trans = mat.node_tree.nodes.new(type="ShaderNodeBsdfTransparent")
-    trans.inputs[0].default_value = (1,1,1,1)
-    trans.location = (-200,-25) 
+#---Emission, reflector, mask and backface shared group
+    shading = add_template_group(mat, ".Lumiere_softbox_shading", softbox_shading_group, "Softbox_Shading")
+    for name, value in (("Color", (1,1,1,1)), ("Strength", 1), ("Mask", 1), ("Mask Color", (0,0,0,1)),
+                        ("Diffuse Color", (.8,.8,.8,1)), ("Reflector", 0), ("Transparent Color", (1,1,1,1))):
+        shading.inputs[name].default_value = value
+    mat.node_tree.links.new(falloff.outputs[0], shading.inputs["Strength"])
+    shading.location = (-100, -50)
 
-#---Emission Node
-    emit = mat.node_tree.nodes.new(type = 'ShaderNodeEmission')
-    emit.inputs[0].default_value = bpy.context.active_object.Lumiere.lightcolor
-    mat.node_tree.links.new(falloff.outputs[0],  emit.inputs[1])
-    emit.location = (-200,-100)
-
-#---Diffuse Node
-    diffuse = mat.node_tree.nodes.new(type = 'ShaderNodeBsdfDiffuse')
-    diffuse.inputs[0].default_value = bpy.context.active_object.Lumiere.lightcolor
-    diffuse.location = (-200,-200)
-
-#---Geometry Node : Backface
-    backface = mat.node_tree.nodes.new(type = 'ShaderNodeNewGeometry')
-    backface.location = (000,250)
-
-#---Mix Shader Node 1
-    mix1 = mat.node_tree.nodes.new(type="ShaderNodeMixShader")
-    #Link Invert 
-    mat.node_tree.links.new(invert.outputs[0], mix1.inputs[0])
-    #Link Transparent 
-    mat.node_tree.links.new(trans.outputs[0], mix1.inputs[1])
-    #Link Emission 
-    mat.node_tree.links.new(emit.outputs[0], mix1.inputs[2])
-     
-#---Mix Shader Node 2
-    mix2 = mat.node_tree.nodes.new(type="ShaderNodeMixShader")
-    #Link Backface
-    mat.node_tree.links.new(backface.outputs[6], mix2.inputs[0])
-    #Link Transparent 
-    mat.node_tree.links.new(trans.outputs[0], mix2.inputs[1])
-    #Link Mix 1
-    mat.node_tree.links.new(mix1.outputs[0], mix2.inputs[2])
-    mix2.location = (200,0)   
-
-#---Output Shader Node
-    output = mat.node_tree.nodes.new(type = 'ShaderNodeOutputMaterial')
-    output.location = (400,0)
-    output.select
-    mat.node_tree.nodes["Emission"].inputs[1].default_value = 1
-    #Link them together
-    mat.node_tree.links.new(mix2.outputs[0], output.inputs['Surface']) 
-#########################################################################################################
+#---Output Shader Node
+    output = mat.node_tree.nodes.new(type = 'ShaderNodeOutputMaterial')
+    output.location = (200,0)
+    mat.node_tree.links.new(shading.outputs["Shader"], output.inputs['Surface']) 
+#########################################################################################################
 
 #########################################################################################################
 def create_light_env(self, context, dupli_name = "Lumiere"):
@@ -1346,8 +1741,8 @@ def create_light_env(self, context, dupli_name = "Lumiere"):
 #########################################################################################################
 
 #########################################################################################################
-def create_softbox(self, context, newlight = False, dupli_name = "Lumiere"):
-    """Create the panel light with modifiers"""
+def create_softbox(self, context, newlight = False, dupli_name = "Lumiere", batch = False):
+    """Create the panel light with modifiers, the batch leaves the material and the active object to the caller"""
     edges = []
     faces = []
     listvert = []
@@ -1362,19 +1757,13 @@ def create_softbox(self, context, newlight = False, dupli_name = "Lumiere"):
     if newlight:
         dupli = get_object(context, self.lightname)
     else:
-        dupli = create_dupli(self, context, dupli_name)
+        dupli = create_dupli(self, context, dupli_name, active = not batch)
 
 #---Create faces 
     for f in range(len(verts) - 1, -1, -1):
         listvert.extend([f])
     faces.extend([listvert])
 
-#---Create object
-    i = 0
-    for ob in context.scene.objects:
-        if ob.type != 'EMPTY' and ob.data.name.startswith("Lumiere"):
-            i += 1
-    
 #---Create the mesh
     softbox_name = "SOFTBOX_" + dupli.data.name
     
@@ -1388,16 +1777,15 @@ def create_softbox(self, context, newlight = False, dupli_name = "Lumiere"):
     context.scene.objects.link(cobj)
     mesh.from_pydata(verts, edges, faces)
     mesh.update()
-    context.scene.objects.active = bpy.data.objects[softbox_name]
 
 #---Add the material
-    cobj = context.object
-    softbox_mat(cobj)
-    mat_name, mat = get_mat_name(cobj.data.name)
-    cobj.active_material = mat
+    if not batch:
+        context.scene.objects.active = cobj
+        cobj.active_material = softbox_mat(cobj)
        
 #---Change the visibility 
     cobj.Lumiere.lightname = cobj.data.name
+    light_registry_add(context, cobj)
     cobj.draw_type = 'TEXTURED'
     cobj.show_transparent = True
     cobj.show_wire = True
@@ -1429,18 +1817,38 @@ def create_softbox(self, context, newlight = False, dupli_name = "Lumiere"):
     cobj.constraints["Copy Rotation"].target = bpy.data.objects[dupli.name]
     
     cobj.Lumiere.typlight = "Panel"
-    cobj.Lumiere.energy = 10
+    if batch:
+        cobj.Lumiere["energy"] = 10.0
+    else:
+        cobj.Lumiere.energy = 10
 
 #---Parent the blender lamp to the light mesh
     cobj.parent = dupli
     cobj.matrix_parent_inverse = dupli.matrix_world.inverted()
 
 #---Make the dupliverts object active
-    bpy.context.scene.objects.active = bpy.data.objects[dupli.name]
+    if not batch:
+        context.scene.objects.active = dupli
     
     return(dupli)   
 #########################################################################################################
 
+#########################################################################################################
+def new_plane_object(context, name):
+    """Create a new active plane object of 2x2, without the primitive_plane_add operator"""
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.from_pydata([(-1, -1, 0), (1, -1, 0), (1, 1, 0), (-1, 1, 0)], [], [(0, 1, 2, 3)])
+    mesh.update()
+    plane = bpy.data.objects.new(name, mesh)
+    context.scene.objects.link(plane)
+    plane.layers = [i == context.scene.active_layer for i in range(20)]
+    plane.select = True
+    context.scene.objects.active = plane
+
+    return(plane)
+#########################################################################################################
+
 #########################################################################################################
 def create_projector(self, context, light_name):
     """Create the projector with modifiers"""
@@ -1454,12 +1862,10 @@ def create_projector(self, context, light_name):
         mesh = bpy.data.meshes[projector_name]
         bpy.data.meshes.remove(mesh)
 
-    bpy.ops.mesh.primitive_plane_add(location=(0, 0, 0))
-    projector = bpy.context.object
+    projector = new_plane_object(context, projector_name)
     projector.draw_type = 'WIRE'
-    projector.data.name = projector_name
-    projector.name = projector_name
     projector.Lumiere.lightname = projector_name
+    light_registry_add(context, projector)
     
 #---Add the material
     projector_mat()
@@ -1538,17 +1944,15 @@ def create_base_projector(self, context, light_name):
         mesh = bpy.data.meshes[base_projector_name]
         bpy.data.meshes.remove(mesh)
 
-    bpy.ops.mesh.primitive_plane_add(location=(0, 0, 0))
-    base_projector = bpy.context.object
+    base_projector = new_plane_object(context, base_projector_name)
     base_projector.dimensions[0] = projector.dimensions[0]
     base_projector.dimensions[1] = projector.dimensions[1]
     base_projector.draw_type = 'WIRE'
-    base_projector.data.name = base_projector.name = base_projector_name
     base_projector.Lumiere.lightname = base_projector_name
+    light_registry_add(context, base_projector)
     
 #---Add the material
-    projector_mat()
-    mat = bpy.data.materials.get("BASE_PROJECTOR_mat")
+    mat = get_template_mat("BASE_PROJECTOR_mat", base_projector_mat_nodes)
     base_projector.data.materials.append(mat)
 
 #---Parent the projector to the light for DupliVerts
@@ -1646,6 +2050,7 @@ def create_light_custom(self, context, cobj):
        
 #---Change the visibility 
     cobj.Lumiere.lightname = cobj.data.name
+    light_registry_add(context, cobj)
     cobj.draw_type = 'TEXTURED'
     cobj.show_transparent = True
     cobj.show_wire = True
@@ -1691,7 +2096,23 @@ def create_light_custom(self, context, cobj):
 #########################################################################################################
 
 #########################################################################################################
-def create_light_point(self, context, newlight = False, dupli_name = "Lumiere"):
+def new_lamp_object(context, lamp_type, name, active = True):
+    """Create a new lamp object with its cycles nodes, without the lamp_add operator"""
+
+    lamp_data = bpy.data.lamps.new(name, lamp_type)
+    lamp_data.use_nodes = True
+    lamp = bpy.data.objects.new(name, lamp_data)
+    context.scene.objects.link(lamp)
+    lamp.layers = [i == context.scene.active_layer for i in range(20)]
+    lamp.select = True
+    if active:
+        context.scene.objects.active = lamp
+
+    return(lamp)
+#########################################################################################################
+
+#########################################################################################################
+def create_light_point(self, context, newlight = False, dupli_name = "Lumiere", batch = False):
     """Create a blender light point"""
     
 #---Create the light mesh object for the duplication of the lamp
@@ -1699,29 +2120,30 @@ def create_light_point(self, context, newlight = False, dupli_name = "Lumiere"):
         dupli = get_object(context, self.lightname)
 
     else:
-        dupli = create_dupli(self, context, dupli_name)
+        dupli = create_dupli(self, context, dupli_name, active = not batch)
         
 #---Create the point lamp
-    bpy.ops.object.lamp_add(type='POINT', view_align=False, location=(0,0,0))
-    bpy.context.active_object.data.name = "LAMP_" + dupli.data.name 
-    lamp = bpy.context.object
+    lamp = new_lamp_object(context, 'POINT', "LAMP_" + dupli.data.name, active = not batch)
+    lamp.data.name = "LAMP_" + dupli.data.name 
     lamp.name = "LAMP_" + dupli.data.name 
 
 #---Initialize MIS / Type / Name    
     lamp.data.cycles.use_multiple_importance_sampling = True
-    lamp.Lumiere.typlight = bpy.context.scene.Lumiere.typlight
-    lamp.Lumiere.lightname = bpy.context.active_object.data.name
+    lamp.Lumiere.typlight = context.scene.Lumiere.typlight
+    lamp.Lumiere.lightname = lamp.data.name
+    light_registry_add(context, lamp)
 
 #---Constraints 
-    bpy.ops.object.constraint_add(type='COPY_TRANSFORMS')
+    lamp.constraints.new(type='COPY_TRANSFORMS')
     lamp.constraints["Copy Transforms"].target = bpy.data.objects[dupli.name]
-    context.scene.objects.active = bpy.data.objects[dupli.name]
+    if not batch:
+        context.scene.objects.active = dupli
 
 #---Parent the blender lamp to the dupli mesh
     lamp.parent = dupli
 
 #---Create nodes
-    if not newlight:    
+    if not newlight and not batch:    
         create_lamp_nodes(self, context, lamp)
     
     return(dupli)
@@ -1729,47 +2151,48 @@ def create_light_point(self, context, newlight = False, dupli_name = "Lumiere"):
 #########################################################################################################
 
 #########################################################################################################
-def create_light_sun(self, context, newlight = False, dupli_name = "Lumiere"):
+def create_light_sun(self, context, newlight = False, dupli_name = "Lumiere", batch = False):
     """Create a blender light sun"""
     
 #---Create the light mesh object for the duplication of the lamp
     if newlight:
         dupli = get_object(context, self.lightname)
     else:
-        dupli = create_dupli(self, context, dupli_name)
+        dupli = create_dupli(self, context, dupli_name, active = not batch)
     
 #---Create the sun lamp
-    bpy.ops.object.lamp_add(type='SUN', view_align=False, location=(0,0,0))
+    lamp = new_lamp_object(context, 'SUN', "LAMP_" + dupli.data.name, active = not batch)
     
     if dupli.Lumiere.typlight == "Env":
-        context.active_object.data.name = "WORLD_" + dupli.data.name 
+        lamp.data.name = "WORLD_" + dupli.data.name 
     else:
-        context.active_object.data.name = "LAMP_" + dupli.data.name 
-    lamp = context.object
+        lamp.data.name = "LAMP_" + dupli.data.name 
     lamp.name = "LAMP_" + dupli.data.name 
 
 #---Initialize MIS / Type / Name
     lamp.data.cycles.use_multiple_importance_sampling = True
     lamp.Lumiere.typlight = "Sun"
-    lamp.Lumiere.lightname = context.active_object.data.name
+    lamp.Lumiere.lightname = lamp.data.name
+    light_registry_add(context, lamp)
 
 #---Constraints 
-    bpy.ops.object.constraint_add(type='COPY_TRANSFORMS')
+    lamp.constraints.new(type='COPY_TRANSFORMS')
     lamp.constraints["Copy Transforms"].target = bpy.data.objects[dupli.name]
-    context.scene.objects.active = bpy.data.objects[dupli.name]
+    if not batch:
+        context.scene.objects.active = dupli
 
 #---Parent the blender lamp to the dupli mesh
     lamp.parent = dupli 
 
     #---Create nodes
-    if not newlight:    
+    if not newlight and not batch:    
         create_lamp_nodes(self, context, lamp)
     
     return(dupli)
 #########################################################################################################
 
 #########################################################################################################
-def create_light_spot(self, context, newlight = False, dupli_name = "Lumiere"):
+def create_light_spot(self, context, newlight = False, dupli_name = "Lumiere", batch = False):
     """Create a blender light spot"""
     
 #---Create the light mesh object for the duplication of the lamp
@@ -1777,27 +2200,28 @@ def create_light_spot(self, context, newlight = False, dupli_name = "Lumiere"):
         dupli = get_object(context, self.lightname)
 
     else:
-        dupli = create_dupli(self, context, dupli_name)
+        dupli = create_dupli(self, context, dupli_name, active = not batch)
 
 #---Create the spot lamp
-    bpy.ops.object.lamp_add(type='SPOT', view_align=False, location=(0,0,0))
-    context.active_object.data.name = "LAMP_" + dupli.data.name 
-    lamp = context.object
+    lamp = new_lamp_object(context, 'SPOT', "LAMP_" + dupli.data.name, active = not batch)
+    lamp.data.name = "LAMP_" + dupli.data.name 
     lamp.name = "LAMP_" + dupli.data.name 
     lamp.data.cycles.use_multiple_importance_sampling = True
     lamp.Lumiere.typlight = "Spot"
-    lamp.Lumiere.lightname = context.active_object.data.name
+    lamp.Lumiere.lightname = lamp.data.name
+    light_registry_add(context, lamp)
 
 #---Constraints
-    bpy.ops.object.constraint_add(type='COPY_TRANSFORMS')
+    lamp.constraints.new(type='COPY_TRANSFORMS')
     lamp.constraints["Copy Transforms"].target = bpy.data.objects[dupli.name]
 
 #---Parent the blender lamp to the dupli mesh
-    context.scene.objects.active = bpy.data.objects[dupli.name]
+    if not batch:
+        context.scene.objects.active = dupli
     lamp.parent = dupli
     
 #---Create nodes
-    if not newlight:    
+    if not newlight and not batch:    
         create_lamp_nodes(self, context, lamp)
 
     return(dupli)
@@ -1848,24 +2272,24 @@ def create_light_sky(self, context, dupli_name = "Lumiere"):
 #########################################################################################################
 
 #########################################################################################################
-def create_light_area(self, context, newlight = False, dupli_name = "Lumiere"):
+def create_light_area(self, context, newlight = False, dupli_name = "Lumiere", batch = False):
     """Create a blender light area"""
     
 #---Create the light mesh object for the duplication of the lamp
     if newlight:
         dupli = get_object(context, self.lightname)
     else:
-        dupli = create_dupli(self, context, dupli_name)
+        dupli = create_dupli(self, context, dupli_name, active = not batch)
         
 #---Create the area lamp
-    bpy.ops.object.lamp_add(type='AREA', view_align=False, location=(0,0,0))
-    lamp = bpy.context.object
+    lamp = new_lamp_object(context, 'AREA', "LAMP_" + dupli.data.name, active = not batch)
     lamp.name = "LAMP_" + dupli.data.name
     lamp.data.shape = 'RECTANGLE'
     lamp.data.name = "LAMP_" + dupli.data.name 
     lamp.data.cycles.use_multiple_importance_sampling = True
     lamp.Lumiere.typlight = "Area"
-    lamp.Lumiere.lightname = context.active_object.data.name
+    lamp.Lumiere.lightname = lamp.data.name
+    light_registry_add(context, lamp)
 
 #---Add constraints COPY LOCATION + ROTATION
     lamp.constraints.new(type='COPY_LOCATION')
@@ -1876,11 +2300,12 @@ def create_light_area(self, context, newlight = False, dupli_name = "Lumiere"):
     lamp.constraints["Copy Rotation"].target = bpy.data.objects[dupli.name]
 
 #---Parent the blender lamp to the dupli mesh
-    context.scene.objects.active = bpy.data.objects[dupli.name]
+    if not batch:
+        context.scene.objects.active = dupli
     lamp.parent = dupli
     
 #---Create nodes
-    if not newlight:    
+    if not newlight and not batch:    
         create_lamp_nodes(self, context, lamp)
     
     return(dupli)
@@ -1888,19 +2313,12 @@ def create_light_area(self, context, newlight = False, dupli_name = "Lumiere"):
 #########################################################################################################
 
 #########################################################################################################
-def create_dupli(self, context, dupli_name = "Lumiere"):
+def create_dupli(self, context, dupli_name = "Lumiere", active = True):
     """Single point mesh for duplication of the blender lamp and projector"""
     
     verts = [(0, 0, 0)]
 
-#---Create object
-    i = 0
-    split_name = dupli_name.split(".")
-    if split_name[0] in context.scene.objects:
-        while dupli_name in context.scene.objects:
-            i += 1
-            dupli_name = split_name[0] + "." + str(i).zfill(3)
-
+#---Create object, blender gives the next free name (Lumiere.001...) if it's already used
     me = bpy.data.meshes.new(name= "Lumiere")
     dupli = bpy.data.objects.new(dupli_name, me)
     dupli.select = True
@@ -1908,11 +2326,12 @@ def create_dupli(self, context, dupli_name = "Lumiere"):
     me.from_pydata(verts, [], [])
     me.update()
 
-    context.scene.objects.active = bpy.data.objects[dupli_name]
+    if active:
+        context.scene.objects.active = dupli
 
-    dupli = context.object
     dupli.Lumiere.typlight = context.scene.Lumiere.typlight
     dupli.Lumiere.lightname = dupli.data.name 
+    light_registry_add(context, dupli)
     dupli.constraints.new(type='TRACK_TO')
 
 #---Change the visibility 
@@ -1976,73 +2395,259 @@ def create_lamp_nodes(self, context, lamp):
 def create_lamp_grid(self, context):
     """Create a grid of lights and projector with the repetition of duplicators"""
     
-    verts = []
-    edges = []
-    faces = []
-    listvert = []
-    listfaces = []
-        
     # obj_light = context.active_object
     obj_light = get_object(context, self.lightname)
     if obj_light.Lumiere.nbcol < 1: obj_light.Lumiere.nbcol = 1
     if obj_light.Lumiere.nbrow < 1: obj_light.Lumiere.nbrow = 1
 
+    nbcol = obj_light.Lumiere.nbcol
+    nbrow = obj_light.Lumiere.nbrow
     gapx = obj_light.Lumiere.gapx
     gapy = obj_light.Lumiere.gapy
     widthx = .01 #* obj_light.Lumiere.scale_x
     widthy = .01 #* obj_light.Lumiere.scale_y
-    left = -((widthx * (obj_light.Lumiere.nbcol-1)) + (gapx * (obj_light.Lumiere.nbcol-1)) ) / 2
-    right = left + widthx
-    start = -((widthy * (obj_light.Lumiere.nbrow-1)) + (gapy * (obj_light.Lumiere.nbrow-1))) / 2
-    end = start + widthy
-    i = 0
-
-#---Get the material
-    mat_name, mat = get_mat_name(obj_light.data.name)
-    
-    for x in range(obj_light.Lumiere.nbcol):
-    #---Create Verts, Faces on X axis
-        nbvert = len(verts)
-        verts.extend([(left,start,0)])
-        start2 = end + gapy
-        end2 = start2 + widthy
-
-        for y in range(obj_light.Lumiere.nbrow-1):
-        #---Create Verts, Faces on Z axis
-            nbvert = len(verts)
-            verts.extend([(left,start2,0)])
-            start2 = end2 + gapy
-            end2 = start2 + widthy
-
-        left = right + gapx
-        right = left + widthx
-
-#---Get the mesh
-    old_mesh = obj_light.data
-    mesh = bpy.data.meshes.new(name=obj_light.name)
- 
-#---Update the mesh
-    mesh.from_pydata(verts, [], [])
-    mesh.update(calc_edges=True)
-    
-#---Retrieve the name and delete the old mesh
-    for i in bpy.data.objects:
-        if i.data == old_mesh:
-            i.data = mesh
-    name = old_mesh.name
-    old_mesh.user_clear()
-    bpy.data.meshes.remove(old_mesh)
-    mesh.name = name    
+    left = -((widthx * (nbcol-1)) + (gapx * (nbcol-1)) ) / 2
+    start = -((widthy * (nbrow-1)) + (gapy * (nbrow-1))) / 2
+
+#---Verts of the grid, column by column
+    verts = np.zeros((nbcol, nbrow, 3), dtype=np.float32)
+    verts[:, :, 0] = (left + np.arange(nbcol) * (widthx + gapx))[:, None]
+    verts[:, :, 1] = (start + np.arange(nbrow) * (widthy + gapy))[None, :]
+    verts = verts.reshape(-1)
+    nbvert = nbcol * nbrow
+
+    mesh = obj_light.data
+
+#---Same mesh while the grid only grows or keeps its size, a new one if it has less verts
+    if len(mesh.vertices) <= nbvert and len(mesh.edges) == 0 and len(mesh.polygons) == 0:
+        if len(mesh.vertices) < nbvert:
+            mesh.vertices.add(nbvert - len(mesh.vertices))
+        mesh.vertices.foreach_set("co", verts)
+        mesh.update()
+    else:
+        old_mesh = mesh
+        mesh = bpy.data.meshes.new(name=obj_light.name)
+        mesh.vertices.add(nbvert)
+        mesh.vertices.foreach_set("co", verts)
+        mesh.update(calc_edges=True)
+
+    #---Retrieve the name and delete the old mesh, only the light uses it most of the time
+        if old_mesh.users == 1:
+            obj_light.data = mesh
+        else:
+            old_mesh.user_remap(mesh)
+        name = old_mesh.name
+        old_mesh.user_clear()
+        bpy.data.meshes.remove(old_mesh)
+        mesh.name = name    
     
-    context.object.draw_type = 'WIRE'
-    context.object.show_transparent = True
-    context.object.show_wire = True
+    lamp_grid_display(context, obj_light)
 
-    cobj = context.active_object
-    cobj.Lumiere.lightname = cobj.data.name
-    context.object.cycles_visibility.camera = False
+#---Emitters of the array follow the new grid
+    if obj_light.Lumiere.array_light:
+        update_array(self, context)
+#########################################################################################################
+
+#########################################################################################################
+def lamp_grid_display(context, obj_light):
+    """Display of the grid of lights"""
+
+    obj_light.draw_type = 'WIRE'
+    obj_light.show_transparent = True
+    obj_light.show_wire = True
+
+    obj_light.Lumiere.lightname = obj_light.data.name
+    light_registry_add(context, obj_light)
+    obj_light.cycles_visibility.camera = False
+
+#########################################################################################################
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# ARRAY LIGHTS
+#########################################################################################################
+"""
+#---The emitters of a panel grid get their intensity and color from an image of nbcol x nbrow pixels,
+#---read by the softbox material with the generated coordinates of the duplicator (From Dupli)
+
+#########################################################################################################
+def array_image(cobj, nbcol, nbrow):
+    """Return the float image of the emitters of the light, resized if the grid changed"""
+
+    name = "Lumiere_array_" + cobj.data.name
+    image = bpy.data.images.get(name)
+    if image is None:
+        image = bpy.data.images.new(name, nbcol, nbrow, alpha=True, float_buffer=True)
+    elif tuple(image.size) != (nbcol, nbrow):
+        image.scale(nbcol, nbrow)
+
+    return(image)
+#########################################################################################################
+
+#########################################################################################################
+def array_value_noise(rng, nbcol, nbrow, scale):
+    """Return a smooth noise of nbcol x nbrow values between 0 and 1, scale is the size of a cell in emitters"""
+
+    scale = max(scale, 0.1)
+    x = np.arange(nbcol) / scale
+    y = np.arange(nbrow) / scale
+    cells = rng.rand(int(x[-1]) + 2, int(y[-1]) + 2)
+
+    x0 = x.astype(int)[:, None]
+    y0 = y.astype(int)[None, :]
+    fx = (x - np.floor(x))[:, None]
+    fy = (y - np.floor(y))[None, :]
+    fx = fx * fx * (3 - 2 * fx)
+    fy = fy * fy * (3 - 2 * fy)
+
+    bottom = cells[x0, y0] * (1 - fx) + cells[x0 + 1, y0] * fx
+    top = cells[x0, y0 + 1] * (1 - fx) + cells[x0 + 1, y0 + 1] * fx
+    return(bottom * (1 - fy) + top * fy)
+#########################################################################################################
+
+#########################################################################################################
+def array_update(context, cobj):
+    """Write the intensity, color and offset of all the emitters of the grid at once"""
+
+    mesh = cobj.data
+    nbcol = cobj.Lumiere.nbcol
+    nbrow = cobj.Lumiere.nbrow
+    nbvert = nbcol * nbrow
+    if len(mesh.vertices) != nbvert:
+        return
+
+    rng = np.random.RandomState(cobj.Lumiere.array_seed)
+    pattern = cobj.Lumiere.array_pattern
+    amount = cobj.Lumiere.array_amount
+
+#---Center of each emitter between 0 and 1, column by column like the verts
+    u = ((np.arange(nbcol) + .5) / nbcol)[:, None]
+    v = ((np.arange(nbrow) + .5) / nbrow)[None, :]
+    color = np.ones((nbcol, nbrow, 3), dtype=np.float32)
+
+    if pattern == "Noise":
+        intensity = array_value_noise(rng, nbcol, nbrow, cobj.Lumiere.array_scale)
+    elif pattern == "Falloff":
+        intensity = np.clip(1 - np.sqrt((u - .5) ** 2 + (v - .5) ** 2) / math.sqrt(.5), 0, 1)
+    elif pattern == "Image" and cobj.Lumiere.array_image in bpy.data.images:
+        image = bpy.data.images[cobj.Lumiere.array_image]
+        width, height = image.size
+        pixels = np.array(image.pixels[:], dtype=np.float32).reshape(height, width, image.channels)
+        px = np.minimum((u * width).astype(int), width - 1)
+        py = np.minimum((v * height).astype(int), height - 1)
+        color = pixels[py, px, :3].copy()
+        intensity = np.ones((nbcol, nbrow))
+    else:
+        intensity = np.ones((nbcol, nbrow))
+
+    intensity = 1 - amount + amount * np.broadcast_to(intensity, (nbcol, nbrow))
+    if pattern == "Image":
+        color = 1 - amount + amount * color
+
+#---Random tint of each emitter
+    if cobj.Lumiere.array_color > 0:
+        color *= 1 - cobj.Lumiere.array_color * rng.rand(nbcol, nbrow, 3)
+
+#---One pixel by emitter, rows from the bottom of the image
+    pixels = np.ones((nbrow, nbcol, 4), dtype=np.float32)
+    pixels[:, :, :3] = (color * intensity[:, :, None]).transpose(1, 0, 2)
+    array_image(cobj, nbcol, nbrow).pixels[:] = pixels.ravel()
+
+#---Offset of the emitters along the normal of the grid, the verts stay in place
+    co = np.empty(nbvert * 3, dtype=np.float32)
+    mesh.vertices.foreach_get("co", co)
+    co = co.reshape(nbvert, 3)
+    if cobj.Lumiere.array_offset > 0:
+        co[:, 2] = (rng.rand(nbvert) - .5) * 2 * cobj.Lumiere.array_offset
+    else:
+        co[:, 2] = 0
+    mesh.vertices.foreach_set("co", co.ravel())
+    mesh.update()
+#########################################################################################################
+
+#########################################################################################################
+def array_nodes(cobj, mat):
+    """Multiply the color of the emission of the softbox by the emitter color of the array image,
+    return the input of the color of the light : the emission or the first color of the array"""
+
+    nodes = mat.node_tree.nodes
+    shading = nodes["Softbox_Shading"]
+    array_color = nodes.get("Array_Color")
+
+    if not cobj.Lumiere.array_light:
+    #---Give the color back to the emission
+        if array_color is not None and shading.inputs[0].links and shading.inputs[0].links[0].from_node == array_color:
+            if array_color.inputs[1].links:
+                link_sockets(mat.node_tree, array_color.inputs[1].links[0].from_socket, shading.inputs[0])
+                mat.node_tree.links.remove(array_color.inputs[1].links[0])
+            else:
+                mat.node_tree.links.remove(shading.inputs[0].links[0])
+        return(shading.inputs[0])
+
+    if array_color is None:
+        coord = nodes.new(type = 'ShaderNodeTexCoord')
+        coord.name = "Array_Coord"
+        coord.from_dupli = True
+        coord.location = (-1200.0, 500.0)
+        mapping = nodes.new(type = 'ShaderNodeMapping')
+        mapping.name = "Array_Mapping"
+        mapping.vector_type = 'POINT'
+        mapping.location = (-1000.0, 500.0)
+        texture = nodes.new(type = 'ShaderNodeTexImage')
+        texture.name = "Array_Texture"
+        texture.interpolation = 'Closest'
+        texture.extension = 'EXTEND'
+        texture.location = (-620.0, 500.0)
+        array_color = nodes.new(type = 'ShaderNodeMixRGB')
+        array_color.name = "Array_Color"
+        array_color.blend_type = 'MULTIPLY'
+        array_color.inputs[0].default_value = 1
+        array_color.location = (-400.0, 500.0)
+        link_sockets(mat.node_tree, coord.outputs['Generated'], mapping.inputs[0])
+        link_sockets(mat.node_tree, mapping.outputs[0], texture.inputs[0])
+        link_sockets(mat.node_tree, texture.outputs[0], array_color.inputs[2])
+
+#---Generated coordinates go from the first to the last emitter, move them to the center of the pixels
+    nbcol = cobj.Lumiere.nbcol
+    nbrow = cobj.Lumiere.nbrow
+    mapping = nodes["Array_Mapping"]
+    set_if_changed(mapping, "scale", ((nbcol - 1) / nbcol, (nbrow - 1) / nbrow, 1))
+    set_if_changed(mapping, "translation", (.5 / nbcol, .5 / nbrow, 0))
+    set_if_changed(nodes["Array_Texture"], "image", array_image(cobj, nbcol, nbrow))
+
+#---Insert the array color before the emission one time, the color of the light is then linked to its first input
+    if not (shading.inputs[0].links and shading.inputs[0].links[0].from_node == array_color):
+        set_if_changed(array_color.inputs[1], "default_value", shading.inputs[0].default_value)
+        if shading.inputs[0].links:
+            link_sockets(mat.node_tree, shading.inputs[0].links[0].from_socket, array_color.inputs[1])
+        elif array_color.inputs[1].links:
+            mat.node_tree.links.remove(array_color.inputs[1].links[0])
+        link_sockets(mat.node_tree, array_color.outputs[0], shading.inputs[0])
+
+    return(array_color.inputs[1])
+#########################################################################################################
+
+#########################################################################################################
+def update_array(self, context):
+    """Update the emitters of the array light"""
+
+    cobj = get_object(context, self.lightname)
+    if cobj.Lumiere.array_light:
+        array_update(context, cobj)
+    update_mat(self, context)
+#########################################################################################################
 
 #########################################################################################################
+@persistent
+def array_reload(scene):
+    """The array images are not saved with the file, write them again after loading"""
+
+    for cobj in bpy.data.objects:
+        if cobj.type == 'MESH' and cobj.Lumiere.array_light and cobj.data.name.startswith("Lumiere"):
+            array_update(bpy.context, cobj)
+#########################################################################################################
 
 #########################################################################################################
 def create_light_env_widget(self, context, dupli):
@@ -2066,6 +2671,7 @@ def create_light_env_widget(self, context, dupli):
     object_data_add(context, mesh)
     cobj = context.object
     cobj.Lumiere.lightname = cobj.data.name
+    light_registry_add(context, cobj)
     cobj.draw_type = 'WIRE'
     
 #---Add constraints COPY LOCATION + ROTATION
@@ -2085,6 +2691,114 @@ def create_light_env_widget(self, context, dupli):
 
 #########################################################################################################
 
+#########################################################################################################
+class ModalEvent():
+    """Copy of the last mouse move coalesced by the scheduler, replayed on the next timer event"""
+
+    def __init__(self, event):
+        self.type = 'MOUSEMOVE'
+        self.value = 'NOTHING'
+        self.ctrl = event.ctrl
+        self.shift = event.shift
+        self.alt = event.alt
+        self.mouse_x = event.mouse_x
+        self.mouse_y = event.mouse_y
+        self.mouse_region_x = event.mouse_region_x
+        self.mouse_region_y = event.mouse_region_y
+
+def modal_schedule(self, context, event):
+    """Return the event to compute now, None if the mouse move is coalesced with the next ones"""
+
+    rate = context.scene.Modal_rate
+
+#---Replay the last mouse move skipped
+    if event.type == 'TIMER':
+        if self.pending_move:
+            self.pending_move = False
+            self.last_update = time.time()
+            return(ModalEvent(event))
+        return(None)
+
+#---Skip the mouse moves faster than the refresh rate
+    if event.type in {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE'} and rate > 0:
+        now = time.time()
+        if now - self.last_update < 1.0 / rate:
+            self.pending_move = True
+            return(None)
+        self.last_update = now
+        self.pending_move = False
+
+    return(event)
+
+def modal_light_state(context):
+    """Return a snapshot of the active light, the view is redrawn only if it changes"""
+
+    obj_light = context.active_object
+    if obj_light is None or obj_light.type == 'EMPTY':
+        return(None)
+
+    state = [obj_light.name, obj_light.matrix_world.copy(), obj_light.location.copy(), obj_light.rotation_euler.copy()]
+
+    if obj_light.data.name.startswith("Lumiere"):
+        lamp = get_lamp(context, obj_light.Lumiere.lightname)
+        state += [lamp.matrix_world.copy(), lamp.scale.copy(), obj_light.Lumiere.energy, obj_light.Lumiere.range,
+                  obj_light.Lumiere.gapx, obj_light.Lumiere.gapy, obj_light.get('pixel_select')]
+        if lamp.type == 'LAMP':
+            state += [getattr(lamp.data, attr, None) for attr in ("shadow_soft_size", "spot_size", "spot_blend", "size", "size_y")]
+
+    return(state)
+
+def modal_scheduled(self, context, event):
+    """Coalesce the mouse moves, compute the modal step and redraw the view only if needed"""
+
+    step_event = modal_schedule(self, context, event)
+    if step_event is None:
+    #---Keep the timed informations of the HUD up to date
+        if event.type == 'TIMER':
+            if self.falloff_mode and context.area is not None:
+                context.area.tag_redraw()
+            return {'PASS_THROUGH'}
+    #---The coalesced mouse move is consumed or passed like the last one computed (navigation outside of the tool)
+        return(self.move_result)
+
+    try:
+        state = modal_light_state(context)
+        result = self.modal_step(context, step_event)
+        if step_event.type in {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE'}:
+            self.move_result = result
+
+        if context.area is not None and \
+           (step_event.type not in {'MOUSEMOVE', 'INBETWEEN_MOUSEMOVE'} or modal_light_state(context) != state):
+            context.area.tag_redraw()
+    except Exception as error:
+        print("Error to report : ", error)
+        context.window.cursor_modal_set("DEFAULT")
+        if context.area is not None:
+            context.area.header_text_set()
+        self.remove_handler()
+        return {'FINISHED'}
+
+    return(result)
+
+def modal_timer_add(self, context):
+    """Add the timer used to replay the coalesced mouse moves"""
+
+    self.pending_move = False
+    self.move_result = {'PASS_THROUGH'}
+    self.last_update = 0
+    self.text_header = ""
+    if context.scene.Modal_rate > 0:
+        self._timer = context.window_manager.event_timer_add(1.0 / context.scene.Modal_rate, context.window)
+
+def modal_timer_remove(self):
+    """Remove the timer of the scheduler"""
+
+    if self._timer is not None:
+        bpy.context.window_manager.event_timer_remove(self._timer)
+    self._timer = None
+
+#########################################################################################################
+
 #########################################################################################################
 class EditLight(bpy.types.Operator):
     """Edit the light : Interactive mode"""
@@ -2115,11 +2829,17 @@ class EditLight(bpy.types.Operator):
     act_light = bpy.props.StringProperty()
     lmb = False
     falloff_mode = False    
+    _timer = None
+    pending_move = False
+    move_result = {'PASS_THROUGH'}
+    last_update = 0
+    text_header = ""
     offset = FloatVectorProperty(name="Offset", size=3,)
     reflect_angle = bpy.props.StringProperty()
     rotz = 0
     k_press = 0
     save_range =""
+    proxy_light = ""
     #-------------------------------------------------------------------
 
     def check(self, context):
@@ -2141,9 +2861,11 @@ class EditLight(bpy.types.Operator):
                 self.in_view_3d = False         
             
     def modal(self, context, event):
+        return(modal_scheduled(self, context, event))
+
+    def modal_step(self, context, event):
         #-------------------------------------------------------------------
         coord = (event.mouse_region_x, event.mouse_region_y)
-        context.area.tag_redraw()
         obj_light = context.active_object
         #-------------------------------------------------------------------
 
@@ -2214,7 +2936,9 @@ class EditLight(bpy.types.Operator):
                 else:
                     str2 = "Softness: " + context.scene.Key_Scale 
                 text_header = str1 + str2 + " || Confirm: RMB"
-                context.area.header_text_set(text_header)
+                if text_header != self.text_header:
+                    context.area.header_text_set(text_header)
+                    self.text_header = text_header
                 
                 transform_light(self, context, event, obj_light)
                 
@@ -2260,9 +2984,10 @@ class EditLight(bpy.types.Operator):
         except Exception as error:
             if event.type not in {'RIGHTMOUSE', 'ESC'}:
                 print("Error to report : ", error)
-                context.window.cursor_modal_set("DEFAULT")
-                context.area.header_text_set()
-                self.remove_handler()
+        #---Always restore the images, the draw handler and the timer
+            context.window.cursor_modal_set("DEFAULT")
+            context.area.header_text_set()
+            self.remove_handler()
             return {'FINISHED'}
 
     def execute (self, context):
@@ -2282,6 +3007,11 @@ class EditLight(bpy.types.Operator):
         if self._handle:
             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
         self._handle = None
+        modal_timer_remove(self)
+    #---Back to the full resolution environment
+        if self.proxy_light != "":
+            proxy_stop(bpy.context, bpy.data.objects.get(self.proxy_light))
+            self.proxy_light = ""
         
     @classmethod
     def poll(cls, context):
@@ -2308,6 +3038,9 @@ class EditLight(bpy.types.Operator):
                 self.save_energy = (lamp_or_softbox.scale[0] * lamp_or_softbox.scale[1]) * obj_light.Lumiere.energy
                 
             self.lumiere_area = context.area
+
+        #---New session : forget the transforms cached by the previous one
+            Lumiere_bvh["matrices"].clear()
                             
             if obj_light is not None and obj_light.type != 'EMPTY' and obj_light.data.name.startswith("Lumiere") and self.editmode:
                 for ob in context.scene.objects:
@@ -2319,8 +3052,14 @@ class EditLight(bpy.types.Operator):
                 self.hit_world = obj_light.location
                 obj_light['pixel_select'] = False
 
+            #---Low resolution environment while the light is edited
+                if obj_light.Lumiere.typlight == "Env":
+                    proxy_start(context, obj_light)
+                    self.proxy_light = obj_light.name
+
             context.window_manager.modal_handler_add(self)
             self._handle = bpy.types.SpaceView3D.draw_handler_add(draw_callback_px, args, 'WINDOW', 'POST_PIXEL')
+            modal_timer_add(self, context)
             return {'RUNNING_MODAL'}
         else:
             self.report({'WARNING'}, "No active View3d detected !")
@@ -2729,6 +3468,11 @@ class CreateLight(bpy.types.Operator):
     
     lmb = False
     falloff_mode = False    
+    _timer = None
+    pending_move = False
+    move_result = {'PASS_THROUGH'}
+    last_update = 0
+    text_header = ""
     reflect_angle = bpy.props.StringProperty()
     offset = FloatVectorProperty(name="Offset", size=3,)
     rotz = 0
@@ -2752,9 +3496,11 @@ class CreateLight(bpy.types.Operator):
 
             
     def modal(self, context, event):
+        return(modal_scheduled(self, context, event))
+
+    def modal_step(self, context, event):
         #-------------------------------------------------------------------
         coord = (event.mouse_region_x, event.mouse_region_y)
-        context.area.tag_redraw()
         obj_light = context.active_object
         #-------------------------------------------------------------------
 
@@ -2879,7 +3625,9 @@ class CreateLight(bpy.types.Operator):
                 else:
                     str2 = "Softness: " + context.scene.Key_Scale 
                 text_header = str1 + str2 + " || Confirm: RMB"
-                context.area.header_text_set(text_header)
+                if text_header != self.text_header:
+                    context.area.header_text_set(text_header)
+                    self.text_header = text_header
                 
                 transform_light(self, context, event, obj_light)
                 
@@ -2925,9 +3673,10 @@ class CreateLight(bpy.types.Operator):
         except Exception as error:
             if event.type not in {'RIGHTMOUSE', 'ESC'}:
                 print("Error to report : ", error)
-                context.window.cursor_modal_set("DEFAULT")
-                context.area.header_text_set()
-                self.remove_handler()
+        #---Always restore the images, the draw handler and the timer
+            context.window.cursor_modal_set("DEFAULT")
+            context.area.header_text_set()
+            self.remove_handler()
             return {'FINISHED'}
 
     def execute (self, context):
@@ -2940,6 +3689,7 @@ class CreateLight(bpy.types.Operator):
         if self._handle:
             bpy.types.SpaceView3D.draw_handler_remove(self._handle, 'WINDOW')
         self._handle = None
+        modal_timer_remove(self)
         
     @classmethod
     def poll(cls, context):
@@ -2955,8 +3705,12 @@ class CreateLight(bpy.types.Operator):
 
             self.lumiere_area = context.area
 
+        #---New session : forget the transforms cached by the previous one
+            Lumiere_bvh["matrices"].clear()
+
             context.window_manager.modal_handler_add(self)
             self._handle = bpy.types.SpaceView3D.draw_handler_add(draw_callback_px, args, 'WINDOW', 'POST_PIXEL')
+            modal_timer_add(self, context)
             return {'RUNNING_MODAL'}
         else:
             self.report({'WARNING'}, "No active View3d detected !")
@@ -2965,6 +3719,122 @@ class CreateLight(bpy.types.Operator):
 
 #########################################################################################################
 
+#########################################################################################################
+# creation functions of the lights available for the batch
+Lumiere_batch_creators = {
+                        "Panel" : create_softbox,
+                        "Point" : create_light_point,
+                        "Sun" : create_light_sun,
+                        "Spot" : create_light_spot,
+                        "Area" : create_light_area,
+                        }
+
+def timing_message(message, timing):
+    """Return the message with the total time and the time of each step"""
+
+    return(message + " in " + "%.3f" % sum(timing.values()) + "s (" + \
+           ", ".join(step + ": " + "%.3f" % value + "s" for step, value in timing.items()) + ")")
+
+def batch_color(color):
+    """Return the RGBA color of a batch light, None if it is not a color of 3 or 4 values"""
+
+    try:
+        color = [min(max(float(value), 0.0), 1.0) for value in color]
+    except (TypeError, ValueError):
+        return(None)
+    if len(color) == 3:
+        color.append(1.0)
+    return(color if len(color) == 4 else None)
+
+def create_lights_batch(context, specs):
+    """Create all the lights of the list in one pass, return the lights and the time of each step
+    specs : [{"typlight": "Panel", "name": "Lumiere", "location": (x, y, z), "rotation": (x, y, z),
+              "energy": 10, "lightcolor": (r, g, b, a), "range": 0.5}, ...]
+    energy : strength of the Emission node for the suns, energy of the light for the other types"""
+
+    scene = context.scene
+    save_typlight = scene.Lumiere.typlight
+    timing = OrderedDict()
+    lights = []
+
+#---Create the objects, the properties are written without their update functions
+    start = time.time()
+    try:
+        for spec in specs:
+            typlight = spec.get("typlight", "Panel")
+            if typlight not in Lumiere_batch_creators:
+                print("Error to report : ", "Light type not available for the batch : " + str(typlight))
+                continue
+
+            scene.Lumiere.typlight = typlight
+            dupli = Lumiere_batch_creators[typlight](None, context, dupli_name = spec.get("name", "Lumiere"), batch = True)
+            dupli.location = spec.get("location", (0, 0, 0))
+            dupli.rotation_euler = spec.get("rotation", (0, 0, 0))
+            if "energy" in spec:
+                dupli.Lumiere["energy"] = float(spec["energy"])
+            if "range" in spec:
+                dupli.Lumiere["range"] = float(spec["range"])
+            if "lightcolor" in spec:
+                color = batch_color(spec["lightcolor"])
+                if color is None:
+                    print("Error to report : ", "Color of 3 or 4 values expected : " + str(spec["lightcolor"]))
+                else:
+                    dupli.Lumiere["lightcolor"] = color
+            lights.append(dupli)
+    finally:
+        scene.Lumiere.typlight = save_typlight
+    timing["create"] = time.time() - start
+
+#---Build and update the materials one time per light, once all the objects exist
+    start = time.time()
+    for dupli in lights:
+        for child in dupli.children:
+            if child.type == 'MESH' and child.data.name.startswith("SOFTBOX_"):
+                child.active_material = softbox_mat(child, dupli)
+            elif child.type == 'LAMP':
+                create_lamp_nodes(None, context, child)
+            #---The falloff isn't linked for the suns : the strength is the one of the Emission node
+                if child.data.type == 'SUN':
+                    child.data.node_tree.nodes["Emission"].inputs[1].default_value = dupli.Lumiere.energy
+        update_mat(dupli.Lumiere, context)
+    timing["materials"] = time.time() - start
+
+    return(lights, timing)
+#########################################################################################################
+
+#########################################################################################################
+class SCENE_OT_create_lights_batch(Operator):
+    """Create all the lights described in a JSON file"""
+
+    bl_idname = "object.create_lights_batch"
+    bl_label = "Create lights from file"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob = bpy.props.StringProperty(default="*.json", options={'HIDDEN'})
+
+    def execute(self, context):
+        try:
+            with open(bpy.path.abspath(self.filepath), 'r', encoding='utf-8') as file:
+                specs = json.load(file)
+        except Exception as error:
+            self.report({'ERROR'}, "Can't read the file : " + str(error))
+            return {'CANCELLED'}
+
+    #---Accept a list of lights or {"lights": [...]}
+        if isinstance(specs, dict):
+            specs = specs.get("lights", [])
+
+        lights, timing = create_lights_batch(context, specs)
+
+        self.report({'INFO'}, timing_message(str(len(lights)) + " lights created", timing))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
+#########################################################################################################
+
 #########################################################################################################
 def update_sky(self, context):
     """Update the sky node with from the targeted angle"""
@@ -3016,11 +3886,9 @@ def reset_options(self, context):
     
     elif cobj.Lumiere.typlight in ("Panel"):
         mat_name, mat = get_mat_name("SOFTBOX_" + cobj.data.name)
-        img_bright = mat.node_tree.nodes['Bright/Contrast']
-        img_gamma = mat.node_tree.nodes['Gamma']
-        img_hue = mat.node_tree.nodes['Hue Saturation Value']
-        repeat_u = mat.node_tree.nodes['Math']
-        repeat_v = mat.node_tree.nodes['Math.002']      
+    #---The shared group exposes the inputs of the three nodes
+        img_bright = img_gamma = img_hue = mat.node_tree.nodes['Image_Adjust']
+        repeat = mat.node_tree.nodes['Repeat_Texture']
     
     if cobj.Lumiere.hdri_reset:
         cobj.Lumiere.hdri_bright = hdri_bright.inputs['Bright'].default_value = 0
@@ -3038,26 +3906,23 @@ def reset_options(self, context):
         cobj.Lumiere.img_saturation = img_hue.inputs['Saturation'].default_value = 1
         cobj.Lumiere.img_value = img_hue.inputs['Value'].default_value = 1
         if cobj.Lumiere.typlight == "Panel":
-            repeat_u.inputs[1].default_value = 1
-            repeat_v.inputs[1].default_value = 1
+            repeat.inputs[1].default_value = 1
+            repeat.inputs[2].default_value = 1
 
     if cobj.Lumiere.projector_img_reset:
         projector = bpy.data.objects["PROJECTOR_" + cobj.data.name]
         mat_name, mat = get_mat_name(projector.data.name)
-        img_text = mat.node_tree.nodes['Image Texture']
-        saturation = mat.node_tree.nodes['Mix']
-        contrast = mat.node_tree.nodes['Bright/Contrast']
-        gamma = mat.node_tree.nodes['Gamma']
-        invert = mat.node_tree.nodes['Invert']
+        adjust = mat.node_tree.nodes['Projector_Adjust']
         repeat_u = mat.node_tree.nodes["Repeat_Texture"].inputs[1]
         repeat_v = mat.node_tree.nodes["Repeat_Texture"].inputs[2]
 
         
-        cobj.Lumiere.projector_img_saturation = saturation.inputs['Fac'].default_value = 0
-        cobj.Lumiere.projector_img_gamma = gamma.inputs['Gamma'].default_value = 1
-        cobj.Lumiere.projector_img_bright = contrast.inputs['Bright'].default_value = 0
-        cobj.Lumiere.projector_img_contrast = contrast.inputs['Contrast'].default_value = 0
-        cobj.Lumiere.projector_img_invert = invert.inputs['Fac'].default_value = 0
+        cobj.Lumiere.projector_img_saturation = adjust.inputs['Saturation'].default_value = 0
+        cobj.Lumiere.projector_img_gamma = adjust.inputs['Gamma'].default_value = 1
+        cobj.Lumiere.projector_img_bright = adjust.inputs['Bright'].default_value = 0
+        cobj.Lumiere.projector_img_contrast = adjust.inputs['Contrast'].default_value = 0
+        cobj.Lumiere.projector_img_invert = adjust.inputs['Invert'].default_value = 0
+        cobj.Lumiere.projector_img_blur = 0
         repeat_u.default_value = 1
         repeat_v.default_value = 1
 #########################################################################################################
@@ -3133,14 +3998,15 @@ def update_lamp(self, context, cobj):
         
     falloff = mat.node_tree.nodes["Light Falloff"]
     emit = mat.node_tree.nodes["Emission"]
-    emit.inputs[0].default_value = cobj.Lumiere.lightcolor
-    mat.node_tree.nodes["Light Falloff"].inputs[0].default_value = cobj.Lumiere.energy
-    mat.node_tree.links.new(falloff.outputs[int(cobj.Lumiere.typfalloff)], emit.inputs[1])
+    set_if_changed(emit.inputs[0], "default_value", cobj.Lumiere.lightcolor)
+    set_if_changed(mat.node_tree.nodes["Light Falloff"].inputs[0], "default_value", cobj.Lumiere.energy)
+    if cobj.Lumiere.typlight not in ("Sun", "Sky"):
+        link_sockets(mat.node_tree, falloff.outputs[int(cobj.Lumiere.typfalloff)], emit.inputs[1])
 
     if cobj.Lumiere.texture_type == "Gradient":
         colramp = mat.node_tree.nodes['ColorRamp']
-        colramp.color_ramp.interpolation = cobj.Lumiere.gradinterpo
-        mat.node_tree.links.new(colramp.outputs[0], emit.inputs['Color'])
+        set_if_changed(colramp.color_ramp, "interpolation", cobj.Lumiere.gradinterpo)
+        link_sockets(mat.node_tree, colramp.outputs[0], emit.inputs['Color'])
     else:
         if mat.node_tree.nodes['ColorRamp'].outputs['Color'].links:
             mat.node_tree.links.remove(mat.node_tree.nodes['ColorRamp'].outputs['Color'].links[0])
@@ -3157,6 +4023,33 @@ def update_lamp(self, context, cobj):
         # mat.node_tree.links.new(falloff.outputs[0], emit.inputs[1])
 #########################################################################################################
 
+#########################################################################################################
+def link_sockets(node_tree, from_socket, to_socket):
+    """Link the sockets only if the link doesn't exist yet, relinking reset the shaders"""
+
+    for link in to_socket.links:
+        if link.from_socket == from_socket:
+            return(link)
+
+    return(node_tree.links.new(from_socket, to_socket))
+
+def set_if_changed(data, attr, value):
+    """Write the property only if its value is different, a write reset the shaders"""
+
+    current = getattr(data, attr)
+    if isinstance(current, (int, float)):
+        changed = abs(current - value) > 1e-6
+    elif hasattr(current, "__len__") and not isinstance(current, str):
+        changed = len(current) != len(value) or any(abs(a - b) > 1e-6 for a, b in zip(current, value))
+    else:
+        changed = current != value
+
+    if changed:
+        setattr(data, attr, value)
+
+    return(changed)
+#########################################################################################################
+
 #########################################################################################################
 def update_mat(self, context):
     """Update the material nodes of the lights"""
@@ -3189,61 +4082,66 @@ def update_mat(self, context):
                 mapping2 = world.node_tree.nodes['Mapping.001']
                     
                 if cobj.Lumiere.hdri_name != "":    
-                    hdr_text.image = bpy.data.images[cobj.Lumiere.hdri_name]
-                    world.node_tree.links.new(hdr_text.outputs[0], hdri_bright.inputs[0])
-                    world.node_tree.links.new(hdri_hue.outputs[0], background1.inputs[0])
-                    world.node_tree.links.new(lightpath.outputs[0], math_path.inputs[0])
-                    world.node_tree.links.new(lightpath.outputs[3], math_path.inputs[1])
-                    world.node_tree.links.new(math_path.outputs[0], mix.inputs[0])
-                    hdri_bright.inputs['Bright'].default_value = cobj.Lumiere.hdri_bright
-                    hdri_bright.inputs['Contrast'].default_value = cobj.Lumiere.hdri_contrast
-                    hdri_gamma.inputs['Gamma'].default_value = cobj.Lumiere.hdri_gamma
-                    hdri_hue.inputs['Hue'].default_value = cobj.Lumiere.hdri_hue
-                    hdri_hue.inputs['Saturation'].default_value = cobj.Lumiere.hdri_saturation
-                    hdri_hue.inputs['Value'].default_value = cobj.Lumiere.hdri_value
+                    link_sockets(world.node_tree, hdr_text.outputs[0], hdri_bright.inputs[0])
+                    bake_link(world.node_tree, hdr_text, hdri_hue, background1, "HDRI", cobj.Lumiere.hdri_name,
+                              env_adjustments(cobj, "hdri"))
+                    link_sockets(world.node_tree, lightpath.outputs[0], math_path.inputs[0])
+                    link_sockets(world.node_tree, lightpath.outputs[3], math_path.inputs[1])
+                    link_sockets(world.node_tree, math_path.outputs[0], mix.inputs[0])
+                    set_if_changed(hdri_bright.inputs['Bright'], "default_value", cobj.Lumiere.hdri_bright)
+                    set_if_changed(hdri_bright.inputs['Contrast'], "default_value", cobj.Lumiere.hdri_contrast)
+                    set_if_changed(hdri_gamma.inputs['Gamma'], "default_value", cobj.Lumiere.hdri_gamma)
+                    set_if_changed(hdri_hue.inputs['Hue'], "default_value", cobj.Lumiere.hdri_hue)
+                    set_if_changed(hdri_hue.inputs['Saturation'], "default_value", cobj.Lumiere.hdri_saturation)
+                    set_if_changed(hdri_hue.inputs['Value'], "default_value", cobj.Lumiere.hdri_value)
                 else:
                 #--- Remove image HDRI links
                     cobj.Lumiere.rotation_lock_img = False
                     for i in range(len(hdri_hue.outputs['Color'].links)):
                         world.node_tree.links.remove(hdri_hue.outputs['Color'].links[i-1])
+                    for link in background1.inputs[0].links:
+                        if link.from_node == hdr_text:
+                            world.node_tree.links.remove(link)
             
             #---HDRI for background         
                 if cobj.Lumiere.hdri_background:
-                    world.node_tree.links.new(background1.outputs[0], env_output.inputs[0])
+                    link_sockets(world.node_tree, background1.outputs[0], env_output.inputs[0])
 
                 else:
-                    world.node_tree.links.new(env_mix.outputs[0], env_output.inputs[0])
+                    link_sockets(world.node_tree, env_mix.outputs[0], env_output.inputs[0])
 
             #---Image Background 
                 if cobj.Lumiere.img_name != "" and not cobj.Lumiere.hdri_background: 
-                    img_text.image = bpy.data.images[cobj.Lumiere.img_name]
-                    world.node_tree.links.new(img_text.outputs[0], background2.inputs[0])
-                    world.node_tree.links.new(lightpath.outputs[0], math_path.inputs[0])
-                    world.node_tree.links.new(lightpath.outputs[3], math_path.inputs[1])
+                    link_sockets(world.node_tree, lightpath.outputs[0], math_path.inputs[0])
+                    link_sockets(world.node_tree, lightpath.outputs[3], math_path.inputs[1])
                     if cobj.Lumiere.back_reflect:
-                        math_path.operation = 'ADD'
+                        set_if_changed(math_path, "operation", 'ADD')
                     else:
-                        math_path.operation = 'SUBTRACT'
-                    world.node_tree.links.new(math_path.outputs[0], mix.inputs[0])
-                    world.node_tree.links.new(img_text.outputs[0], img_bright.inputs[0])
-                    world.node_tree.links.new(img_hue.outputs[0], background2.inputs[0])
-                    img_bright.inputs['Bright'].default_value = cobj.Lumiere.img_bright
-                    img_bright.inputs['Contrast'].default_value = cobj.Lumiere.img_contrast
-                    img_gamma.inputs['Gamma'].default_value = cobj.Lumiere.img_gamma
-                    img_hue.inputs['Hue'].default_value = cobj.Lumiere.img_hue
-                    img_hue.inputs['Saturation'].default_value = cobj.Lumiere.img_saturation
-                    img_hue.inputs['Value'].default_value = cobj.Lumiere.img_value                  
+                        set_if_changed(math_path, "operation", 'SUBTRACT')
+                    link_sockets(world.node_tree, math_path.outputs[0], mix.inputs[0])
+                    link_sockets(world.node_tree, img_text.outputs[0], img_bright.inputs[0])
+                    bake_link(world.node_tree, img_text, img_hue, background2, "IMG", cobj.Lumiere.img_name,
+                              env_adjustments(cobj, "img"))
+                    set_if_changed(img_bright.inputs['Bright'], "default_value", cobj.Lumiere.img_bright)
+                    set_if_changed(img_bright.inputs['Contrast'], "default_value", cobj.Lumiere.img_contrast)
+                    set_if_changed(img_gamma.inputs['Gamma'], "default_value", cobj.Lumiere.img_gamma)
+                    set_if_changed(img_hue.inputs['Hue'], "default_value", cobj.Lumiere.img_hue)
+                    set_if_changed(img_hue.inputs['Saturation'], "default_value", cobj.Lumiere.img_saturation)
+                    set_if_changed(img_hue.inputs['Value'], "default_value", cobj.Lumiere.img_value)
                 else:
                 #--- Remove image background links
                     cobj.Lumiere.rotation_lock_hdri = False
                     for i in range(len(img_hue.outputs['Color'].links)):
                         world.node_tree.links.remove(img_hue.outputs['Color'].links[i-1])                       
+                    for link in background2.inputs[0].links:
+                        if link.from_node == img_text:
+                            world.node_tree.links.remove(link)
                 
                 #---Color background for reflection
                     if cobj.Lumiere.back_reflect:
-                        math_path.operation = 'ADD'
+                        set_if_changed(math_path, "operation", 'ADD')
                     else:
-                        math_path.operation = 'SUBTRACT'
+                        set_if_changed(math_path, "operation", 'SUBTRACT')
 
             else:
                 if cobj.Lumiere.hdri_reset: 
@@ -3254,162 +4152,158 @@ def update_mat(self, context):
         elif cobj.Lumiere.typlight == "Panel":
         #---Panel Light 
             mat_name, mat = get_mat_name("SOFTBOX_" + cobj.data.name)
-            emit = mat.node_tree.nodes["Emission"]
-            emit.inputs[0].default_value = cobj.Lumiere.lightcolor
-            mat.diffuse_color = (cobj.Lumiere.lightcolor[0], cobj.Lumiere.lightcolor[1], cobj.Lumiere.lightcolor[2])
-            mat.alpha = 0.5
-            diffuse = mat.node_tree.nodes["Diffuse BSDF"]
-            diffuse.inputs[0].default_value = cobj.Lumiere.lightcolor
+        #---Material missing or built by a previous template
+            if mat is None or mat.get("lumiere_version") != Lumiere_templates_version:
+                softbox = get_lamp(context, cobj.Lumiere.lightname)
+                mat = softbox_mat(softbox, cobj)
+                softbox.active_material = mat
+            shading = mat.node_tree.nodes["Softbox_Shading"]
+        #---Color of the light : the emission, or the first color of the array multiplied by the emitters
+            emit_color = array_nodes(cobj, mat)
+            mask = shading.inputs["Mask"]
+            mask_color = shading.inputs["Mask Color"]
+            texture = cobj.Lumiere.img_name != "" and cobj.Lumiere.texture_type == "Texture"
+            set_if_changed(emit_color, "default_value", cobj.Lumiere.lightcolor)
+            set_if_changed(mat, "diffuse_color", (cobj.Lumiere.lightcolor[0], cobj.Lumiere.lightcolor[1], cobj.Lumiere.lightcolor[2]))
+            set_if_changed(mat, "alpha", 0.5)
+            set_if_changed(shading.inputs["Diffuse Color"], "default_value", cobj.Lumiere.lightcolor)
             img_text = mat.node_tree.nodes['Image Texture']
-            img_bright = mat.node_tree.nodes['Bright/Contrast']
-            img_gamma = mat.node_tree.nodes['Gamma']
-            img_hue = mat.node_tree.nodes['Hue Saturation Value']                   
-            invert = mat.node_tree.nodes['Invert']
-            invert.inputs[0].default_value = 1
-            mat.node_tree.nodes["Random_Color"].inputs[1].default_value = cobj.Lumiere.random_color 
+            img_adjust = mat.node_tree.nodes['Image_Adjust']
+            set_if_changed(mask, "default_value", 0 if texture else 1)
+            set_if_changed(mat.node_tree.nodes["Random_Color"].inputs[1], "default_value", cobj.Lumiere.random_color)
             random_energy = mat.node_tree.nodes["Random_Energy"]
-            random_energy.inputs[0].default_value = cobj.Lumiere.energy
+            set_if_changed(random_energy.inputs[0], "default_value", cobj.Lumiere.energy)
             mix_color_texture = mat.node_tree.nodes["Mix_Color_Texture"]
             falloff = mat.node_tree.nodes["Light Falloff"]
-            falloff.inputs[0].default_value = cobj.Lumiere.energy
-            mat.node_tree.links.new(falloff.outputs[int(cobj.Lumiere.typfalloff)],  emit.inputs[1])
-            mix1 = mat.node_tree.nodes["Mix Shader"]
+            set_if_changed(falloff.inputs[0], "default_value", cobj.Lumiere.energy)
+            link_sockets(mat.node_tree, falloff.outputs[int(cobj.Lumiere.typfalloff)], shading.inputs["Strength"])
             colramp = mat.node_tree.nodes['ColorRamp']
             coord = mat.node_tree.nodes['Texture Coordinate']
             mapping = mat.node_tree.nodes['Mapping']
+            repeat = mat.node_tree.nodes['Repeat_Texture']
 
             if cobj.Lumiere.rotate_ninety:
-                mapping.rotation[2] = math.radians(90)
+                set_if_changed(mapping, "rotation", (mapping.rotation[0], mapping.rotation[1], math.radians(90)))
             else:
-                mapping.rotation[2] = 0
+                set_if_changed(mapping, "rotation", (mapping.rotation[0], mapping.rotation[1], 0))
                 
         #---Image Texture options
-            if cobj.Lumiere.img_name != "" and cobj.Lumiere.texture_type =="Texture" :
-                combine = mat.node_tree.nodes["Combine RGB"]
-                sepRGB =  mat.node_tree.nodes['Separate RGB']
-                mat.node_tree.links.new(coord.outputs[0], mapping.inputs[0])
-                mat.node_tree.links.new(mapping.outputs[0],  sepRGB.inputs[0])                  
-                mat.node_tree.links.new(combine.outputs[0], img_text.inputs['Vector'])
-                img_text.image = bpy.data.images[cobj.Lumiere.img_name]
-                img_bright.inputs['Bright'].default_value = cobj.Lumiere.img_bright
-                img_bright.inputs['Contrast'].default_value = cobj.Lumiere.img_contrast
-                img_gamma.inputs['Gamma'].default_value = cobj.Lumiere.img_gamma    
-                img_hue.inputs['Hue'].default_value = cobj.Lumiere.img_hue
-                img_hue.inputs['Saturation'].default_value = cobj.Lumiere.img_saturation
-                img_hue.inputs['Value'].default_value = cobj.Lumiere.img_value          
-                mat.node_tree.links.new(img_hue.outputs[0], emit.inputs[0])
-                mat.node_tree.links.new(img_hue.outputs[0], invert.inputs[1])
-                invert.inputs[0].default_value = 0  
+            if texture:
+                link_sockets(mat.node_tree, coord.outputs[0], mapping.inputs[0])
+                link_sockets(mat.node_tree, mapping.outputs[0], repeat.inputs[0])
+                link_sockets(mat.node_tree, repeat.outputs[0], img_text.inputs['Vector'])
+                set_if_changed(img_text, "image", bpy.data.images[cobj.Lumiere.img_name])
+                set_if_changed(img_adjust.inputs['Bright'], "default_value", cobj.Lumiere.img_bright)
+                set_if_changed(img_adjust.inputs['Contrast'], "default_value", cobj.Lumiere.img_contrast)
+                set_if_changed(img_adjust.inputs['Gamma'], "default_value", cobj.Lumiere.img_gamma)
+                set_if_changed(img_adjust.inputs['Hue'], "default_value", cobj.Lumiere.img_hue)
+                set_if_changed(img_adjust.inputs['Saturation'], "default_value", cobj.Lumiere.img_saturation)
+                set_if_changed(img_adjust.inputs['Value'], "default_value", cobj.Lumiere.img_value)
+                link_sockets(mat.node_tree, img_adjust.outputs[0], mask_color)
                 
-                if invert.inputs['Fac'].links:
-                    mat.node_tree.links.remove(invert.inputs['Fac'].links[0])
+                if mask.links:
+                    mat.node_tree.links.remove(mask.links[0])
                     
                 if cobj.Lumiere.img_reset: 
                     cobj.Lumiere.img_reset = False  
                     
             #---Random
                 if cobj.Lumiere.random_energy:
-                    mat.node_tree.links.new(mat.node_tree.nodes["Mix_Color_Texture"].outputs[0], emit.inputs[0])
-                    mat.node_tree.links.new(img_hue.outputs[0], mat.node_tree.nodes["Mix_Color_Texture"].inputs[1])
-                    mat.node_tree.links.new(colramp.outputs[0], mat.node_tree.nodes["Mix_Color_Texture"].inputs[2])
-                    mat.node_tree.links.new(random_energy.outputs[0], falloff.inputs[0])
-                    mat.node_tree.links.new(colramp.outputs[0], random_energy.inputs[1])
-                    mat.node_tree.links.new(mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])
+                    link_sockets(mat.node_tree, mix_color_texture.outputs[0], emit_color)
+                    link_sockets(mat.node_tree, img_adjust.outputs[0], mix_color_texture.inputs[1])
+                    link_sockets(mat.node_tree, colramp.outputs[0], mix_color_texture.inputs[2])
+                    link_sockets(mat.node_tree, random_energy.outputs[0], falloff.inputs[0])
+                    link_sockets(mat.node_tree, colramp.outputs[0], random_energy.inputs[1])
+                    link_sockets(mat.node_tree, mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])
                     
                 else:
-                    mat.node_tree.links.new(img_hue.outputs[0], emit.inputs[0])
-                    if mat.node_tree.nodes['Random_Energy'].outputs['Value'].links:
+                    link_sockets(mat.node_tree, img_adjust.outputs[0], emit_color)
+                    if random_energy.outputs['Value'].links:
                         mat.node_tree.links.remove(random_energy.outputs['Value'].links[0])
                         
             else:
-                if invert.inputs['Color'].links:
-                    mat.node_tree.links.remove(invert.inputs['Color'].links[0])                     
-                if img_hue.outputs['Color'].links:
-                    mat.node_tree.links.remove(img_hue.outputs['Color'].links[0])
+                if mask_color.links:
+                    mat.node_tree.links.remove(mask_color.links[0])                     
+                for link in list(img_adjust.outputs['Color'].links):
+                    mat.node_tree.links.remove(link)
                     
             if cobj.Lumiere.reflector:
-            #---Link Diffuse 
-                mat.node_tree.links.new(diffuse.outputs[0], mix1.inputs[2])
-                
-            #---Transparent Node to black
-                mat.node_tree.nodes["Transparent BSDF"].inputs[0].default_value = (0,0,0,1)     
+            #---Diffuse instead of the emission, transparent node to black
+                set_if_changed(shading.inputs["Reflector"], "default_value", 1)
+                set_if_changed(shading.inputs["Transparent Color"], "default_value", (0,0,0,1))
 
             #---Remove links
-                if img_hue.outputs['Color'].links:
-                    mat.node_tree.links.remove(img_hue.outputs['Color'].links[0])
-                    mat.node_tree.links.remove(invert.inputs['Color'].links[0])
-                    
-                if invert.inputs['Fac'].links:
-                    mat.node_tree.links.remove(invert.inputs['Fac'].links[0])
+                for link in list(img_adjust.outputs['Color'].links):
+                    mat.node_tree.links.remove(link)
+                if mask_color.links:
+                    mat.node_tree.links.remove(mask_color.links[0])
+                if mask.links:
+                    mat.node_tree.links.remove(mask.links[0])
             else:
-            #---Link Emit 
-                mat.node_tree.links.new(emit.outputs[0], mix1.inputs[2])
-
-            #---Transparent Node to white
-                mat.node_tree.nodes["Transparent BSDF"].inputs[0].default_value = (1,1,1,1)
+            #---Emission, transparent node to white
+                set_if_changed(shading.inputs["Reflector"], "default_value", 0)
+                set_if_changed(shading.inputs["Transparent Color"], "default_value", (1,1,1,1))
                 
         #---Gradients
             if cobj.Lumiere.texture_type == "Gradient" and not cobj.Lumiere.reflector:              
-                sepRGB =  mat.node_tree.nodes['Separate RGB']
                 grad = mat.node_tree.nodes['Gradient Texture']
-                mat.node_tree.links.new(mapping.outputs[0],  grad.inputs[0])
-                mat.node_tree.links.new(grad.outputs[0],  sepRGB.inputs[0])                 
+                link_sockets(mat.node_tree, mapping.outputs[0],  grad.inputs[0])
+                link_sockets(mat.node_tree, grad.outputs[0],  repeat.inputs[0])
                 linear_grad = mat.node_tree.nodes['Gradient Texture.001']
                 geom = mat.node_tree.nodes['Geometry']
-                combRGB = mat.node_tree.nodes['Combine RGB'] 
 
-                mat.node_tree.links.new(colramp.outputs[0], emit.inputs['Color'])
-                mat.node_tree.links.new(colramp.outputs[1], invert.inputs['Fac'])
+                link_sockets(mat.node_tree, colramp.outputs[0], emit_color)
+                link_sockets(mat.node_tree, colramp.outputs[1], mask)
                 
                 if cobj.Lumiere.typgradient != "NONE" :
-                    mat.node_tree.nodes['Gradient Texture'].gradient_type = cobj.Lumiere.typgradient
-                    mat.node_tree.links.new(combRGB.outputs[0], linear_grad.inputs['Vector'])
-                    mat.node_tree.links.new(linear_grad.outputs[0], colramp.inputs[0])
+                    set_if_changed(grad, "gradient_type", cobj.Lumiere.typgradient)
+                    link_sockets(mat.node_tree, repeat.outputs[0], linear_grad.inputs['Vector'])
+                    link_sockets(mat.node_tree, linear_grad.outputs[0], colramp.inputs[0])
                 
                 #---Gradients links
-                    if img_hue.outputs['Color'].links:
-                        mat.node_tree.links.remove(img_hue.outputs['Color'].links[0])                       
+                    for link in list(img_adjust.outputs['Color'].links):
+                        mat.node_tree.links.remove(link)
                     if cobj.Lumiere.typgradient in ("LINEAR", "DIAGONAL") : #LINEAR - DIAGONAL
-                        mat.node_tree.links.new(coord.outputs[0], mapping.inputs[0])
+                        link_sockets(mat.node_tree, coord.outputs[0], mapping.inputs[0])
                     elif cobj.Lumiere.typgradient in ("QUADRATIC", "EASING") : #QUAD - EASING
-                        mat.node_tree.links.new(geom.outputs[5], mapping.inputs[0])
+                        link_sockets(mat.node_tree, geom.outputs[5], mapping.inputs[0])
                     elif cobj.Lumiere.typgradient in ("SPHERICAL", "QUADRATIC_SPHERE", "RADIAL") : #SPHERICAL - QUADRATIC_SPHERE - RADIAL
-                        mat.node_tree.links.new(coord.outputs[3], mapping.inputs[0])    
+                        link_sockets(mat.node_tree, coord.outputs[3], mapping.inputs[0])
             #---Only colors
                 else:
-                    mat.node_tree.links.new(mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])  
+                    link_sockets(mat.node_tree, mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])
 
             #---Random
                 if cobj.Lumiere.random_energy:
-                    mat.node_tree.links.new(random_energy.outputs[0], falloff.inputs[0])
-                    mat.node_tree.links.new(colramp.outputs[0], random_energy.inputs[1])
+                    link_sockets(mat.node_tree, random_energy.outputs[0], falloff.inputs[0])
+                    link_sockets(mat.node_tree, colramp.outputs[0], random_energy.inputs[1])
                     if cobj.Lumiere.typgradient != "NONE":
-                        mat.node_tree.links.new(mat.node_tree.nodes["Mix_Random_Color"].outputs[0], colramp.inputs[0])
+                        link_sockets(mat.node_tree, mat.node_tree.nodes["Mix_Random_Color"].outputs[0], colramp.inputs[0])
                 else:
-                    if mat.node_tree.nodes['Random_Energy'].outputs['Value'].links:
+                    if random_energy.outputs['Value'].links:
                         mat.node_tree.links.remove(random_energy.outputs['Value'].links[0])
             else:
-                if invert.inputs['Fac'].links:
-                    mat.node_tree.links.remove(invert.inputs['Fac'].links[0])
+                if mask.links:
+                    mat.node_tree.links.remove(mask.links[0])
                     
         #---Color
             if cobj.Lumiere.texture_type == "Color" and not cobj.Lumiere.reflector:
 
             #---Random
                 if cobj.Lumiere.random_energy:
-                    mat.node_tree.nodes["Mix_Color_Texture"].inputs[1].default_value = cobj.Lumiere.lightcolor
-                    mat.node_tree.links.new(mat.node_tree.nodes["Mix_Color_Texture"].outputs[0], emit.inputs[0])
-                    mat.node_tree.links.new(colramp.outputs[0], mat.node_tree.nodes["Mix_Color_Texture"].inputs[2])
+                    set_if_changed(mix_color_texture.inputs[1], "default_value", cobj.Lumiere.lightcolor)
+                    link_sockets(mat.node_tree, mix_color_texture.outputs[0], emit_color)
+                    link_sockets(mat.node_tree, colramp.outputs[0], mix_color_texture.inputs[2])
                     
-                    mat.node_tree.links.new(random_energy.outputs[0], falloff.inputs[0])
-                    mat.node_tree.links.new(colramp.outputs[0], random_energy.inputs[1])
-                    mat.node_tree.links.new(mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])
+                    link_sockets(mat.node_tree, random_energy.outputs[0], falloff.inputs[0])
+                    link_sockets(mat.node_tree, colramp.outputs[0], random_energy.inputs[1])
+                    link_sockets(mat.node_tree, mat.node_tree.nodes["Random_Color"].outputs[0], colramp.inputs[0])
                     
                 else:
-                    if mat.node_tree.nodes['Random_Energy'].outputs['Value'].links:
+                    if random_energy.outputs['Value'].links:
                         mat.node_tree.links.remove(random_energy.outputs['Value'].links[0])
-                    if emit.inputs[0].links:
-                        mat.node_tree.links.remove(emit.inputs[0].links[0])
+                    if emit_color.links:
+                        mat.node_tree.links.remove(emit_color.links[0])
 
     #---Blender Lamps
         else:
@@ -3422,20 +4316,88 @@ def update_mat(self, context):
             
             if cobj.Lumiere.typlight in ("Sky"):
                 emit = mat.node_tree.nodes["Emission"]
-                emit.inputs[0].default_value = cobj.Lumiere.lightcolor
-                emit.inputs[1].default_value = cobj.Lumiere.energy   
+                set_if_changed(emit.inputs[0], "default_value", cobj.Lumiere.lightcolor)
+                set_if_changed(emit.inputs[1], "default_value", cobj.Lumiere.energy)
             else:     
                 update_lamp(self, context, cobj)
 
 #########################################################################################################
 
+#########################################################################################################
+# global variable to store the lights registry in : {scene name : {lightname : object name}}
+Lumiere_lights = {}
+
+# global variable to store the companions searched in vain in : {scene name : (number of objects, {data name})}
+Lumiere_no_companion = {}
+
+def light_registry(context):
+    """Return the lights registry of the scene, build it if it doesn't exist yet"""
+
+    registry = Lumiere_lights.get(context.scene.name)
+    if registry is None:
+        registry = light_registry_rebuild(context)
+
+    return(registry)
+
+def light_registry_rebuild(context):
+    """Scan the scene one time to index all the Lumiere objects by lightname"""
+
+    registry = {}
+    for ob in context.scene.objects:
+        if ob.type != 'EMPTY' and ob.Lumiere.lightname != "":
+            registry[ob.Lumiere.lightname] = ob.name
+    Lumiere_lights[context.scene.name] = registry
+
+    return(registry)
+
+def light_registry_add(context, obj):
+    """Add or update the object in the lights registry"""
+
+    light_registry(context)[obj.Lumiere.lightname] = obj.name
+    Lumiere_no_companion.get(context.scene.name, (0, set()))[1].discard(obj.Lumiere.lightname)
+
+def light_registry_remove(context, obj):
+    """Remove the object from the lights registry"""
+
+    registry = light_registry(context)
+    if registry.get(obj.Lumiere.lightname) == obj.name:
+        del registry[obj.Lumiere.lightname]
+
+def light_registry_lookup(context, lightname, objects = None):
+    """Return the object registered with this lightname, rebuild the registry if it is stale"""
+
+    if objects is None:
+        objects = context.scene.objects
+
+    def registered(registry):
+        name = registry.get(lightname)
+        ob = objects.get(name) if name is not None else None
+        if ob is not None and ob.type != 'EMPTY' and ob.Lumiere.lightname == lightname:
+            return(ob)
+        return(None)
+
+    ob = registered(light_registry(context))
+
+#---Stale registry (renamed, removed or undone objects) : rebuild it one time
+    if ob is None:
+        ob = registered(light_registry_rebuild(context))
+
+    return(ob)
+
+@persistent
+def light_registry_reset(dummy):
+    """Forget all the registries and the proxies of the environment images after undo / redo / loading a file"""
+    Lumiere_lights.clear()
+    Lumiere_no_companion.clear()
+    Lumiere_proxy.clear()
+
+#########################################################################################################
+
 #########################################################################################################
 def get_object(context, lightname):
     """Return the object with this name"""
 
-    for ob in context.scene.objects:
-        if ob.type != 'EMPTY' and ob.Lumiere.lightname == lightname:
-            cobj = ob
+    cobj = light_registry_lookup(context, lightname)
 
     return(cobj)
 
@@ -3459,46 +4421,63 @@ def add_driver(source, target, prop, dataPath,index = -1, negative = False, func
     d.expression = d.expression if not negative else "-1 * " + d.expression 
 #########################################################################################################
 
+#########################################################################################################
+def get_companion(context, cobj, objects):
+    """Return the softbox, lamp or widget linked to the duplivert, None if there is none"""
+
+    if cobj.Lumiere.typlight == "Panel":
+        data_name = "SOFTBOX_" + cobj.data.name
+    elif cobj.Lumiere.typlight != "Env":
+        data_name = "LAMP_" + cobj.data.name
+    else:
+        data_name = "WORLD_" + cobj.data.name
+
+#---Already searched in vain, as long as no object was added or removed from the scene
+    count = len(context.scene.objects)
+    missing = Lumiere_no_companion.get(context.scene.name)
+    if missing is not None and missing[0] == count and data_name in missing[1]:
+        return(None)
+
+#---The companions are registered with the name of their data
+    companion = light_registry_lookup(context, data_name, objects)
+    if companion is not None and companion.data.name == data_name:
+        return(companion)
+
+#---Not registered : search it and keep the result for the next time
+    companion = None
+    for ob in objects:
+        if ob.type != 'EMPTY' and ob.data.name == data_name:
+            companion = ob
+
+    if companion is not None and companion.name in context.scene.objects:
+        light_registry_add(context, companion)
+    elif companion is None:
+        if missing is None or missing[0] != count:
+            missing = Lumiere_no_companion[context.scene.name] = (count, set())
+        missing[1].add(data_name)
+
+    return(companion)
+
+#########################################################################################################
+
 #########################################################################################################
 def get_lamp(context, lightname):
     """Return the lamp with this name"""
-    
+
     cobj = get_object(context, lightname)
-    if cobj.Lumiere.typlight == "Panel":
-        for ob in context.scene.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "SOFTBOX_" + cobj.data.name:
-                cobj = ob           
-    elif cobj.Lumiere.typlight != "Env":
-        for ob in context.scene.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "LAMP_" + cobj.data.name:
-                cobj = ob 
-    elif cobj.Lumiere.typlight == "Env":    
-        for ob in context.scene.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "WORLD_" + cobj.data.name :
-                cobj = ob
-    return(cobj)
+    lamp = get_companion(context, cobj, context.scene.objects)
+
+    return(lamp if lamp is not None else cobj)
 #########################################################################################################
 
 #########################################################################################################
 def get_delete_lamp(context, lightname):
     """Change to option : return the lamp with this name"""
-    
-    cobj = get_object(context, lightname)
 
-    if cobj.Lumiere.typlight == "Panel":
-        for ob in bpy.data.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "SOFTBOX_" + cobj.data.name:
-                cobj = ob           
-    elif cobj.Lumiere.typlight != "Env":
-        for ob in bpy.data.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "LAMP_" + cobj.data.name:
-                cobj = ob 
-    elif cobj.Lumiere.typlight == "Env":    
-        for ob in bpy.data.objects:
-            if ob.type != 'EMPTY' and ob.data.name == "WORLD_" + cobj.data.name:
-                cobj = ob
+    cobj = get_object(context, lightname)
+    lamp = get_companion(context, cobj, bpy.data.objects)
 
-    return(cobj)
+    return(lamp if lamp is not None else cobj)
 #########################################################################################################
 
 #########################################################################################################
@@ -3826,9 +4805,9 @@ def update_close_projector(self, context):
         
         if obj_light.Lumiere.typlight == "Panel":
             mat_name, mat = get_mat_name("SOFTBOX_" + obj_light.data.name)
-            emit = mat.node_tree.nodes["Emission"]
+            shading = mat.node_tree.nodes["Softbox_Shading"]
             output = mat.node_tree.nodes["Material Output"]
-            mat.node_tree.links.new(emit.outputs[0], output.inputs[0])
+            mat.node_tree.links.new(shading.outputs["Emission"], output.inputs[0])
     else:
     #---Remove the base projector   
         for ob in bpy.context.scene.objects:
@@ -3839,9 +4818,9 @@ def update_close_projector(self, context):
         
         if obj_light.Lumiere.typlight == "Panel":
             mat_name, mat = get_mat_name("SOFTBOX_" + obj_light.data.name)
-            mix = mat.node_tree.nodes["Mix Shader.001"]
+            shading = mat.node_tree.nodes["Softbox_Shading"]
             output = mat.node_tree.nodes["Material Output"]
-            mat.node_tree.links.new(mix.outputs[0], output.inputs[0])
+            mat.node_tree.links.new(shading.outputs["Shader"], output.inputs[0])
 
 #########################################################################################################
 
@@ -3863,18 +4842,19 @@ def update_projector_mat(self, context):
 
     projector = bpy.data.objects["PROJECTOR_" + obj_light.data.name]
     mat_name, mat = get_mat_name(projector.data.name)
+#---Material missing or built by a previous template
+    if mat is None or mat.get("lumiere_version") != Lumiere_templates_version:
+        mat = projector_mat(projector)
+        projector.active_material = mat
     img_text = mat.node_tree.nodes['Image Texture']
-    saturation = mat.node_tree.nodes['Mix']
-    contrast = mat.node_tree.nodes['Bright/Contrast']
-    gamma = mat.node_tree.nodes['Gamma']
-    invert = mat.node_tree.nodes['Invert']
-    transparent = mat.node_tree.nodes['Transparent BSDF.001']
-
-    saturation.inputs['Fac'].default_value = obj_light.Lumiere.projector_img_saturation
-    gamma.inputs['Gamma'].default_value = obj_light.Lumiere.projector_img_gamma
-    contrast.inputs['Bright'].default_value = obj_light.Lumiere.projector_img_bright
-    contrast.inputs['Contrast'].default_value = obj_light.Lumiere.projector_img_contrast
-    invert.inputs['Fac'].default_value = obj_light.Lumiere.projector_img_invert
+    adjust = mat.node_tree.nodes['Projector_Adjust']
+    transparent = mat.node_tree.nodes['Projector_Color']
+
+    set_if_changed(adjust.inputs['Saturation'], "default_value", obj_light.Lumiere.projector_img_saturation)
+    set_if_changed(adjust.inputs['Gamma'], "default_value", obj_light.Lumiere.projector_img_gamma)
+    set_if_changed(adjust.inputs['Bright'], "default_value", obj_light.Lumiere.projector_img_bright)
+    set_if_changed(adjust.inputs['Contrast'], "default_value", obj_light.Lumiere.projector_img_contrast)
+    set_if_changed(adjust.inputs['Invert'], "default_value", obj_light.Lumiere.projector_img_invert)
     
     if obj_light.Lumiere.projector_img_reset: 
         obj_light.Lumiere.projector_img_reset = False
@@ -3898,8 +4878,17 @@ def update_projector_mat(self, context):
                 
     elif obj_light.Lumiere.projector_options == "Texture":
         if obj_light.Lumiere.projector_img_name != "":
-            img_text.image = bpy.data.images[obj_light.Lumiere.projector_img_name]
-            mat.node_tree.links.new(invert.outputs[0], transparent.inputs['Color'])
+            name = obj_light.Lumiere.projector_img_name
+            slot = "PROJECTOR_" + obj_light.data.name
+        #---Bake of the options sampled directly, the Repeat_Texture group still maps the coordinates
+            image = bake_lookup(img_text, slot, name, projector_values(obj_light), lambda: bpy.data.images[name])
+            if img_text.image != image:
+                bake_use(image)
+            set_if_changed(img_text, "image", image)
+            if image.name.startswith("BAKE_"):
+                link_sockets(mat.node_tree, img_text.outputs[0], transparent.inputs['Color'])
+            else:
+                link_sockets(mat.node_tree, adjust.outputs[0], transparent.inputs['Color'])
         else:
             if transparent.inputs['Color'].links:
                 mat.node_tree.links.remove(transparent.inputs['Color'].links[0])
@@ -3995,23 +4984,222 @@ class SCENE_OT_select_target(Operator):
 #########################################################################################################
 
 #########################################################################################################
-class SCENE_OT_select_pixel(Operator):
-    """Align the environment background with the selected pixel"""
-    
-    bl_idname = "object.select_pixel"
-    bl_description = "Target the selected pixel from the image texture and compute the rotation.\n"+\
-                     "Use this to align a sun or a lamp from your image."
-    bl_label = "Select pixel"
-    act_light = bpy.props.StringProperty()
-    img_name = bpy.props.StringProperty()
+#---Width of the levels of the search of the brightest pixels : candidates, then refinement
+Lumiere_hdri_levels = (256, 2048)
+
+#########################################################################################################
+def hdri_pixels(image, width):
+    """Return the pixels of a copy of the image scaled to width, as a numpy array (rows, columns, channels)"""
+
+    width = min(width, image.size[0])
+    height = max(1, int(image.size[1] * width / image.size[0]))
+    copy = image.copy()
+    try:
+        copy.scale(width, height)
+        pixels = np.empty(width * height * copy.channels, dtype=np.float32)
+        try:
+            copy.pixels.foreach_get(pixels)
+        except AttributeError:
+            pixels[:] = copy.pixels[:]
+    finally:
+        bpy.data.images.remove(copy)
+
+    return(pixels.reshape(height, width, -1))
+#########################################################################################################
+
+#########################################################################################################
+def hdri_energy(pixels):
+    """Return the luminance of the pixels weighted by the solid angle of their row in an equirectangular map"""
+
+    height = pixels.shape[0]
+    luminance = pixels[:, :, 0] * 0.2126 + pixels[:, :, 1] * 0.7152 + pixels[:, :, 2] * 0.0722
+    latitude = ((np.arange(height) + .5) / height - .5) * math.pi
+
+    return(luminance * np.cos(latitude)[:, None])
+#########################################################################################################
+
+#########################################################################################################
+def hdri_block_mean(values, factor):
+    """Return the mean of each block of factor x factor values, the last rows and columns smaller than a block are left"""
+
+    height, width = values.shape[0] // factor, values.shape[1] // factor
+
+    return(values[:height * factor, :width * factor].reshape(height, factor, width, factor).mean(axis=(1, 3)))
+#########################################################################################################
+
+#########################################################################################################
+def hdri_key_lights(image, count=1):
+    """Return the count brightest light sources of the image : [(x, y, energy)] in pixels of the image"""
+
+#---One copy of the image for the refinement, the candidates level is averaged from it
+    coarse_width, fine_width = Lumiere_hdri_levels
+    fine = hdri_energy(hdri_pixels(image, fine_width))
+    fine_height, fine_width = fine.shape
+    ratio_x = ratio_y = max(1, min(fine_width // coarse_width, fine_height))
+    coarse = hdri_block_mean(fine, ratio_x)
+    coarse_height, coarse_width = coarse.shape
+
+#---Candidates on the small image, the neighbours of a source are removed before the next one
+    radius = max(1, coarse_width // 32)
+    candidates = []
+    energy = coarse.copy()
+    for i in range(count):
+        y, x = np.unravel_index(np.argmax(energy), energy.shape)
+        if energy[y, x] <= 0:
+            break
+        candidates.append((x, y))
+        columns = np.arange(x - radius, x + radius + 1) % coarse_width
+        energy[max(0, y - radius):y + radius + 1, columns] = 0
+
+#---Brightest pixel of the bigger image around each candidate
+    lights = []
+    for x, y in candidates:
+        x0 = int((x - 1) * ratio_x)
+        y0 = max(0, int((y - 1) * ratio_y))
+        columns = np.arange(x0, int((x + 2) * ratio_x)) % fine_width
+        window = fine[y0:int((y + 2) * ratio_y), columns]
+        wy, wx = np.unravel_index(np.argmax(window), window.shape)
+        lights.append(((columns[wx] + .5) * image.size[0] / fine_width,
+                       (y0 + wy + .5) * image.size[1] / fine_height,
+                       float(window[wy, wx])))
+
+    return(lights)
+#########################################################################################################
+
+#########################################################################################################
+#---Width of the image used to extract the lights of an HDRI
+Lumiere_hdri_extract_width = 1024
+
+#########################################################################################################
+def hdri_median_cut(image, count):
+    """Split the image in count regions of the same energy (median cut),
+    return [(u, v, (r, g, b))] : center of energy of each region between 0 and 1 and its irradiance"""
+
+    pixels = hdri_pixels(image, Lumiere_hdri_extract_width)
+    height, width = pixels.shape[:2]
+    cos_lat = np.cos(((np.arange(height) + .5) / height - .5) * math.pi)[:, None]
+    energy = hdri_energy(pixels)
+    solid_angle = (2 * math.pi / width) * (math.pi / height)
+
+#---Summed area tables : energy, center of energy and color of any rectangle in constant time
+    def table(values):
+        sat = np.zeros((height + 1, width + 1))
+        sat[1:, 1:] = np.cumsum(np.cumsum(values, axis=0), axis=1)
+        return(sat)
+
+    columns = np.arange(width) + .5
+    rows = (np.arange(height) + .5)[:, None]
+    tables = [table(energy), table(energy * columns), table(energy * rows)] + \
+             [table(pixels[:, :, c] * cos_lat * solid_angle) for c in range(3)]
+
+    def total(sat, y0, y1, x0, x1):
+        return(sat[y1, x1] - sat[y0, x1] - sat[y1, x0] + sat[y0, x0])
+
+#---Split the region with the most energy until there are enough regions
+    regions = [(-total(tables[0], 0, height, 0, width), 0, height, 0, width)]
+    while len(regions) < count:
+        e, y0, y1, x0, x1 = heapq.heappop(regions)
+        if (y1 - y0) < 2 and (x1 - x0) < 2:
+            heapq.heappush(regions, (e, y0, y1, x0, x1))
+            break
+
+    #---Cut the longest side, the width is shorter near the poles : a pixel covers the same angle in both directions
+        latitude = ((y0 + y1) / 2 / height - .5) * math.pi
+        if (x1 - x0) >= 2 and ((y1 - y0) < 2 or (x1 - x0) * math.cos(latitude) >= (y1 - y0)):
+            sums = tables[0][y1, x0 + 1:x1] - tables[0][y0, x0 + 1:x1] - tables[0][y1, x0] + tables[0][y0, x0]
+            cut = x0 + 1 + min(int(np.searchsorted(sums, -e / 2)), x1 - x0 - 2)
+            halves = ((y0, y1, x0, cut), (y0, y1, cut, x1))
+        else:
+            sums = tables[0][y0 + 1:y1, x1] - tables[0][y0 + 1:y1, x0] - tables[0][y0, x1] + tables[0][y0, x0]
+            cut = y0 + 1 + min(int(np.searchsorted(sums, -e / 2)), y1 - y0 - 2)
+            halves = ((y0, cut, x0, x1), (cut, y1, x0, x1))
+
+        for half in halves:
+            heapq.heappush(regions, (-total(tables[0], *half), ) + half)
+
+#---Center of energy and color of each region
+    lights = []
+    for e, y0, y1, x0, x1 in regions:
+        e = -e
+        if e <= 0:
+            continue
+        u = total(tables[1], y0, y1, x0, x1) / e / width
+        v = total(tables[2], y0, y1, x0, x1) / e / height
+        lights.append((u, v, tuple(total(sat, y0, y1, x0, x1) for sat in tables[3:])))
+
+    return(lights)
+#########################################################################################################
+
+#########################################################################################################
+def hdri_direction(u, v, mapping):
+    """Return the world direction of a point of an equirectangular image seen through the world mapping"""
+
+    phi = (.5 - u) * 2 * math.pi
+    theta = (v - .5) * math.pi
+    direction = Vector((math.cos(theta) * math.cos(phi), math.cos(theta) * math.sin(phi), math.sin(theta)))
+
+#---The mapping rotates the direction of the world to the direction in the image
+    rotation = Euler(mapping.rotation).to_matrix()
+    if mapping.vector_type == 'TEXTURE':
+        return(rotation * direction)
+    return(rotation.transposed() * direction)
+#########################################################################################################
+
+#########################################################################################################
+class SCENE_OT_select_pixel(Operator):
+    """Align the environment background with the selected pixel"""
+    
+    bl_idname = "object.select_pixel"
+    bl_description = "Target the selected pixel from the image texture and compute the rotation.\n"+\
+                     "Use this to align a sun or a lamp from your image."
+    bl_label = "Select pixel"
+    act_light = bpy.props.StringProperty()
+    img_name = bpy.props.StringProperty()
     img_type = bpy.props.StringProperty()
     img_size_x = bpy.props.FloatProperty()
     img_size_y = bpy.props.FloatProperty()
+#---Find the brightest light sources of the image instead of picking a pixel
+    find_key = bpy.props.BoolProperty(default=False)
+    key_count = bpy.props.IntProperty(default=3, min=1)
+    key_index = bpy.props.IntProperty(default=0, min=0)
 
     def remove_handler(self):
         if self._handle:
             bpy.types.SpaceImageEditor.draw_handler_remove(self._handle, 'WINDOW')
         self._handle = None
+
+    def align_to_pixel(self, obj_light, x, y):
+        """Rotate the image to align the light with the pixel"""
+
+        rot_x = ((x * 360) / self.img_size_x) - 90
+        rot_y = ((y * 180) / self.img_size_y)
+        if self.img_type == "HDRI":
+            obj_light.Lumiere.hdri_rotation = rot_x - 180 + math.degrees(obj_light.rotation_euler.z)
+            obj_light.Lumiere.hdri_rotationy = rot_y - 180
+            obj_light.Lumiere.hdri_pix_rot = rot_x - 180
+            obj_light.Lumiere.hdri_pix_roty = rot_y - 180
+        else:
+            obj_light.Lumiere.img_rotation = rot_x - 180 + math.degrees(obj_light.rotation_euler.z)
+            obj_light.Lumiere.img_pix_rot = rot_x - 180             
+
+    def find_key_light(self, context):
+        """Align the light with one of the brightest light sources of the image"""
+
+        start = time.time()
+        image = bpy.data.images[self.img_name]
+        lights = hdri_key_lights(image, max(self.key_count, self.key_index + 1))
+        if not lights:
+            self.report({'WARNING'}, "No light found in " + image.name)
+            return {'CANCELLED'}
+
+        self.img_size_x, self.img_size_y = image.size
+        x, y, energy = lights[min(self.key_index, len(lights) - 1)]
+        self.align_to_pixel(bpy.data.objects[self.act_light], x, y)
+
+        message = "Key light at " + "%d, %d" % (x, y) + " in " + "%.3f" % (time.time() - start) + "s, sources : " + \
+                  ", ".join("%d, %d (%.0f%%)" % (lx, ly, 100 * le / lights[0][2]) for lx, ly, le in lights)
+        self.report({'INFO'}, message)
+        return {'FINISHED'}
     
     def execute(self, context):
         if self.act_light != "": 
@@ -4052,70 +5240,1553 @@ class SCENE_OT_select_pixel(Operator):
                                         y = int(self.img_size_y * uv[1]) % self.img_size_y
                                         self.mouse_path = (x,y)
 
-                elif event.type == 'LEFTMOUSE':
-                    return{'PASS_THROUGH'}  
-                    
-                elif event.type == 'RIGHTMOUSE':
-                    obj_light = bpy.data.objects[self.act_light]
-                    rot_x = ((self.mouse_path[0] * 360) / self.img_size_x) - 90
-                    rot_y = ((self.mouse_path[1] * 180) / self.img_size_y)
-                    if self.img_type == "HDRI":
-                        obj_light.Lumiere.hdri_rotation = rot_x - 180 + math.degrees(obj_light.rotation_euler.z)
-                        obj_light.Lumiere.hdri_rotationy = rot_y - 180
-                        obj_light.Lumiere.hdri_pix_rot = rot_x - 180
-                        obj_light.Lumiere.hdri_pix_roty = rot_y - 180
-                    else:
-                        obj_light.Lumiere.img_rotation = rot_x - 180 + math.degrees(obj_light.rotation_euler.z)
-                        obj_light.Lumiere.img_pix_rot = rot_x - 180             
-                        
-                    bpy.context.window.cursor_modal_set("DEFAULT")
-                    self.remove_handler()
-                    if context.area.type == 'IMAGE_EDITOR':
-                        context.area.type = 'VIEW_3D'
-                    return {'FINISHED'}
-                    
-                elif event.type == 'ESC':
-                    bpy.context.window.cursor_modal_set("DEFAULT")
-                    context.area.header_text_set()
-                    self.remove_handler()
-                    if context.area.type == 'IMAGE_EDITOR':
-                        context.area.type = 'VIEW_3D'   
-                    return {'CANCELLED'}
-                    
-                return {'RUNNING_MODAL'}
+                elif event.type == 'LEFTMOUSE':
+                    return{'PASS_THROUGH'}  
+                    
+                elif event.type == 'RIGHTMOUSE':
+                    obj_light = bpy.data.objects[self.act_light]
+                    self.align_to_pixel(obj_light, self.mouse_path[0], self.mouse_path[1])
+                        
+                    bpy.context.window.cursor_modal_set("DEFAULT")
+                    self.remove_handler()
+                    if context.area.type == 'IMAGE_EDITOR':
+                        context.area.type = 'VIEW_3D'
+                    return {'FINISHED'}
+                    
+                elif event.type == 'ESC':
+                    bpy.context.window.cursor_modal_set("DEFAULT")
+                    context.area.header_text_set()
+                    self.remove_handler()
+                    if context.area.type == 'IMAGE_EDITOR':
+                        context.area.type = 'VIEW_3D'   
+                    return {'CANCELLED'}
+                    
+                return {'RUNNING_MODAL'}
+
+        except Exception as error:
+            print("Error to report : ", error)  
+            bpy.context.window.cursor_modal_set("DEFAULT")
+            context.area.header_text_set()
+            self.remove_handler()
+
+            return {'FINISHED'}
+    
+
+    def invoke(self, context, event):
+        if self.find_key:
+            return self.find_key_light(context)
+
+        self.mouse_path = [0,0]
+        if context.space_data.type == 'VIEW_3D':
+            context.area.type = 'IMAGE_EDITOR'
+            t_panel = context.area.regions[2]
+            n_panel = context.area.regions[3]
+            self.view_3d_region_x = Vector((context.area.x + t_panel.width, context.area.x + context.area.width - n_panel.width))
+
+            self.execute(context)
+            self.img_size = [self.img_size_x, self.img_size_y]
+            args = (self, context, event)
+            self.lumiere_area = context.area
+
+            context.window_manager.modal_handler_add(self)
+            self._handle = bpy.types.SpaceImageEditor.draw_handler_add(draw_target_px, args, 'WINDOW', 'POST_PIXEL')
+    
+        
+        return {'RUNNING_MODAL'}
+                
+#########################################################################################################
+
+#########################################################################################################
+def hdri_light_specs(image, count, light_type, mapping, strength, distance):
+    """Return the specs of create_lights_batch for the lights of the image, with the irradiance of the background strength"""
+
+    specs = []
+    for u, v, color in hdri_median_cut(image, count):
+        color = [c * strength for c in color]
+        irradiance = max(color)
+        if irradiance <= 0:
+            continue
+        direction = hdri_direction(u, v, mapping)
+        spec = {"typlight": light_type,
+                "name": "HDRI_" + light_type,
+                "rotation": tuple(direction.to_track_quat('Z', 'Y').to_euler()),
+                "lightcolor": [c / irradiance for c in color] + [1.0],
+                "energy": irradiance}
+    #---Same irradiance at the center of the scene for the area lights
+        if light_type == "Area":
+            spec["location"] = tuple(direction * distance)
+            spec["energy"] = irradiance * math.pi * distance ** 2
+        specs.append(spec)
+
+    return(specs)
+#########################################################################################################
+
+#########################################################################################################
+class SCENE_OT_extract_hdri_lights(Operator):
+    """Replace the environment image by a few lights with the same direction, color and energy"""
+
+    bl_idname = "object.extract_hdri_lights"
+    bl_label = "Extract lights"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    act_light = bpy.props.StringProperty()
+    count = bpy.props.IntProperty(name="Lights", description="Number of lights to create", default=8, min=1, max=256)
+    light_type = EnumProperty(name="Type",
+                              description="Type of the lights to create.\nSelected",
+                              items=(
+                              ("Sun", "Sun light", "", 0),
+                              ("Area", "Area light", "", 1),
+                              ),
+                              default="Sun")
+    distance = FloatProperty(name="Distance", description="Distance of the area lights from the center of the scene", default=10, min=0.01, subtype='DISTANCE', unit='LENGTH')
+    dim = FloatProperty(name="Dim environment", description="Lower the strength of the environment image", default=0, min=0, max=1, subtype='FACTOR')
+
+    def execute(self, context):
+        start = time.time()
+        cobj = bpy.data.objects.get(self.act_light) or context.active_object
+        image = bpy.data.images.get(cobj.Lumiere.hdri_name) if cobj is not None else None
+        if image is None:
+            self.report({'ERROR'}, "No environment image to extract the lights from")
+            return {'CANCELLED'}
+        if image.size[0] == 0 or image.size[1] == 0:
+            self.report({'ERROR'}, "The environment image " + image.name + " has no pixels")
+            return {'CANCELLED'}
+
+        world = context.scene.world
+        mapping = world.node_tree.nodes['Mapping']
+    #---The lights give the irradiance of the environment as it is rendered, with the strength of the background
+        background = world.node_tree.nodes['Background']
+        strength = background.inputs[1].default_value
+
+        specs = hdri_light_specs(image, self.count, self.light_type, mapping, strength, self.distance)
+        timing = OrderedDict([("median cut", time.time() - start)])
+
+        lights, batch_timing = create_lights_batch(context, specs)
+        timing.update(batch_timing)
+
+    #---Keep the new lights together
+        group = bpy.data.groups.new("HDRI_" + image.name)
+        for dupli in lights:
+            group.objects.link(dupli)
+
+        if self.dim > 0:
+            background.inputs[1].default_value = strength * (1 - self.dim)
+
+        self.report({'INFO'}, timing_message(str(len(lights)) + " lights extracted from " + image.name, timing))
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# LIBRARY STORE
+#########################################################################################################
+"""
+#---Lights library : an append-only log of JSON records and an index checkpoint
+#---Each line of the log is {"name": ..., "record": {...}} or {"name": ..., "deleted": true}
+#---The index holds the offset of the last record of each light with its group and definition
+Lumiere_library_name = "lumiere_library"
+Lumiere_library_version = 2
+Lumiere_library = {}
+
+#---Set by the background Blender of the thumbnails : read the library, never write the index or the log
+Lumiere_library_readonly = False
+
+#---Lists of the import dialogs built from the index, keyed like the index by path, mtime and size of the log
+Lumiere_library_lists = {"key": None, "lights": [], "groups": {}, "count": {}}
+
+#########################################################################################################
+def library_path(extension):
+    """Return the path of a library file next to the addon"""
+
+    return(os.path.join(os.path.dirname(__file__), Lumiere_library_name + extension))
+#########################################################################################################
+
+#########################################################################################################
+def library_meta(record, offset, length, content_hash):
+    """Return the index entry of a record : position in the log, hash of the line and the data needed by the lists"""
+
+    lumiere = record.get("Lumiere", {})
+    return({"offset": offset,
+            "length": length,
+            "hash": content_hash,
+            "group": record.get("group", {}),
+            "Lumiere": {"typlight": lumiere.get("typlight", 0),
+                        "definition": lumiere.get("definition", " ")}})
+#########################################################################################################
+
+#########################################################################################################
+def library_scan(index, start):
+    """Read the log from start and update the index with the new records"""
+
+    path = library_path(".log")
+    offset = start
+    with open(path, 'rb') as file:
+        file.seek(start)
+        for line in file:
+        #---Stop at a line not fully written
+            if not line.endswith(b"\n"):
+                break
+            try:
+                entry = json.loads(line.decode('utf-8'))
+            except ValueError:
+                offset += len(line)
+                index["dead"] += len(line)
+                continue
+
+            name = entry["name"]
+            if name in index["entries"]:
+                index["dead"] += index["entries"][name]["length"]
+            if entry.get("deleted"):
+                index["entries"].pop(name, None)
+                index["dead"] += len(line)
+            else:
+                index["entries"][name] = library_meta(entry["record"], offset, len(line), hashlib.sha1(line).hexdigest())
+            offset += len(line)
+
+    index["log_size"] = offset
+    return(index)
+#########################################################################################################
+
+#########################################################################################################
+def library_key():
+    """Return the path, modification time and size of the log"""
+
+    path = library_path(".log")
+    stat = os.stat(path)
+    return((path, stat.st_mtime_ns, stat.st_size))
+#########################################################################################################
+
+#########################################################################################################
+def library_save_index(index):
+    """Write the index checkpoint"""
+
+    path = library_path(".idx")
+    checkpoint = {"version": Lumiere_library_version,
+                  "log_size": index["log_size"],
+                  "dead": index["dead"],
+                  "entries": index["entries"]}
+    with open(path + ".tmp", "w", encoding='utf-8') as file:
+        json.dump(checkpoint, file, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+#########################################################################################################
+
+#########################################################################################################
+def library_migrate():
+    """Move the lights of the old lumiere_dictionary.json in the log"""
+
+    path = os.path.join(os.path.dirname(__file__), "lumiere_dictionary.json")
+    if not os.path.exists(path):
+        return
+
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            my_dict = json.load(file)
+    except Exception as error:
+        print("Error to report : ", error)
+        return
+
+    library_write(my_dict)
+#########################################################################################################
+
+#########################################################################################################
+def library_index():
+    """Return the index of the library, only the new records of the log are read"""
+
+    global Lumiere_library
+    log_path = library_path(".log")
+
+    if not os.path.exists(log_path) and not Lumiere_library_readonly:
+        open(log_path, 'ab').close()
+        if os.path.exists(library_path(".idx")):
+            os.remove(library_path(".idx"))
+        Lumiere_library = {}
+        library_migrate()
+
+    key = library_key()
+    log_size = key[2]
+    if Lumiere_library and Lumiere_library["key"] == key:
+        return(Lumiere_library["entries"])
+
+#---The log has been compacted, truncated or rewritten, start again from the checkpoint
+    if not Lumiere_library or Lumiere_library["log_size"] > log_size or \
+       (Lumiere_library["log_size"] == log_size and Lumiere_library["key"] != key):
+        try:
+            with open(library_path(".idx"), 'r', encoding='utf-8') as file:
+                index = json.load(file)
+            if index.get("version") != Lumiere_library_version or index["log_size"] > log_size:
+                raise ValueError("Index out of date")
+        except Exception:
+            index = {"log_size": 0, "dead": 0, "entries": {}}
+        index.pop("version", None)
+        index["key"] = None
+        Lumiere_library = index
+
+    checkpoint = Lumiere_library["log_size"]
+    library_scan(Lumiere_library, checkpoint)
+    if Lumiere_library["log_size"] != checkpoint and not Lumiere_library_readonly:
+        library_save_index(Lumiere_library)
+    Lumiere_library["key"] = key
+
+    return(Lumiere_library["entries"])
+#########################################################################################################
+
+#########################################################################################################
+def library_read(names):
+    """Return the records of the lights names, only these lines of the log are read"""
+
+    index = library_index()
+    records = {}
+    with open(library_path(".log"), 'rb') as file:
+        for name in sorted(names, key=lambda name: index[name]["offset"] if name in index else 0):
+            if name not in index:
+                continue
+            file.seek(index[name]["offset"])
+            records[name] = json.loads(file.read(index[name]["length"]).decode('utf-8'))["record"]
+
+    return(records)
+#########################################################################################################
+
+#########################################################################################################
+def library_serialize(entry):
+    """Return the line of the log of an entry"""
+
+    return((json.dumps(entry, sort_keys=True, ensure_ascii=False) + "\n").encode('utf-8'))
+#########################################################################################################
+
+#########################################################################################################
+def library_append_data(data):
+    """Append the lines at the end of the log in one write, the records written by other processes are kept"""
+
+    library_index()
+    if data:
+        log_path = library_path(".log")
+
+    #---A line not fully written by an interrupted export is closed, the scan counts it as dead
+        with open(log_path, 'rb') as file:
+            file.seek(0, os.SEEK_END)
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    data = b"\n" + data
+
+        with open(log_path, 'ab') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+#---The size changed : the scan reads our lines and the lines appended by the other processes
+    library_index()
+    library_compact()
+#########################################################################################################
+
+#########################################################################################################
+def library_append(entries):
+    """Append the entries at the end of the log"""
+
+    library_append_data(b"".join(library_serialize(entry) for entry in entries))
+#########################################################################################################
+
+#########################################################################################################
+def library_write(my_dict):
+    """Add or replace the lights of the dictionary in the library"""
+
+    library_append({"name": name, "record": record} for name, record in my_dict.items())
+#########################################################################################################
+
+#########################################################################################################
+def library_remove(names):
+    """Remove the lights from the library"""
+
+    index = library_index()
+    library_append({"name": name, "deleted": True} for name in names if name in index)
+#########################################################################################################
+
+#########################################################################################################
+def library_remove_group(group):
+    """Remove the group from the lights of the library"""
+
+    index = library_index()
+    records = library_read([name for name, meta in index.items() if group in meta["group"]])
+    for record in records.values():
+        record["group"].pop(group, None)
+    library_write(records)
+#########################################################################################################
+
+#########################################################################################################
+def library_compact(force=False):
+    """Rewrite the log without the replaced and removed records when they take most of the file"""
+
+    global Lumiere_library
+    index = library_index()
+    if not force and (Lumiere_library["dead"] < 1048576 or Lumiere_library["dead"] * 2 < Lumiere_library["log_size"]):
+        return
+
+    log_path = library_path(".log")
+    entries = {}
+    offset = 0
+    with open(log_path, 'rb') as file, open(log_path + ".tmp", 'wb') as new_file:
+        for name in sorted(index, key=lambda name: index[name]["offset"]):
+            meta = index[name]
+            file.seek(meta["offset"])
+            line = file.read(meta["length"])
+            new_file.write(line)
+            entries[name] = dict(meta, offset=offset)
+            offset += len(line)
+
+    os.replace(log_path + ".tmp", log_path)
+    Lumiere_library = {"log_size": offset, "dead": 0, "entries": entries, "key": library_key()}
+    library_save_index(Lumiere_library)
+#########################################################################################################
+
+#########################################################################################################
+def library_group_members(context):
+    """Return the groups of each light, with their definition, in one pass over the groups"""
+
+    members = defaultdict(dict)
+    for group in bpy.data.groups:
+        definition = list(textwrap.wrap(group['Lumiere']['definition'], 50)) if "Lumiere" in group and "definition" in group['Lumiere'] else " "
+        for ob in group.objects:
+            if ob.type != 'EMPTY' and ob.data is not None and ob.data.name.startswith("Lumiere"):
+                members[ob.name][group.name] = definition
+
+    return(members)
+#########################################################################################################
+
+#########################################################################################################
+def export_groups_batch(context, group_names, path=None):
+    """Export the lights of the groups in one write to the library, or to the binary rig path,
+    return the number of lights and the time of each step"""
+
+    timing = OrderedDict()
+
+#---Membership of the lights
+    start = time.time()
+    members = library_group_members(context)
+    group_names = set(group_names)
+    lights = [name for name, groups in members.items() if group_names.intersection(groups)]
+    timing["index"] = time.time() - start
+
+#---Snapshot of the lights
+    start = time.time()
+    records = {}
+    for name in lights:
+        dupli = bpy.data.objects[name]
+        records.update(export_props_light(None, context, dupli.Lumiere.lightname, name, groups = members[name]))
+    timing["snapshot"] = time.time() - start
+
+#---One write to the log or to the rig
+    start = time.time()
+    if path is not None:
+        rig_write(path, records)
+    else:
+        library_append_data(b"".join(library_serialize({"name": name, "record": record}) for name, record in records.items()))
+    timing["write"] = time.time() - start
+
+    return(len(lights), timing)
+#########################################################################################################
+
+#########################################################################################################
+def library_lists():
+    """Return the lights, the groups definition and the number of lights by group of the library"""
+
+    global Lumiere_library_lists
+    index = library_index()
+    if Lumiere_library_lists["key"] == Lumiere_library["key"]:
+        return(Lumiere_library_lists)
+
+    groups = {}
+    members = defaultdict(list)
+    for name in sorted(index):
+        groups.update(index[name]["group"])
+        for group in index[name]["group"]:
+            members[group].append(name)
+
+    Lumiere_library_lists = {"key": Lumiere_library["key"],
+                             "lights": [(name, bool(index[name]["group"])) for name in sorted(index)],
+                             "groups": groups,
+                             "members": members,
+                             "count": Counter([group for meta in index.values() for group in meta["group"]])}
+
+    return(Lumiere_library_lists)
+#########################################################################################################
+
+#########################################################################################################
+def library_fill_lists(context):
+    """Update the lists of lights and groups of the import dialogs, only the changed items are written"""
+
+    scene = context.scene
+    lists = library_lists()
+
+#---Lights with or without group
+    collection = scene.Lumiere_all_lights_list
+    if [item.name for item in collection] != [name for name, in_group in lists["lights"]]:
+        collection.clear()
+        for name, in_group in lists["lights"]:
+            item = collection.add()
+            item.name = name
+    for item, (name, in_group) in zip(collection, lists["lights"]):
+        if item.all_light_in_group != in_group:
+            item.all_light_in_group = in_group
+
+#---Groups and number of lights in each one
+    collection = scene.Lumiere_groups_list
+    groups = sorted(lists["count"].items())
+    if [item.name for item in collection] != [group for group, nbr in groups]:
+        collection.clear()
+        for group, nbr in groups:
+            item = collection.add()
+            item.name = group
+    for item, (group, nbr) in zip(collection, groups):
+        if item.num != str(nbr):
+            item.num = str(nbr)
+
+    scene.Lumiere_all_lights_list_index = min(max(scene.Lumiere_all_lights_list_index, 0), len(scene.Lumiere_all_lights_list) - 1)
+    scene.Lumiere_groups_list_index = min(max(scene.Lumiere_groups_list_index, 0), len(scene.Lumiere_groups_list) - 1)
+
+    return(lists)
+#########################################################################################################
+
+#########################################################################################################
+#---Search index of the library : words of the names, groups and definitions, keyed like the index
+Lumiere_library_search = {"key": None, "words": {}, "sorted": [], "typlight": {}, "results": OrderedDict()}
+
+#---Number of searches kept, the least recently used is forgotten first
+Lumiere_library_search_results = 64
+
+#---Type of the lights in the library records
+Lumiere_library_types = ("Panel", "Point", "Sun", "Spot", "Area", "Sky", "Env")
+
+#---Items of the type filters of the lists
+Lumiere_filter_types = (
+                       ("All", "All types", "", 0),
+                       ("Panel", "Panel light", "", 1),
+                       ("Point", "Point light", "", 2),
+                       ("Sun", "Sun light", "", 3),
+                       ("Spot", "Spot light", "", 4),
+                       ("Area", "Area light", "", 5),
+                       ("Sky", "Sky Background", "", 6),
+                       ("Env", "Environment Background", "", 7),
+                       )
+
+#########################################################################################################
+def library_words(text):
+    """Return the words of a name or a description"""
+
+    if not isinstance(text, str):
+        text = " ".join(text)
+    return(re.findall(r"[^\W_]+", text.lower()))
+#########################################################################################################
+
+#########################################################################################################
+def library_search_index():
+    """Return the inverted index of the words of the library"""
+
+    global Lumiere_library_search
+    index = library_index()
+    if Lumiere_library_search["key"] == Lumiere_library["key"]:
+        return(Lumiere_library_search)
+
+    words = defaultdict(set)
+    typlight = {}
+    for name, meta in index.items():
+        typlight[name] = meta["Lumiere"]["typlight"]
+        for word in library_words(name) + library_words(meta["Lumiere"]["definition"]):
+            words[word].add(name)
+        for group, definition in meta["group"].items():
+            for word in library_words(group) + library_words(definition):
+                words[word].add(name)
+
+    Lumiere_library_search = {"key": Lumiere_library["key"],
+                              "words": words,
+                              "sorted": sorted(words),
+                              "typlight": typlight,
+                              "results": OrderedDict()}
+
+    return(Lumiere_library_search)
+#########################################################################################################
+
+#########################################################################################################
+def library_search_word(search, word):
+    """Return the lights with a word starting with word, or with a close word if none"""
+
+    words = search["sorted"]
+    found = set()
+    i = bisect.bisect_left(words, word)
+    while i < len(words) and words[i].startswith(word):
+        found |= search["words"][words[i]]
+        i += 1
+
+#---Nothing starts with the word, look for typing errors
+    if not found:
+        for close in difflib.get_close_matches(word, words, n=5, cutoff=0.75):
+            found |= search["words"][close]
+
+    return(found)
+#########################################################################################################
+
+#########################################################################################################
+def library_search(text, typlight="All"):
+    """Return the lights of the library matching all the words of the text and the type"""
+
+    search = library_search_index()
+    results = search["results"]
+    if (text, typlight) in results:
+        results.move_to_end((text, typlight))
+        return(results[(text, typlight)])
+
+    found = None
+    for word in library_words(text):
+        lights = library_search_word(search, word)
+        found = lights if found is None else found & lights
+    if found is None:
+        found = set(search["typlight"])
+
+    if typlight != "All":
+        typ = Lumiere_library_types.index(typlight)
+        found = {name for name in found if search["typlight"][name] == typ}
+
+    results[(text, typlight)] = found
+    if len(results) > Lumiere_library_search_results:
+        results.popitem(last=False)
+    return(found)
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# THUMBNAILS
+#########################################################################################################
+"""
+#---Previews of the lights of the library, rendered by a background Blender on a stage scene
+#---and cached on disk by the hash of the record
+#---failed : {hash : (number of failures, time of the last failure)}, index : entries of the library read by the last draw
+#---poll : time of the last look at the running renders
+Lumiere_thumbnails = {"running": {}, "pending": deque(), "failed": {}, "index": None, "poll": 0}
+Lumiere_thumbnails_jobs = 2
+Lumiere_thumbnails_size = 128
+
+#---Delay in seconds between two looks at the running renders
+Lumiere_thumbnails_poll = 0.5
+
+#---Delay in seconds before a failed thumbnail is rendered again, doubled after each failure, and the number of tries
+Lumiere_thumbnails_retry = 30
+Lumiere_thumbnails_tries = 4
+
+#########################################################################################################
+def thumbnail_path(content_hash, extension=".png"):
+    """Return the path of the thumbnail of a record"""
+
+    return(os.path.join(os.path.dirname(__file__), "lumiere_thumbnails", content_hash + extension))
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_start(name, content_hash):
+    """Render the thumbnail of the light in a background Blender"""
+
+    output = thumbnail_path(content_hash, "_tmp.png")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    module = os.path.splitext(os.path.basename(__file__))[0]
+    expr = "import sys; sys.path.insert(0, %r); import %s as lumiere; lumiere.Lumiere_library_readonly = True; " \
+           "lumiere.register_properties(); lumiere.thumbnail_stage_render(%r, %r)" % \
+           (os.path.dirname(__file__), module, name, output)
+
+    try:
+        process = subprocess.Popen([bpy.app.binary_path, "--background", "--factory-startup", "--python-expr", expr],
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError as error:
+        print("Error to report : ", error)
+        thumbnail_failed(content_hash)
+        return
+
+    Lumiere_thumbnails["running"][content_hash] = (process, output)
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_failed(content_hash):
+    """Count a failed render of the thumbnail"""
+
+    tries, last = Lumiere_thumbnails["failed"].get(content_hash, (0, 0))
+    Lumiere_thumbnails["failed"][content_hash] = (tries + 1, time.time())
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_retry(content_hash):
+    """Return True if the thumbnail never failed, or failed long enough ago to be rendered again"""
+
+    tries, last = Lumiere_thumbnails["failed"].get(content_hash, (0, 0))
+    return(tries == 0 or (tries < Lumiere_thumbnails_tries and
+                          time.time() - last > Lumiere_thumbnails_retry * 2 ** (tries - 1)))
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_poll():
+    """Collect the finished renders and start the next ones, return True if a render is finished"""
+
+    thumbnails = Lumiere_thumbnails
+    finished = False
+    for content_hash, (process, output) in list(thumbnails["running"].items()):
+        if process.poll() is None:
+            continue
+        del thumbnails["running"][content_hash]
+        finished = True
+        if process.returncode == 0 and os.path.exists(output):
+            os.replace(output, thumbnail_path(content_hash))
+            thumbnails["failed"].pop(content_hash, None)
+        else:
+            thumbnail_failed(content_hash)
+
+    while thumbnails["pending"] and len(thumbnails["running"]) < Lumiere_thumbnails_jobs:
+        thumbnail_start(*thumbnails["pending"].popleft())
+
+    return(finished)
+#########################################################################################################
+
+#########################################################################################################
+@persistent
+def thumbnail_update(scene):
+    """Look at the renders of the thumbnails a few times per second, redraw the views when one is finished"""
+
+    thumbnails = Lumiere_thumbnails
+    if not thumbnails["running"] and not thumbnails["pending"]:
+        return
+
+    now = time.time()
+    if now - thumbnails["poll"] < Lumiere_thumbnails_poll:
+        return
+    thumbnails["poll"] = now
+
+    if thumbnail_poll():
+        for window in bpy.context.window_manager.windows:
+            for area in window.screen.areas:
+                area.tag_redraw()
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_icon(name):
+    """Return the icon of the thumbnail of the light, 0 while it is rendered"""
+
+    pcoll = Lumiere_custom_icons.get("Thumbnails")
+    index = Lumiere_thumbnails["index"]
+    meta = (index if index is not None else library_index()).get(name)
+    if pcoll is None or meta is None:
+        return(0)
+
+    content_hash = meta["hash"]
+    if content_hash in pcoll:
+        return(pcoll[content_hash].icon_id)
+
+    path = thumbnail_path(content_hash)
+    if os.path.exists(path):
+        return(pcoll.load(content_hash, path, 'IMAGE').icon_id)
+
+    thumbnails = Lumiere_thumbnails
+    if content_hash not in thumbnails["running"] and thumbnail_retry(content_hash) and \
+       all(content_hash != pending for light, pending in thumbnails["pending"]):
+    #---Started by thumbnail_update, the draw code only asks for it
+        thumbnails["pending"].append((name, content_hash))
+
+    return(0)
+#########################################################################################################
+
+#########################################################################################################
+def thumbnail_stage_render(name, output):
+    """Render the light of the library on the stage, run by the background Blender"""
+
+    context = bpy.context
+    scene = context.scene
+    record = library_read([name])[name]
+
+#---Stage : floor, a sphere and the camera of the startup file
+    for ob in list(scene.objects):
+        if ob.type != 'CAMERA':
+            bpy.data.objects.remove(ob, do_unlink=True)
+
+    floor = new_plane_object(context, "Lumiere_stage_floor")
+    floor.scale = (10, 10, 1)
+    bpy.ops.mesh.primitive_uv_sphere_add(size=1, location=(0, 0, 1))
+    bpy.ops.object.shade_smooth()
+
+    camera = scene.camera
+    camera.location = (0, -7, 2.5)
+    camera.rotation_euler = (Vector((0, 0, 1)) - camera.location).to_track_quat('-Z', 'Y').to_euler()
+
+    scene.render.engine = 'CYCLES'
+    scene.cycles.samples = 32
+    scene.render.resolution_x = Lumiere_thumbnails_size
+    scene.render.resolution_y = Lumiere_thumbnails_size
+    scene.render.resolution_percentage = 100
+    scene.render.image_settings.file_format = 'PNG'
+    scene.render.use_file_extension = False
+    scene.render.filepath = output
+
+#---Same creation of the light as the import
+    importer = type("Lumiere_thumbnail_import", (), {"add_light": SCENE_OT_import_light.add_light,
+                                                     "add_lights": SCENE_OT_import_light.add_lights})()
+    importer.add_lights(context, {name: record})
+
+    bpy.ops.render.render(write_still=True)
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# BINARY RIG
+#########################################################################################################
+"""
+#---Binary rig file : header, fixed size records for the lights, the gradient stops, the other
+#---properties and the groups, then a table of all the strings (names, paths, descriptions)
+Lumiere_rig_magic = b"LUMR"
+Lumiere_rig_version = 1
+Lumiere_rig_extension = ".lumrig"
+Lumiere_rig_none = 0xFFFFFFFF
+
+#---magic, version, lights, gradient stops, properties, groups, strings
+Lumiere_rig_header = struct.Struct("<4sHxxIIIII")
+#---name, typlight, flags, location, rotation, scale, energy, color, smooth, repeat, interpolation,
+#---gradient start / count, properties start / count, groups start / count, definition, hdri path,
+#---image path, hdri color, image color
+Lumiere_rig_light = struct.Struct("<IBBxx3f3f3ff4fff10I4f4f")
+#---position, color
+Lumiere_rig_stop = struct.Struct("<f4f")
+#---key, type, size, integer or string, floats
+Lumiere_rig_prop = struct.Struct("<IBBxxi4f")
+#---name, definition
+Lumiere_rig_group = struct.Struct("<II")
+Lumiere_rig_offset = struct.Struct("<I")
+
+#---Flags of the light records
+RIG_ENERGY = 1
+RIG_COLOR = 2
+RIG_SMOOTH = 4
+RIG_GRADIENT = 8
+RIG_HDRI_COL = 16
+RIG_IMG_COL = 32
+RIG_DEFINITION_LIST = 64
+RIG_TYPLIGHT = 128
+
+#---Types of the properties
+RIG_INT = 0
+RIG_FLOAT = 1
+RIG_STRING = 2
+RIG_FLOATS = 3
+RIG_INTS = 4
+RIG_JSON = 5
+
+#########################################################################################################
+def rig_path(name):
+    """Return the path of a rig file next to the addon"""
+
+    return(os.path.join(os.path.dirname(__file__), "lumiere_rigs", bpy.path.clean_name(name) + Lumiere_rig_extension))
+#########################################################################################################
+
+#########################################################################################################
+def rig_pack_prop(key, value, string):
+    """Return the record of a property of the light"""
+
+    if isinstance(value, bool) or (isinstance(value, int) and -2**31 <= value < 2**31):
+        return(Lumiere_rig_prop.pack(string(key), RIG_INT, 1, int(value), 0, 0, 0, 0))
+    if isinstance(value, float):
+        return(Lumiere_rig_prop.pack(string(key), RIG_FLOAT, 1, 0, value, 0, 0, 0))
+    if isinstance(value, str):
+        return(Lumiere_rig_prop.pack(string(key), RIG_STRING, 1, string(value), 0, 0, 0, 0))
+    if isinstance(value, (list, tuple)) and len(value) <= 4:
+        if all(isinstance(v, float) for v in value):
+            return(Lumiere_rig_prop.pack(string(key), RIG_FLOATS, len(value), 0, *(list(value) + [0] * (4 - len(value)))))
+        if all(isinstance(v, int) and abs(v) < 2**24 for v in value):
+            return(Lumiere_rig_prop.pack(string(key), RIG_INTS, len(value), 0, *(list(value) + [0] * (4 - len(value)))))
+
+    return(Lumiere_rig_prop.pack(string(key), RIG_JSON, 1, string(json.dumps(value, sort_keys=True)), 0, 0, 0, 0))
+#########################################################################################################
+
+#########################################################################################################
+def rig_pack(lumiere_dict):
+    """Return the binary rig of the lights exported by export_props_light"""
+
+    strings = {}
+    def string(text):
+        if text not in strings:
+            strings[text] = len(strings)
+        return(strings[text])
+
+    def definition(value):
+        return(Lumiere_rig_none if isinstance(value, str) else string("\n".join(value)))
+
+    lights = []
+    stops = []
+    props = []
+    groups = []
+
+    for name, record in lumiere_dict.items():
+        lumiere = dict(record["Lumiere"])
+        flags = 0
+
+        energy = lumiere.pop("energy", 0.0)
+        flags |= RIG_ENERGY if "energy" in record["Lumiere"] else 0
+        color = list(lumiere.pop("lightcolor", (0.0, 0.0, 0.0, 0.0)))
+        flags |= RIG_COLOR if "lightcolor" in record["Lumiere"] else 0
+        typlight = lumiere.pop("typlight", 0)
+        flags |= RIG_TYPLIGHT if "typlight" in record["Lumiere"] else 0
+        light_definition = lumiere.pop("definition", " ")
+        flags |= RIG_DEFINITION_LIST if not isinstance(light_definition, str) else 0
+        flags |= RIG_SMOOTH if "smooth" in record else 0
+        flags |= RIG_GRADIENT if "gradient" in record else 0
+        flags |= RIG_HDRI_COL if "hdri_col" in record else 0
+        flags |= RIG_IMG_COL if "img_col" in record else 0
+
+    #---Gradient stops
+        gradient_start = len(stops)
+        for position, stop_color in sorted(record.get("gradient", {}).items(), key=lambda item: float(item[0])):
+            stops.append(Lumiere_rig_stop.pack(float(position), *stop_color))
+
+    #---Other properties of the light
+        props_start = len(props)
+        for key, value in sorted(lumiere.items()):
+            props.append(rig_pack_prop(key, value, string))
+
+    #---Groups of the light
+        groups_start = len(groups)
+        for group, group_definition in sorted(record["group"].items()):
+            groups.append(Lumiere_rig_group.pack(string(group), definition(group_definition)))
+
+        lights.append(Lumiere_rig_light.pack(
+            string(name), typlight, flags,
+            *record["location"], *record["rotation"], *record["scale"],
+            energy, *(color + [0.0] * (4 - len(color))),
+            record.get("smooth", 0.0), record.get("repeat", 0.0),
+            string(record["interpolation"]) if "interpolation" in record else Lumiere_rig_none,
+            gradient_start, len(stops) - gradient_start,
+            props_start, len(props) - props_start,
+            groups_start, len(groups) - groups_start,
+            definition(light_definition) if flags & RIG_DEFINITION_LIST else Lumiere_rig_none,
+            string(record["hdri_path"]) if "hdri_path" in record else Lumiere_rig_none,
+            string(record["img_path"]) if "img_path" in record else Lumiere_rig_none,
+            *record.get("hdri_col", (0.0, 0.0, 0.0, 0.0)), *record.get("img_col", (0.0, 0.0, 0.0, 0.0))))
+
+#---String table : offsets then utf-8 text
+    blob = [text.encode('utf-8') for text in strings]
+    offsets = [0]
+    for data in blob:
+        offsets.append(offsets[-1] + len(data))
+
+    return(b"".join([Lumiere_rig_header.pack(Lumiere_rig_magic, Lumiere_rig_version, len(lights), len(stops), len(props), len(groups), len(strings))] +
+                    lights + stops + props + groups +
+                    [Lumiere_rig_offset.pack(offset) for offset in offsets] + blob))
+#########################################################################################################
+
+#########################################################################################################
+def rig_write(path, lumiere_dict):
+    """Write the lights in a binary rig, the file is replaced only when fully written"""
+
+    data = rig_pack(lumiere_dict)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", 'wb') as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+#########################################################################################################
+
+#########################################################################################################
+def rig_unpack(data, names=None):
+    """Return the lights of a binary rig in the format of export_props_light, only the lights names if given"""
+
+    magic, version, nb_lights, nb_stops, nb_props, nb_groups, nb_strings = Lumiere_rig_header.unpack_from(data, 0)
+    if magic != Lumiere_rig_magic or version > Lumiere_rig_version:
+        raise ValueError("Not a Lumiere rig or version not supported")
+
+    lights_offset = Lumiere_rig_header.size
+    stops_offset = lights_offset + nb_lights * Lumiere_rig_light.size
+    props_offset = stops_offset + nb_stops * Lumiere_rig_stop.size
+    groups_offset = props_offset + nb_props * Lumiere_rig_prop.size
+    strings_offset = groups_offset + nb_groups * Lumiere_rig_group.size
+    blob_offset = strings_offset + (nb_strings + 1) * Lumiere_rig_offset.size
+
+    def string(index):
+        start, = Lumiere_rig_offset.unpack_from(data, strings_offset + index * Lumiere_rig_offset.size)
+        end, = Lumiere_rig_offset.unpack_from(data, strings_offset + (index + 1) * Lumiere_rig_offset.size)
+        return(bytes(data[blob_offset + start:blob_offset + end]).decode('utf-8'))
+
+    def definition(index):
+        if index == Lumiere_rig_none:
+            return(" ")
+        text = string(index)
+        return(text.split("\n") if text else [])
+
+    lumiere_dict = {}
+    for i in range(nb_lights):
+        values = Lumiere_rig_light.unpack_from(data, lights_offset + i * Lumiere_rig_light.size)
+        name = string(values[0])
+        if names is not None and name not in names:
+            continue
+
+        typlight, flags = values[1:3]
+        location, rotation, scale = values[3:6], values[6:9], values[9:12]
+        energy, color = values[12], list(values[13:17])
+        smooth, repeat, interpolation = values[17:20]
+        gradient_start, gradient_count, props_start, props_count, groups_start, groups_count = values[20:26]
+        light_definition, hdri_path, img_path = values[26:29]
+        hdri_col, img_col = list(values[29:33]), list(values[33:37])
+
+    #---Properties of the light
+        lumiere = {}
+        for p in range(props_start, props_start + props_count):
+            key, typ, size, integer, *floats = Lumiere_rig_prop.unpack_from(data, props_offset + p * Lumiere_rig_prop.size)
+            if typ == RIG_INT:
+                value = integer
+            elif typ == RIG_FLOAT:
+                value = floats[0]
+            elif typ == RIG_STRING:
+                value = string(integer)
+            elif typ == RIG_FLOATS:
+                value = floats[:size]
+            elif typ == RIG_INTS:
+                value = [int(v) for v in floats[:size]]
+            else:
+                value = json.loads(string(integer))
+            lumiere[string(key)] = value
+
+        if flags & RIG_ENERGY:
+            lumiere["energy"] = energy
+        if flags & RIG_COLOR:
+            lumiere["lightcolor"] = color
+        if flags & RIG_TYPLIGHT:
+            lumiere["typlight"] = typlight
+        lumiere["definition"] = definition(light_definition) if flags & RIG_DEFINITION_LIST else " "
+
+        record = {"Lumiere": lumiere, "location": location, "rotation": rotation, "scale": scale, "group": {}}
+
+        for g in range(groups_start, groups_start + groups_count):
+            group, group_definition = Lumiere_rig_group.unpack_from(data, groups_offset + g * Lumiere_rig_group.size)
+            record["group"][string(group)] = definition(group_definition)
+
+        if flags & RIG_SMOOTH:
+            record["smooth"] = smooth
+        if flags & RIG_GRADIENT:
+            record["repeat"] = repeat
+            record["interpolation"] = string(interpolation)
+            record["gradient"] = {}
+            for s in range(gradient_start, gradient_start + gradient_count):
+                position, *stop_color = Lumiere_rig_stop.unpack_from(data, stops_offset + s * Lumiere_rig_stop.size)
+                record["gradient"][position] = tuple(stop_color)
+        if hdri_path != Lumiere_rig_none:
+            record["hdri_path"] = string(hdri_path)
+        if flags & RIG_HDRI_COL:
+            record["hdri_col"] = hdri_col
+        if img_path != Lumiere_rig_none:
+            record["img_path"] = string(img_path)
+        if flags & RIG_IMG_COL:
+            record["img_col"] = img_col
+
+        lumiere_dict[name] = record
+
+    return(lumiere_dict)
+#########################################################################################################
+
+#########################################################################################################
+def rig_read(path, names=None):
+    """Read the lights of a binary rig file through a memory map"""
+
+    with open(path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return(rig_unpack(data, names))
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# IMAGES
+#########################################################################################################
+"""
+#---Images of the imported lights : one datablock by file, Blender reads the pixels when the image is
+#---displayed or rendered. First bytes of the image formats checked on import
+Lumiere_images_magic = {".hdr": (b"#?RADIANCE", b"#?RGBE"),
+                        ".exr": (b"\x76\x2f\x31\x01",),
+                        ".png": (b"\x89PNG",),
+                        ".jpg": (b"\xff\xd8\xff",),
+                        ".jpeg": (b"\xff\xd8\xff",),
+                        ".tif": (b"II*\x00", b"MM\x00*"),
+                        ".tiff": (b"II*\x00", b"MM\x00*"),
+                        }
+
+#########################################################################################################
+def image_check(path):
+    """Return True if the file exists, is not empty and starts like its format"""
+
+    try:
+        if os.path.getsize(path) == 0:
+            return(False)
+        with open(path, 'rb') as file:
+            header = file.read(16)
+    except OSError:
+        return(False)
+
+    magic = Lumiere_images_magic.get(os.path.splitext(path)[1].lower())
+    return(magic is None or header.startswith(magic))
+#########################################################################################################
+
+#########################################################################################################
+def image_reference(path, name=""):
+    """Return the image of the file, loaded one time without reading the pixels, None if the file is not readable"""
+
+    if not image_check(os.path.normpath(bpy.path.abspath(path))):
+        return(None)
+
+#---Same image for the same file, the color space is set by Blender from the format of the file
+    count = len(bpy.data.images)
+    try:
+        image = bpy.data.images.load(path, check_existing=True)
+    except RuntimeError:
+        return(None)
+    if name and len(bpy.data.images) > count:
+        image.name = name
+
+    return(image)
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# PROXY ENVIRONMENT
+#########################################################################################################
+"""
+#---Low resolution copies of the environment images used by the world nodes while the light is edited
+#---original image name : proxy image
+Lumiere_proxy = {}
+Lumiere_proxy_width = 1024
+
+#########################################################################################################
+def image_hash(image, *options):
+    """Return a hash of the source file of the image and of the options of the copy"""
+
+    abspath = os.path.normpath(bpy.path.abspath(image.filepath))
+    try:
+        if image.packed_file is not None:
+            raise OSError("Packed image")
+        stat = os.stat(abspath)
+        key = "%s|%d|%d" % (abspath, stat.st_mtime_ns, stat.st_size)
+    except OSError:
+    #---Packed or generated image : hash of its content, the name can be reused by another image
+        content = hashlib.sha1()
+        data = getattr(image.packed_file, "data", None)
+        if data:
+            content.update(data if isinstance(data, bytes) else data.encode("utf-8", "surrogateescape"))
+        else:
+            pixels = np.empty(len(image.pixels), dtype=np.float32)
+            try:
+                image.pixels.foreach_get(pixels)
+            except AttributeError:
+                pixels[:] = image.pixels[:]
+            content.update(pixels.tobytes())
+        key = "%s|%d|%d" % (content.hexdigest(), image.size[0], image.size[1])
+    key += "".join("|%r" % (option,) for option in options)
+
+    return(hashlib.sha1(key.encode("utf-8")).hexdigest())
+#########################################################################################################
+
+#########################################################################################################
+def proxy_path(image):
+    """Return the cache file of the proxy, named by the hash of the source file"""
+
+    content_hash = image_hash(image, Lumiere_proxy_width)
+
+    return(os.path.join(os.path.dirname(__file__), "lumiere_proxies", content_hash + ".exr"))
+#########################################################################################################
+
+#########################################################################################################
+def proxy_image(image):
+    """Return the proxy of the image, generated once and cached on disk"""
+
+    if image.size[0] <= Lumiere_proxy_width:
+        return(image)
+
+    path = proxy_path(image)
+    if os.path.exists(path):
+        try:
+            return(bpy.data.images.load(path, check_existing=True))
+        except RuntimeError as error:
+            print("Error to report : ", error)
+
+#---Prefiltered by the scale of a copy, the original keeps its pixels
+    width = Lumiere_proxy_width
+    height = max(1, int(image.size[1] * width / image.size[0]))
+    proxy = image.copy()
+    proxy.name = "PROXY_" + image.name
+    try:
+        proxy.scale(width, height)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        proxy.filepath_raw = path
+        proxy.file_format = 'OPEN_EXR'
+        proxy.save()
+    except RuntimeError as error:
+        print("Error to report : ", error)
+        bpy.data.images.remove(proxy)
+        return(image)
+
+    return(proxy)
+#########################################################################################################
+
+#########################################################################################################
+def env_image(name):
+    """Return the image of the world nodes, the proxy during the interactive mode"""
+
+    return(Lumiere_proxy.get(name) or bpy.data.images[name])
+#########################################################################################################
+
+#########################################################################################################
+def proxy_swap(context, obj_light):
+    """Link the proxies or the originals to the environment textures"""
+
+#---The world nodes read the images through env_image
+    update_mat(obj_light.Lumiere, context)
+#########################################################################################################
+
+#########################################################################################################
+def proxy_start(context, obj_light):
+    """Substitute the proxies to the environment images"""
+
+    for name in (obj_light.Lumiere.hdri_name, obj_light.Lumiere.img_name):
+        if name != "" and name in bpy.data.images and name not in Lumiere_proxy:
+            proxy = proxy_image(bpy.data.images[name])
+            if proxy.name != name:
+                Lumiere_proxy[name] = proxy
+    proxy_swap(context, obj_light)
+#########################################################################################################
+
+#########################################################################################################
+def proxy_stop(context, obj_light):
+    """Link back the original images, the proxies stay cached on disk"""
+
+    if not Lumiere_proxy:
+        return
+    proxies = list(Lumiere_proxy.values())
+    Lumiere_proxy.clear()
+    if obj_light is not None and obj_light.name in bpy.data.objects:
+        proxy_swap(context, obj_light)
+
+#---Unused proxies are not saved with the file
+    for proxy in proxies:
+        if proxy.users == 0:
+            bpy.data.images.remove(proxy)
+#########################################################################################################
+
+#########################################################################################################
+"""
+#########################################################################################################
+# ENVIRONMENT BAKE
+#########################################################################################################
+"""
+#---Bakes are made by the Bake options operator and packed in the blend file, the update of the options only looks
+#---for the bake of their values : the image of the bake holds its slot (HDRI, IMG...), its source image and its values
+#---Default values of the Bright/Contrast, Gamma and Hue Saturation Value nodes
+Lumiere_bake_neutral = (0, 0, 1, 0.5, 1, 1)
+
+#---Number of bakes kept for each slot, the least recently used ones are removed beyond it
+Lumiere_bake_limit = 4
+
+#---Counter of the bakes stored, part of the key of the texture nodes : a new bake makes them search again
+Lumiere_bake_generation = 0
+
+#########################################################################################################
+def bake_adjust(pixels, bright, contrast, gamma, hue, saturation, value):
+    """Apply the Bright/Contrast, Gamma and Hue Saturation Value nodes of Cycles to the pixels"""
+
+    rgb = pixels[..., :3]
+
+#---Bright/Contrast
+    rgb = np.maximum(rgb * (1 + contrast) + (bright - contrast * .5), 0)
+
+#---Gamma
+    rgb = np.power(rgb, gamma)
+
+#---Hue Saturation Value
+    if (hue, saturation, value) != Lumiere_bake_neutral[3:]:
+        red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+        cmax = rgb.max(axis=-1)
+        delta = cmax - rgb.min(axis=-1)
+        safe = np.where(delta > 0, delta, 1)
+        cred, cgreen, cblue = (cmax - red) / safe, (cmax - green) / safe, (cmax - blue) / safe
+        h = np.where(red == cmax, cblue - cgreen, np.where(green == cmax, 2 + cred - cblue, 4 + cgreen - cred)) / 6
+        h = np.where(delta > 0, h % 1.0, 0)
+        s = np.where(cmax > 0, delta / np.where(cmax > 0, cmax, 1), 0)
+
+        h = (h + hue + .5) % 1.0
+        s = np.clip(s * saturation, 0, 1)
+        v = cmax * value
+
+        sector = np.floor(h * 6).astype(np.int32) % 6
+        f = h * 6 - np.floor(h * 6)
+        p, q, t = v * (1 - s), v * (1 - s * f), v * (1 - s * (1 - f))
+        rgb = np.stack((np.choose(sector, (v, q, p, p, t, v)),
+                        np.choose(sector, (t, v, v, q, p, p)),
+                        np.choose(sector, (p, p, t, v, v, q))), axis=-1)
+        rgb = np.maximum(rgb, 0)
+
+    pixels = pixels.copy()
+    pixels[..., :3] = rgb
+    return(pixels)
+#########################################################################################################
+
+#########################################################################################################
+def bake_read(image):
+    """Return the scene linear pixels of the image as a numpy array (rows, columns, RGBA)"""
+
+    width, height = image.size
+    pixels = np.empty(width * height * image.channels, dtype=np.float32)
+    try:
+        image.pixels.foreach_get(pixels)
+    except AttributeError:
+        pixels[:] = image.pixels[:]
+    pixels = pixels.reshape(height, width, -1)
+
+#---The nodes work on scene linear colors
+    if not image.is_float and image.colorspace_settings.name == 'sRGB':
+        rgb = pixels[..., :3]
+        pixels[..., :3] = np.where(rgb <= 0.04045, rgb / 12.92, np.power((rgb + 0.055) / 1.055, 2.4))
+    if pixels.shape[2] < 4:
+        pixels = np.concatenate((pixels, np.ones((height, width, 4 - pixels.shape[2]), dtype=np.float32)), axis=2)
+
+    return(pixels)
+#########################################################################################################
+
+#########################################################################################################
+def bake_match(image, slot, name, values):
+    """Return True if the image is the bake of the slot made from the image name with these values"""
+
+    stored = image.get("lumiere_bake")
+    return(image.get("lumiere_source") == slot and image.get("lumiere_image") == name and
+           stored is not None and len(stored) == len(values) and all(abs(a - b) < 1e-4 for a, b in zip(stored, values)))
+#########################################################################################################
+
+#########################################################################################################
+def bake_find(slot, name, values):
+    """Return the bake of the slot made from the image name with these values, None if it is not baked"""
+
+    for image in bpy.data.images:
+        if image.name.startswith("BAKE_") and bake_match(image, slot, name, values):
+            return(image)
+
+    return(None)
+#########################################################################################################
+
+#########################################################################################################
+def bake_lookup(text_node, slot, name, values, source):
+    """Return the bake of the values if there is one, else the image returned by source,
+    the bakes are only searched if the image, the values or the bakes changed since the last look of the node"""
+
+    def key(image):
+        return(json.dumps([Lumiere_bake_generation, slot, name, list(values), image.name]))
+
+    if text_node.image is not None and text_node.get("lumiere_bake") == key(text_node.image):
+        return(text_node.image)
+
+    image = bake_find(slot, name, values) or source()
+    text_node["lumiere_bake"] = key(image)
+
+    return(image)
+#########################################################################################################
+
+#########################################################################################################
+def bake_use(image):
+    """Mark the bake as used now, the least recently used bakes are removed first"""
+
+    if image.name.startswith("BAKE_"):
+        image["lumiere_used"] = time.time()
+#########################################################################################################
+
+#########################################################################################################
+def bake_evict(slot, keep):
+    """Remove the least recently used bakes of the slot beyond Lumiere_bake_limit, never the image keep"""
+
+    bakes = sorted([image for image in bpy.data.images if image.get("lumiere_source") == slot and image != keep],
+                   key=lambda image: image.get("lumiere_used", 0), reverse=True)
+    for image in bakes[Lumiere_bake_limit - 1:]:
+        bpy.data.images.remove(image)
+#########################################################################################################
+
+#########################################################################################################
+def bake_store(slot, name, values, pixels):
+    """Pack the pixels in the blend file as an EXR image, tagged with its slot, source image and values"""
+
+    height, width = pixels.shape[:2]
+    generated = bpy.data.images.new("BAKE_" + name, width, height, alpha=True, float_buffer=True)
+    handle, path = tempfile.mkstemp(suffix=".exr")
+    os.close(handle)
+    try:
+        try:
+            generated.pixels.foreach_set(pixels.ravel())
+        except AttributeError:
+            generated.pixels[:] = pixels.ravel().tolist()
+        generated.filepath_raw = path
+        generated.file_format = 'OPEN_EXR'
+        generated.save()
+
+    #---The EXR file is packed, the float pixels are kept and the temporary file can go
+        baked = bpy.data.images.load(path)
+        baked.pack()
+    finally:
+        bpy.data.images.remove(generated)
+        os.remove(path)
+
+    baked.name = "BAKE_" + name
+    baked.filepath_raw = "//" + bpy.path.clean_name(baked.name) + ".exr"
+    baked.use_fake_user = True
+    baked["lumiere_source"] = slot
+    baked["lumiere_image"] = name
+    baked["lumiere_bake"] = list(values)
+    bake_use(baked)
+    bake_evict(slot, baked)
+
+    global Lumiere_bake_generation
+    Lumiere_bake_generation += 1
+
+    return(baked)
+#########################################################################################################
+
+#########################################################################################################
+def env_adjustments(cobj, prefix):
+    """Return the Bright, Contrast, Gamma, Hue, Saturation and Value options of the hdri or img image"""
+
+    return(tuple(round(getattr(cobj.Lumiere, prefix + "_" + option), 4)
+                 for option in ("bright", "contrast", "gamma", "hue", "saturation", "value")))
+#########################################################################################################
+
+#########################################################################################################
+def bake_link(node_tree, text_node, hue_node, background, slot, name, values):
+    """Sample the bake of the options directly if there is one, else the image through the adjustment nodes"""
+
+#---The proxy of the interactive mode is adjusted by the nodes, the bake is kept for the render
+    if name in Lumiere_proxy:
+        image = env_image(name)
+    else:
+        image = bake_lookup(text_node, slot, name, values, lambda: env_image(name))
+
+#---The bakes of the previous options are kept for a return to them
+    if text_node.image != image:
+        bake_use(image)
+    set_if_changed(text_node, "image", image)
+    if image.name.startswith("BAKE_"):
+        link_sockets(node_tree, text_node.outputs[0], background.inputs[0])
+    else:
+        link_sockets(node_tree, hue_node.outputs[0], background.inputs[0])
+#########################################################################################################
+
+#########################################################################################################
+class SCENE_OT_bake_options(Operator):
+    """Apply the options once to the pixels of the image, the image is sampled directly until the options change"""
+
+    bl_idname = "object.bake_options"
+    bl_label = "Bake options"
+    bl_options = {'REGISTER', 'UNDO'}
+
+    act_light = bpy.props.StringProperty()
+    target = EnumProperty(name="Image",
+                          items=(
+                          ("HDRI", "Environment image", "", 0),
+                          ("IMG", "Background image", "", 1),
+                          ("PROJECTOR", "Projector texture", "", 2),
+                          ),
+                          default="HDRI")
+
+    def execute(self, context):
+        cobj = bpy.data.objects.get(self.act_light) or context.active_object
+        if self.target == "PROJECTOR":
+            slot = "PROJECTOR_" + cobj.data.name
+            name = cobj.Lumiere.projector_img_name
+            values = projector_values(cobj)
+            neutral = Lumiere_projector_neutral
+            compute = lambda image: projector_mip(projector_adjust(bake_read(image), *values[:-1]), values[-1])
+            update = update_projector_mat
+        else:
+            slot = self.target
+            name = getattr(cobj.Lumiere, self.target.lower() + "_name")
+            values = env_adjustments(cobj, self.target.lower())
+            neutral = Lumiere_bake_neutral
+            compute = lambda image: bake_adjust(bake_read(image), *values)
+            update = update_mat
+
+        image = bpy.data.images.get(name)
+        if image is None:
+            self.report({'WARNING'}, "No image to bake")
+            return {'CANCELLED'}
+        if values == neutral:
+            self.report({'INFO'}, "Nothing to bake, the options have their default values")
+            return {'CANCELLED'}
 
-        except Exception as error:
-            print("Error to report : ", error)  
-            bpy.context.window.cursor_modal_set("DEFAULT")
-            context.area.header_text_set()
-            self.remove_handler()
+        start = time.time()
+        if bake_find(slot, name, values) is None:
+            try:
+                bake_store(slot, name, values, compute(image))
+            except RuntimeError as error:
+                self.report({'ERROR'}, "Can't bake the image : " + str(error))
+                return {'CANCELLED'}
+        update(cobj.Lumiere, context)
 
-            return {'FINISHED'}
-    
+        self.report({'INFO'}, image.name + " baked in " + "%.3f" % (time.time() - start) + "s")
+        return {'FINISHED'}
+#########################################################################################################
+"""
+#########################################################################################################
+# PROJECTOR BAKE
+#########################################################################################################
+"""
+#---Default values of the Saturation, Gamma, Bright/Contrast and Invert nodes of the projector, then no blur
+Lumiere_projector_neutral = (0, 1, 0, 0, 0, 0)
 
-    def invoke(self, context, event):
-        self.mouse_path = [0,0]
-        if context.space_data.type == 'VIEW_3D':
-            context.area.type = 'IMAGE_EDITOR'
-            t_panel = context.area.regions[2]
-            n_panel = context.area.regions[3]
-            self.view_3d_region_x = Vector((context.area.x + t_panel.width, context.area.x + context.area.width - n_panel.width))
+#########################################################################################################
+def projector_adjust(pixels, saturation, gamma, bright, contrast, invert):
+    """Apply the Saturation, Gamma, Bright/Contrast and Invert nodes of the projector to the pixels"""
 
-            self.execute(context)
-            self.img_size = [self.img_size_x, self.img_size_y]
-            args = (self, context, event)
-            self.lumiere_area = context.area
+    rgb = pixels[..., :3]
 
-            context.window_manager.modal_handler_add(self)
-            self._handle = bpy.types.SpaceImageEditor.draw_handler_add(draw_target_px, args, 'WINDOW', 'POST_PIXEL')
-    
-        
-        return {'RUNNING_MODAL'}
-                
+#---Saturation mix with white : the hue and the value are kept, the saturation is scaled
+    cmax = rgb.max(axis=-1)[..., None]
+    rgb = cmax - (cmax - rgb) * (1 - saturation)
+
+#---Gamma
+    rgb = np.where(rgb > 0, np.power(np.maximum(rgb, 0), gamma), rgb)
+
+#---Bright/Contrast
+    rgb = np.maximum(rgb * (1 + contrast) + (bright - contrast * .5), 0)
+
+#---Invert
+    rgb = rgb * (1 - invert) + (1 - rgb) * invert
+
+    pixels = pixels.copy()
+    pixels[..., :3] = rgb
+    return(pixels)
 #########################################################################################################
 
 #########################################################################################################
-def export_props_light(self, context, lightname, dupliname):
+def projector_mip(pixels, level):
+    """Return the level of the mip pyramid of the pixels, each level is the average of 2x2 pixels"""
+
+    for i in range(level):
+        height, width = pixels.shape[:2]
+        if height < 2 and width < 2:
+            break
+    #---Odd sizes repeat their last row / column
+        if height % 2:
+            pixels = np.concatenate((pixels, pixels[-1:]), axis=0)
+        if width % 2:
+            pixels = np.concatenate((pixels, pixels[:, -1:]), axis=1)
+        height, width = pixels.shape[:2]
+        pixels = pixels.reshape(height // 2, 2, width // 2, 2, -1).mean(axis=(1, 3))
+
+    return(pixels)
+#########################################################################################################
+
+#########################################################################################################
+def projector_values(cobj):
+    """Return the Saturation, Gamma, Bright, Contrast and Invert options of the projector texture and its blur"""
+
+    return(tuple(round(getattr(cobj.Lumiere, "projector_img_" + option), 4)
+                 for option in ("saturation", "gamma", "bright", "contrast", "invert")) + (cobj.Lumiere.projector_img_blur, ))
+#########################################################################################################
+
+#########################################################################################################
+def export_props_light(self, context, lightname, dupliname, groups=None):
     lumiere_dict = {}
     obj_light = get_lamp(context, lightname)
     dupli = bpy.data.objects[dupliname]
@@ -4128,9 +6799,13 @@ def export_props_light(self, context, lightname, dupliname):
     lumiere_dict[dupliname]['location'] = tuple(dupli.location)
     lumiere_dict[dupliname]['Lumiere']['definition'] = list(textwrap.wrap(dupli['Lumiere']['definition'], 50)) if "definition" in dupli['Lumiere'] else " "
     lumiere_dict[dupliname]['group'] = {}
-    for group in bpy.data.objects[dupliname].users_group :
-        # lumiere_dict[dupliname]['group'] = {group.name : list(textwrap.wrap(group["Lumiere"]["definition"], 50))} if "definition" in group["Lumiere"] else {group.name : " "}
-        lumiere_dict[dupliname]['group'].update({group.name : list(textwrap.wrap(group['Lumiere']['definition'], 50))} if "definition" in group['Lumiere'] else {group.name : " "})
+#---Groups already known by a batch export
+    if groups is not None:
+        lumiere_dict[dupliname]['group'].update(groups)
+    else:
+        for group in bpy.data.objects[dupliname].users_group :
+            # lumiere_dict[dupliname]['group'] = {group.name : list(textwrap.wrap(group["Lumiere"]["definition"], 50))} if "definition" in group["Lumiere"] else {group.name : " "}
+            lumiere_dict[dupliname]['group'].update({group.name : list(textwrap.wrap(group['Lumiere']['definition'], 50))} if "definition" in group['Lumiere'] else {group.name : " "})
         
 #--- Environment light
     if obj_light.Lumiere.typlight == "Env":
@@ -4151,7 +6826,7 @@ def export_props_light(self, context, lightname, dupliname):
             lumiere_dict[dupliname]['smooth'] = mat.node_tree.nodes['Light Falloff'].inputs[1].default_value
         #---Gradient
             if dupli.Lumiere.texture_type == "Gradient":
-                lumiere_dict[dupliname]['repeat'] = mat.node_tree.nodes['Math'].inputs[1].default_value 
+                lumiere_dict[dupliname]['repeat'] = mat.node_tree.nodes['Repeat_Texture'].inputs[1].default_value 
                 colramp = mat.node_tree.nodes['ColorRamp'].color_ramp      
                 lumiere_dict[dupliname]['gradient'] = {}
                 lumiere_dict[dupliname]['interpolation'] = colramp.interpolation
@@ -4187,23 +6862,14 @@ class SCENE_OT_export_light(Operator):
             self.act_light = context.active_object.name 
             obj_light = context.active_object
             
-    #---Try to open the Lumiere export dictionary
-        try:
-            with open(current_file_dir + "\\" + "lumiere_dictionary.json", 'r', encoding='utf-8') as file:
-                my_dict = json.load(file)
-                file.close()    
-        except Exception:
-            print("Warning, dict empty, creating a new one.")
-            my_dict = {}
-                
         lumiere_dict = export_props_light(self, context, obj_light.Lumiere.lightname, self.act_light)
 
-        my_dict.update(lumiere_dict)
-        
-        with open(current_file_dir + "\\" + "lumiere_dictionary.json", "w", encoding='utf-8') as file:
-            json.dump(my_dict, file, sort_keys=True, indent=4, ensure_ascii=False)
+    #---Append the light to the library or write a binary rig
+        if context.scene.Lumiere.export_format == "Rig":
+            rig_write(rig_path(self.act_light), lumiere_dict)
+        else:
+            library_write(lumiere_dict)
 
-        file.close()
         message = "Light exported"
         self.report({'INFO'}, message)
         return {'FINISHED'}
@@ -4217,35 +6883,22 @@ class SCENE_OT_export_group(Operator):
     bl_label = "Export group"
     
     act_group = bpy.props.StringProperty()
+    all_groups = bpy.props.BoolProperty(default=False)
     
     def execute(self, context):
-        lumiere_dict = {}
-        current_file_path = __file__
-        current_file_dir = os.path.dirname(__file__)
-        
-    #---Try to open the Lumiere export dictionary
-        try:
-            with open(current_file_dir + "\\" + "lumiere_dictionary.json", 'r', encoding='utf-8') as file:
-                my_dict = json.load(file)
-                file.close()
-        except :
-            print("Warning, dict empty, creating a new one.")   
-            my_dict = {}
-        
-        if self.act_group != "": 
-            if bpy.data.groups[self.act_group]:
-                for ob in bpy.data.objects:
-                    for group in ob.users_group:
-                        if group.name == self.act_group:
-                            lumiere_dict = export_props_light(self, context, ob.Lumiere.lightname, ob.name)
-                            my_dict.update(lumiere_dict)
-                        
-            with open(current_file_dir + "\\" + "lumiere_dictionary.json", "w", encoding='utf-8') as file:
-                json.dump(my_dict, file, sort_keys=True, indent=4, ensure_ascii=False)
+        if self.all_groups:
+            group_names = [group.name for group in bpy.data.groups]
+        elif self.act_group != "" and bpy.data.groups.get(self.act_group) is not None:
+            group_names = [self.act_group]
+        else:
+            return {'CANCELLED'}
+
+        path = None
+        if context.scene.Lumiere.export_format == "Rig":
+            path = rig_path("Lumiere_groups" if self.all_groups else self.act_group)
+        count, timing = export_groups_batch(context, group_names, path)
 
-            file.close()
-            message = "Group exported"
-            self.report({'INFO'}, message)
+        self.report({'INFO'}, timing_message(("Groups" if self.all_groups else "Group") + " exported : " + str(count) + " lights", timing))
         return {'FINISHED'}
 #########################################################################################################
 
@@ -4264,13 +6917,141 @@ class GROUP_UL_list(bpy.types.UIList):
 
 #########################################################################################################
 class ALL_LIGHTS_UL_list(bpy.types.UIList):
+    """Lights of the library, searched by name, group and description"""
+
+    filter_type = EnumProperty(name="Type", 
+                               description="Show only this type of light",
+                               items=Lumiere_filter_types,
+                               default="All")
+
     def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
         object = data
+        thumbnail = thumbnail_icon(item.name)
         if self.layout_type in {'DEFAULT', 'COMPACT'}:
             split = layout.split(0.7)
-            split.prop(item, "name", text="", toggle=False, emboss=False, icon_value=icon, icon="GROUP" if item.all_light_in_group else "BLANK1")
+            if thumbnail:
+                split.prop(item, "name", text="", toggle=False, emboss=False, icon_value=thumbnail)
+                split.label(text="", icon="GROUP" if item.all_light_in_group else "BLANK1")
+            else:
+                split.prop(item, "name", text="", toggle=False, emboss=False, icon_value=icon, icon="GROUP" if item.all_light_in_group else "BLANK1")
+        elif self.layout_type in {'GRID'}:
+            layout.label(text="", icon_value=thumbnail if thumbnail else icon)
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, "filter_name", text="")
+        row.prop(self, "filter_type", text="")
+
+    def filter_items(self, context, data, propname):
+        """Show the lights found in the search index of the library"""
+
+    #---Called one time before the rows are drawn : the rows read the thumbnails from this index
+        Lumiere_thumbnails["index"] = library_index()
+
+        items = getattr(data, propname)
+        if self.filter_name == "" and self.filter_type == "All":
+            return([], [])
+
+        found = library_search(self.filter_name, self.filter_type)
+        flt_flags = [self.bitflag_filter_item if item.name in found else 0 for item in items]
+
+        return(flt_flags, [])
+#########################################################################################################
+
+#########################################################################################################
+class LIGHTS_UL_panel_list(bpy.types.UIList):
+    """List of the lights of the visible layers, only the visible rows are drawn"""
+
+    filter_type = EnumProperty(name="Type", 
+                               description="Show only this type of light",
+                               items=Lumiere_filter_types,
+                               default="All")
+
+    filter_group = StringProperty(name="Group", 
+                                  description="Show only the lights of the groups with this name")
+
+    sort_by = EnumProperty(name="Sort by", 
+                           description="Order of the lights",
+                           items=(
+                           ("NAME", "Name", "", 0),
+                           ("TYPE", "Type", "", 1),
+                           ("GROUP", "Group", "", 2),
+                           ("ENERGY", "Energy", "", 3),
+                           ),
+                           default="NAME")
+
+    def draw_item(self, context, layout, data, item, icon, active_data, active_propname, index):
+        cobj = bpy.data.objects.get(item.name)
+        if cobj is None:
+            layout.label(text=item.name)
+        elif self.layout_type in {'DEFAULT', 'COMPACT'}:
+            row = layout.row(align=True)
+            op = row.operator("object.edit_light", icon='ACTION_TWEAK', text='', emboss=False)
+            op.editmode = True
+            op.act_light = cobj.name   
+            row.prop(cobj.Lumiere, "show", text='', icon='OUTLINER_OB_LAMP' if cobj.Lumiere.show else 'LAMP', emboss=False)
+            row.prop(cobj, "name", text="", emboss=False)
+            row.label(text=cobj.Lumiere.typlight)
+            if cobj.Lumiere.typlight != "Env":
+                row.prop(cobj.Lumiere, "energy", text="", emboss=False)
         elif self.layout_type in {'GRID'}:
-            pass        
+            pass
+
+    def draw_filter(self, context, layout):
+        row = layout.row(align=True)
+        row.prop(self, "filter_name", text="")
+        row.prop(self, "filter_group", text="", icon='GROUP')
+        row = layout.row(align=True)
+        row.prop(self, "filter_type", text="")
+        row.prop(self, "sort_by", text="")
+
+    def filter_items(self, context, data, propname):
+        """Show the lights of the list of the panel matching the filters"""
+
+        items = getattr(data, propname)
+        objects = bpy.data.objects
+        pattern = self.filter_name.lower()
+        group_pattern = self.filter_group.lower()
+        flt_flags = [0] * len(items)
+        sort_data = []
+
+        for index, item in enumerate(items):
+            name = item.name
+            cobj = objects.get(name)
+            if cobj is None:
+                sort_data.append((index, (1, "")))
+                continue
+
+            typlight = cobj.Lumiere.typlight
+            if (self.filter_type == "All" or typlight == self.filter_type) and \
+               (pattern == "" or pattern in name.lower()) and \
+               (group_pattern == "" or group_pattern in item.group.lower()):
+                flt_flags[index] = self.bitflag_filter_item
+
+            if self.sort_by == "TYPE":
+                key = (typlight, name)
+            elif self.sort_by == "GROUP":
+                key = (item.group, name)
+            elif self.sort_by == "ENERGY":
+                key = (cobj.Lumiere.energy, name)
+            else:
+                key = name
+            sort_data.append((index, (0, key)))
+
+        flt_neworder = bpy.types.UI_UL_list.sort_items_helper(sort_data, key = lambda item: item[1])
+
+        return(flt_flags, flt_neworder)
+#########################################################################################################
+
+#########################################################################################################
+def update_panel_light_index(self, context):
+    """Make the light clicked in the list the active object"""
+
+    if 0 <= self.Lumiere_panel_lights_index < len(self.Lumiere_panel_lights):
+        cobj = self.objects.get(self.Lumiere_panel_lights[self.Lumiere_panel_lights_index].name)
+        if cobj is not None and cobj.type != 'EMPTY' and cobj.data.name.startswith("Lumiere"):
+            self.objects.active = cobj
+            cobj.select = True
 #########################################################################################################
 
 ########################################################################################################
@@ -4286,6 +7067,12 @@ class GroupProp(bpy.types.PropertyGroup):
     num = bpy.props.StringProperty()
 #########################################################################################################
 
+########################################################################################################
+# Create custom property group
+class PanelLightProp(bpy.types.PropertyGroup):
+    group = bpy.props.StringProperty()
+#########################################################################################################
+
 #########################################################################################################
 class RemoveLightItem(bpy.types.Operator):
     bl_idname = "scene.remove_light_item"
@@ -4301,10 +7088,8 @@ class RemoveLightItem(bpy.types.Operator):
         settings = context.scene.Lumiere_all_lights_list    
         settings.remove(context.scene.Lumiere_all_lights_list_index)
         context.scene.Lumiere_all_lights_list_index -= 1
-        self.my_dict = get_lumiere_dict(self, context)
         self.report({'INFO'}, "Light " + self.light + " deleted from the list")
-        self.my_dict.pop(self.light, None)
-        update_lumiere_dict(self, context, self.my_dict)
+        library_remove([self.light])
     
         return {'FINISHED'} 
 #########################################################################################################
@@ -4325,41 +7110,24 @@ class RemoveGroupItem(bpy.types.Operator):
         print("LIST GROUP: ", settings)
         settings.remove(context.scene.Lumiere_groups_list_index)
         context.scene.Lumiere_groups_list_index -= 1
-        self.my_dict = get_lumiere_dict(self, context)
         self.report({'INFO'}, "Group " + self.group + " deleted from the list")
-        for key, value in self.my_dict.items():
-            if self.group in value["group"]:
-                value["group"].pop(self.group, None)
-        update_lumiere_dict(self, context, self.my_dict)
+        library_remove_group(self.group)
     
         return {'FINISHED'} 
 #########################################################################################################
 
 #########################################################################################################
 def get_lumiere_dict(self, context):
-        
-    current_file_dir = os.path.dirname(__file__)
-    
-#---Try to open the Lumiere export dictionary
-    try:
-        with open(current_file_dir + "\\" + "lumiere_dictionary.json", 'r', encoding='utf-8') as file:
-            my_dict = json.loads(file.read())       
-            file.close()
-    except : 
-        my_dict = {}
+    """Return the index of the library : group, type and definition of each light"""
 
-    return(my_dict)
+    return(library_index())
 #########################################################################################################
 
 #########################################################################################################
 def update_lumiere_dict(self, context, my_dict):
-        
-    current_file_dir = os.path.dirname(__file__)
-        
-    with open(current_file_dir + "\\" + "lumiere_dictionary.json", "w", encoding='utf-8') as file:
-        json.dump(my_dict, file, sort_keys=True, indent=4, ensure_ascii=False)
-    file.close()        
+    """Add or replace the lights of the dictionary in the library"""
 
+    library_write(my_dict)
 #########################################################################################################
 
 #########################################################################################################
@@ -4392,7 +7160,7 @@ class SCENE_OT_import_management(bpy.types.Operator):
         try:
         #---Create the list of lights or lights in group 
             if self.select_group == "Group":
-                light_in_group = [key for key, value in self.my_dict.items() if self.select_item in value["group"]]
+                light_in_group = library_lists()["members"].get(self.select_item, [])
 
                 if bpy.data.groups.get(self.select_item) is not None:
                     group_to_link = bpy.data.groups[self.select_item]
@@ -4442,7 +7210,7 @@ class SCENE_OT_import_management(bpy.types.Operator):
                     row.scale_y = 0.5
                     row.label(v)
 
-                group_light = [key for key in self.my_dict.keys() if self.select_item in self.my_dict[key]["group"]]
+                group_light = library_lists()["members"].get(self.select_item, [])
                 self.separator()
                 for light in group_light:
                     row = layout.row(align=True)
@@ -4467,33 +7235,10 @@ class SCENE_OT_import_management(bpy.types.Operator):
                     row.label(v)
                 
     def invoke(self, context, event):
-        context.scene.Lumiere_all_lights_list.clear()
-        context.scene.Lumiere_groups_list.clear()
-        current_file_dir = os.path.dirname(__file__)
         self.my_dict = get_lumiere_dict(self, context)
-        self.group_dict = defaultdict(list)
+        self.group_dict = library_fill_lists(context)["groups"]
         self.group_light = {}
-        
-        for key, value in self.my_dict.items():
-
-        #---Fill the items for the light with or without group
-            item = context.scene.Lumiere_all_lights_list.add()
-            item.name = key     
-            item.all_light_in_group = True if self.my_dict[key]["group"] else False         
-            
-        #---Fill the items for the light in group
-            if self.my_dict[key]["group"]:
-                self.group_dict.update({i:self.my_dict[key]["group"][i] for i in self.my_dict[key]["group"]})
 
-    #---Create a list with all the groups and count them
-        cnt = Counter([val for value in self.my_dict.values() for val in value["group"]])
-
-    #---Fill the items for the groups
-        for group, nbr in cnt.items():
-            item = context.scene.Lumiere_groups_list.add()
-            item.name = group
-            item.num = str(nbr)
-            
         return context.window_manager.invoke_popup(self)
         # return context.window_manager.invoke_props_dialog(self)
 #########################################################################################################
@@ -4523,65 +7268,70 @@ class SCENE_OT_import_light(bpy.types.Operator):
         row.operator("object.separator", text=" ", icon='BLANK1')
         row.alert = False
         
-    def add_light(self, context, light):
+    def add_light(self, context, light, record=None, deferred=False):
 
     #---Check if the light already exist
-        for ob in context.scene.objects:
-            if ob.name == light:
-                error_message = True
+        error_message = context.scene.objects.get(light) is not None
+
+    #---Load only the record of this light
+        if record is None:
+            record = library_read([light])[light]
 
-        if self.my_dict[light]["Lumiere"]["typlight"] == 0:
+        if record["Lumiere"]["typlight"] == 0:
             obj_light = create_softbox(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 1:
+        elif record["Lumiere"]["typlight"] == 1:
             obj_light = create_light_point(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 2:
+        elif record["Lumiere"]["typlight"] == 2:
             obj_light = create_light_sun(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 3:
+        elif record["Lumiere"]["typlight"] == 3:
             obj_light = create_light_spot(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 4:
+        elif record["Lumiere"]["typlight"] == 4:
             obj_light = create_light_area(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 5:
+        elif record["Lumiere"]["typlight"] == 5:
             obj_light = create_light_sky(self, context, dupli_name = light)
-        elif self.my_dict[light]["Lumiere"]["typlight"] == 6:
+        elif record["Lumiere"]["typlight"] == 6:
             obj_light = create_light_env(self, context, dupli_name = light)
 
-        obj_light["Lumiere"] = self.my_dict[light]["Lumiere"]
-        obj_light.Lumiere.definition = ' '.join(self.my_dict[light]["Lumiere"]["definition"])
+        obj_light["Lumiere"] = record["Lumiere"]
+        obj_light.Lumiere.definition = ' '.join(record["Lumiere"]["definition"])
         obj_light["Lumiere"]["lightname"] = obj_light.data.name
-        obj_light.location = self.my_dict[light]["location"]
-        obj_light.rotation_euler = self.my_dict[light]["rotation"]
-        obj_light.scale = self.my_dict[light]["scale"]
+        obj_light.location = record["location"]
+        obj_light.rotation_euler = record["rotation"]
+        obj_light.scale = record["scale"]
 
         
     #--- Environment light
         if obj_light.Lumiere.typlight == "Env":
             world = bpy.data.worlds['Lumiere_world'].node_tree.nodes
-            if "hdri_name" in self.my_dict[light]["Lumiere"]:
-                bpy.data.images.load(self.my_dict[light]['hdri_path'], check_existing=True)
-                bpy.data.images[self.my_dict[light]["Lumiere"]["hdri_name"]].filepath = self.my_dict[light]['hdri_path'] 
-            if "img_name" in self.my_dict[light]["Lumiere"]:
-                bpy.data.images.load(self.my_dict[light]['img_path'], check_existing=True)
-                bpy.data.images[self.my_dict[light]["Lumiere"]["img_name"]].filepath = self.my_dict[light]['img_path']
-            world['Background'].inputs[0].default_value = [*self.my_dict[light]['hdri_col']]
-            world['Background.001'].inputs[0].default_value = [*self.my_dict[light]['img_col']]
+        #---The images are shared by file and only read when the world is displayed or rendered
+            for prop, path in (("hdri_name", "hdri_path"), ("img_name", "img_path")):
+                if record["Lumiere"].get(prop) and path in record:
+                    image = image_reference(record[path], record["Lumiere"][prop])
+                    if image is None:
+                        obj_light.Lumiere[prop] = ""
+                        self.report({'WARNING'}, "Image missing or not readable : " + record[path])
+                    else:
+                        obj_light.Lumiere[prop] = image.name
+            world['Background'].inputs[0].default_value = [*record['hdri_col']]
+            world['Background.001'].inputs[0].default_value = [*record['img_col']]
         
         else:
 
             lamp = get_lamp(context, obj_light.data.name) 
             mat_name, mat = get_mat_name(lamp.data.name)
             if lamp.type == "LAMP":
-                lamp.data.node_tree.nodes["Light Falloff"].inputs[1].default_value = self.my_dict[light]['smooth']
+                lamp.data.node_tree.nodes["Light Falloff"].inputs[1].default_value = record['smooth']
             else:
-                mat.node_tree.nodes['Light Falloff'].inputs[1].default_value = self.my_dict[light]['smooth']    
+                mat.node_tree.nodes['Light Falloff'].inputs[1].default_value = record['smooth']    
             
 
         #---Gradient
             if obj_light.Lumiere.texture_type == "Gradient":
-                mat.node_tree.nodes['Math'].inputs[1].default_value = self.my_dict[light]['repeat']
+                mat.node_tree.nodes['Repeat_Texture'].inputs[1].default_value = record['repeat']
                 colramp = mat.node_tree.nodes['ColorRamp'].color_ramp 
-                colramp.interpolation = self.my_dict[light]['interpolation']
+                colramp.interpolation = record['interpolation']
                 i = 0
-                for key, value in sorted(self.my_dict[light]['gradient'].items()) :
+                for key, value in sorted(record['gradient'].items()) :
                     if i > 1:
                         colramp.elements.new(float(key))
                     colramp.elements[i].position = float(key)
@@ -4589,24 +7339,44 @@ class SCENE_OT_import_light(bpy.types.Operator):
                     i += 1
         
         self.lightname = obj_light["Lumiere"]["lightname"]
+
+    #---The grid and the material are done at the end of a bulk import
+        if deferred:
+            return(obj_light)
+
         create_lamp_grid(self, context)
         update_mat(self, context)
 
-        
+        return(obj_light)
+
+    def add_lights(self, context, records):
+        """Create all the lights first, then the grid and the material of each light in one pass"""
+
+        lights = [self.add_light(context, light, record, deferred=True) for light, record in records.items()]
+
+        for obj_light in lights:
+            self.lightname = obj_light.Lumiere.lightname
+        #---A single light doesn't need a new mesh, the duplicator already has its vertex at the center
+            if obj_light.Lumiere.nbcol > 1 or obj_light.Lumiere.nbrow > 1:
+                create_lamp_grid(self, context)
+            else:
+                lamp_grid_display(context, obj_light)
+            update_mat(self, context)
+
+        return(lights)
+
     def execute(self, context):
         
         try:
         #---Create the list of lights or lights in group 
             if self.select_group == "Group":
-                light_in_group = [key for key, value in self.my_dict.items() if self.select_item in value["group"]]
+                light_in_group = library_lists()["members"].get(self.select_item, [])
 
                 if bpy.data.groups.get(self.select_item) is not None:
                     group_to_link = bpy.data.groups[self.select_item]
                 else:
                     group_to_link = bpy.data.groups.new(self.select_item)
-                for light in light_in_group:
-                    self.add_light(context, light)
-                    cobj = get_object(context, self.lightname)
+                for cobj in self.add_lights(context, library_read(light_in_group)):
                     group_to_link.objects.link(cobj)
             else:
                 self.add_light(context, self.select_item)
@@ -4628,6 +7398,8 @@ class SCENE_OT_import_light(bpy.types.Operator):
         col = box.column()
         row = col.row(align=True)
         row.prop(self, "select_group", text=" ", expand=True)       
+        row.operator("object.import_rig", text="", icon='FILESEL')
+        row.operator("object.create_lights_batch", text="", icon='FILE_TEXT')
 
     #---Get a Light or a Group
         if self.select_group == "Group":
@@ -4644,7 +7416,7 @@ class SCENE_OT_import_light(bpy.types.Operator):
                     row.scale_y = 0.5
                     row.label(v)
 
-                group_light = [key for key in self.my_dict.keys() if self.select_item in self.my_dict[key]["group"]]
+                group_light = library_lists()["members"].get(self.select_item, [])
                 self.separator()
                 for light in group_light:
                     row = layout.row(align=True)
@@ -4665,35 +7437,53 @@ class SCENE_OT_import_light(bpy.types.Operator):
                     row.label(v)
                 
     def invoke(self, context, event):
-        context.scene.Lumiere_all_lights_list.clear()
-        context.scene.Lumiere_groups_list.clear()
-        current_file_dir = os.path.dirname(__file__)
         self.my_dict = get_lumiere_dict(self, context)
-        self.group_dict = defaultdict(list)
+        self.group_dict = library_fill_lists(context)["groups"]
         self.group_light = {}
+
+        return context.window_manager.invoke_props_dialog(self)
         
-        for key, value in self.my_dict.items():
+#########################################################################################################
 
-        #---Fill the items for the light with or without group
-            item = context.scene.Lumiere_all_lights_list.add()
-            item.name = key     
-            item.all_light_in_group = True if self.my_dict[key]["group"] else False         
-            
-        #---Fill the items for the light without group
-            if self.my_dict[key]["group"]:
-                self.group_dict.update({i:self.my_dict[key]["group"][i] for i in self.my_dict[key]["group"]})
+#########################################################################################################
+class SCENE_OT_import_rig(bpy.types.Operator):
+    """Import the lights of a binary rig file"""
 
-    #---Create a list with all the groups and count them
-        cnt = Counter([val for value in self.my_dict.values() for val in value["group"]])
+    bl_idname = "object.import_rig"
+    bl_label = "Import rig"
+    bl_options = {'REGISTER', 'UNDO'}
 
-    #---Fill the items for the groups
-        for group, nbr in cnt.items():
-            item = context.scene.Lumiere_groups_list.add()
-            item.name = group
-            item.num = str(nbr)
-            
-        return context.window_manager.invoke_props_dialog(self)
-        
+    filepath = bpy.props.StringProperty(subtype="FILE_PATH")
+    filter_glob = bpy.props.StringProperty(default="*" + Lumiere_rig_extension, options={'HIDDEN'})
+
+#---Same creation of the lights as the import from the library
+    add_light = SCENE_OT_import_light.add_light
+    add_lights = SCENE_OT_import_light.add_lights
+
+    def execute(self, context):
+        try:
+            lumiere_dict = rig_read(bpy.path.abspath(self.filepath))
+        except Exception as error:
+            self.report({'ERROR'}, "Can't read the rig : " + str(error))
+            return {'CANCELLED'}
+
+        lights = self.add_lights(context, lumiere_dict)
+
+    #---Link the lights to their groups
+        for cobj, record in zip(lights, lumiere_dict.values()):
+            for group_name in record["group"]:
+                group = bpy.data.groups.get(group_name)
+                if group is None:
+                    group = bpy.data.groups.new(group_name)
+                group.objects.link(cobj)
+
+        self.report({'INFO'}, str(len(lumiere_dict)) + " lights imported")
+        return {'FINISHED'}
+
+    def invoke(self, context, event):
+        self.filepath = os.path.join(os.path.dirname(__file__), "lumiere_rigs") + os.sep
+        context.window_manager.fileselect_add(self)
+        return {'RUNNING_MODAL'}
 #########################################################################################################
 
 #########################################################################################################
@@ -4770,15 +7560,18 @@ class SCENE_OT_remove_light(bpy.types.Operator):
         if obj_light.Lumiere.typlight != "Env":
         #---Get the lamp or the softbox link to the duplivert
             lamp_or_softbox = get_lamp(context, obj_light.Lumiere.lightname)
+            light_registry_remove(context, lamp_or_softbox)
             context.scene.objects.unlink(lamp_or_softbox)
             bpy.data.objects.remove(lamp_or_softbox, do_unlink=True)
         else:
             child = obj_light.children[0]
         #---Get the lamp or widget for the environment
+            light_registry_remove(context, child)
             context.scene.objects.unlink(child)
             bpy.data.objects.remove(child, do_unlink=True)  
 
     #---Remove the duplivert
+        light_registry_remove(context, obj_light)
         context.scene.objects.unlink(obj_light)
         bpy.data.objects.remove(obj_light, do_unlink = True)
         return {"FINISHED"}
@@ -4974,12 +7767,11 @@ class OBJECT_OT_light_group_link(Operator):
     group = bpy.props.StringProperty()
     
     def execute(self, context):
-        context.scene.objects.active = bpy.data.objects[self.light] 
         obj_light = bpy.data.objects[self.light]
-        obj_light.select = True
-        bpy.ops.object.group_link(group=self.group)
-        obj_light.select = False
-        context.scene.objects.active = bpy.data.objects[self.light] 
+        group = bpy.data.groups[self.group]
+        if obj_light.name not in group.objects:
+            group.objects.link(obj_light)
+        context.scene.objects.active = obj_light
         obj_light.select = True
         return {'FINISHED'}
 #########################################################################################################
@@ -5048,6 +7840,9 @@ class SCENE_OT_export_popup(Operator):
             cobj = bpy.data.objects[self.act_name]
         #---Export individual light
             self.separator()
+            self.draw_props("Format")
+            row = self.column.row(align=True)
+            row.prop(scene.Lumiere, "export_format", expand=True)
             self.draw_props("Export")
             op = self.column.operator("object.export_light", text ="Export Light")
             op.act_light = cobj.name 
@@ -5084,9 +7879,15 @@ class SCENE_OT_export_popup(Operator):
         #---Export all lights in this group
             group = bpy.data.groups[self.act_name]
             self.separator()
+            self.draw_props("Format")
+            row = self.column.row(align=True)
+            row.prop(scene.Lumiere, "export_format", expand=True)
             self.draw_props("Export")
-            op = self.column.operator("object.export_group", text ="Export Group")
+            row = self.column.row(align=True)
+            op = row.operator("object.export_group", text ="Export Group")
             op.act_group = self.act_name
+            op = row.operator("object.export_group", text ="Export All Groups")
+            op.all_groups = True
             self.draw_props("Description")
             row = self.column.row(align=True)
             row.prop(group.Lumiere, "definition", text="", expand=False)
@@ -5148,6 +7949,22 @@ class LumiereScn(bpy.types.PropertyGroup):
                                     items = items_list_group_add
                                     )
 
+#---Format of the export : library of the addon or binary rig file
+    export_format = EnumProperty(name="Format",
+                                 description="Format of the export.\n"+\
+                                 "- Library    : Add the lights to the library of the addon.\n"+\
+                                 "- Binary rig : Write a compact binary rig file in the lumiere_rigs folder.",
+                                 items=(
+                                 ("Library", "Library", "Add to the library of the addon (JSON)", 0),
+                                 ("Rig", "Binary rig", "Write a compact binary rig file in the lumiere_rigs folder", 1),
+                                 ),
+                                 default="Library")
+
+#---Show the lights in a list, only the visible rows are drawn
+    list_mode = BoolProperty(name="List mode",
+                             description="Show the lights in a list with filters, only the visible rows are drawn.",
+                             default=False)
+
 #-------------------------------------------------------------------------#
 #-------------------------------------------------------------------------#
 #-------------------------------------------------------------------------#
@@ -5388,6 +8205,70 @@ class LumiereObj(bpy.types.PropertyGroup):
                          step=0.1,                         
                          update=create_lamp_grid)                                                                              
 
+#---Emitters of the grid with their own intensity and color
+    array_light = BoolProperty(name="Array",
+                               description="Give each emitter of the grid its own intensity and color.",
+                               default=False,
+                               update=update_array)
+
+#---Pattern of the intensity of the emitters
+    array_pattern = EnumProperty(name="Pattern",
+                                 description="Pattern of the intensity of the emitters.\nSelected",
+                                 items=(
+                                 ("Uniform", "Uniform", "", 0),
+                                 ("Noise", "Noise", "", 1),
+                                 ("Falloff", "Falloff", "Falloff from the center", 2),
+                                 ("Image", "Image", "Intensity and color from an image", 3),
+                                 ),
+                                 default="Uniform",
+                                 update=update_array)
+
+#---Strength of the pattern
+    array_amount = FloatProperty(name="Amount",
+                                 description="Strength of the pattern.",
+                                 min=0, max=1,
+                                 default=1,
+                                 precision=2,
+                                 update=update_array)
+
+#---Size of the noise
+    array_scale = FloatProperty(name="Scale",
+                                description="Size of the noise in emitters.",
+                                min=0.1, max=9999,
+                                default=4,
+                                precision=1,
+                                update=update_array)
+
+#---Random color of the emitters
+    array_color = FloatProperty(name="Random color",
+                                description="Random color variation of the emitters.",
+                                min=0, max=1,
+                                default=0,
+                                precision=2,
+                                update=update_array)
+
+#---Random offset of the emitters
+    array_offset = FloatProperty(name="Random offset",
+                                 description="Random offset of the emitters along the normal of the grid.",
+                                 min=0, max=9999,
+                                 default=0,
+                                 precision=3,
+                                 subtype='DISTANCE',
+                                 unit='LENGTH',
+                                 update=update_array)
+
+#---Seed of the random values
+    array_seed = IntProperty(name="Seed",
+                             description="Seed of the random values of the emitters.",
+                             min=0,
+                             default=0,
+                             update=update_array)
+
+#---Image of the pattern
+    array_image = StringProperty(name="Image",
+                                 description="Image giving the intensity and the color of the emitters.",
+                                 update=update_array)
+
 #---Keep the aspect ratio when scaling or when changing the distance
     ratio = BoolProperty(
                          name="Keep ratio",
@@ -5820,6 +8701,15 @@ class LumiereObj(bpy.types.PropertyGroup):
                                       unit='NONE',
                                       update=update_projector_mat)              
 
+#---Fixed blur of the baked image texture.
+    projector_img_blur = IntProperty(
+                                  name="Blur",
+                                  description="Fixed blur of the image texture, applied by Bake options.\n"+\
+                                  "Each step halves the resolution of the baked image (average of 2x2 pixels), whatever the distance of the projector.",
+                                  min=0, max=8,
+                                  default=0,
+                                  update=update_projector_mat)
+
 #---Smooth the edges of the projector / softbox. 1 = round                          
     projector_smooth = FloatProperty(
                                 name="Round",
@@ -5931,6 +8821,14 @@ class LumiereEnvPreferences(bpy.types.Panel):
                     op.img_type = "HDRI"
                     op.img_size_x = bpy.data.images[cobj.Lumiere.hdri_name].size[0]
                     op.img_size_y = bpy.data.images[cobj.Lumiere.hdri_name].size[1]
+                    op = row.operator("object.select_pixel", text ='Find Key Light', icon='LAMP_SUN')
+                    op.act_light = cobj.name 
+                    op.img_name = cobj.Lumiere.hdri_name
+                    op.img_type = "HDRI"
+                    op.find_key = True
+                    row = col.row(align=True)
+                    op = row.operator("object.extract_hdri_lights", text ='Extract Lights', icon='LAMP_AREA')
+                    op.act_light = cobj.name 
                     
                     col = box.column()
                     col = box.column(align=True)
@@ -5986,6 +8884,9 @@ class LumiereEnvPreferences(bpy.types.Panel):
                         #---Reset values
                             row = col.row(align=True)
                             row.prop(cobj.Lumiere, "hdri_reset", text="Reset options", toggle=True)
+                            op = row.operator("object.bake_options", text="Baked" if hdri_img.image and hdri_img.image.name.startswith("BAKE_") else "Bake options")
+                            op.act_light = cobj.name
+                            op.target = "HDRI"
             #---Hdri for background
                 row = col.row(align=True)
                 row.prop(cobj.Lumiere, "hdri_background", text='Hdri for background', toggle=True)
@@ -6061,6 +8962,9 @@ class LumiereEnvPreferences(bpy.types.Panel):
                         #---Reset values
                             row = col.row(align=True)
                             row.prop(cobj.Lumiere, "img_reset", text="Reset options", toggle=True)
+                            op = row.operator("object.bake_options", text="Baked" if back_img.image and back_img.image.name.startswith("BAKE_") else "Bake options")
+                            op.act_light = cobj.name
+                            op.target = "IMG"
                 
                 #---Background for reflection
                     row = col.row(align=True)
@@ -6220,7 +9124,7 @@ class LumiereProjectorPreferences(bpy.types.Panel):
                 
             #---Color material
                 if cobj.Lumiere.projector_options == "Color":
-                    color = projector.data.materials['Mat_PROJECTOR_' + cobj.data.name].node_tree.nodes['Transparent BSDF.001'].inputs['Color']
+                    color = projector.data.materials['Mat_PROJECTOR_' + cobj.data.name].node_tree.nodes['Projector_Color'].inputs['Color']
                     col.prop(color, "default_value", text="")
                 
             #---Texture file material
@@ -6249,6 +9153,12 @@ class LumiereProjectorPreferences(bpy.types.Panel):
                             row.prop(cobj.Lumiere, "projector_img_invert")
                             row = col.row(align=True)
                             row.prop(cobj.Lumiere, "projector_img_reset", text="Reset options", toggle=True)
+                            projector_img = projector.data.materials['Mat_PROJECTOR_' + cobj.data.name].node_tree.nodes['Image Texture']
+                            op = row.operator("object.bake_options", text="Baked" if projector_img.image and projector_img.image.name.startswith("BAKE_") else "Bake options")
+                            op.act_light = cobj.name
+                            op.target = "PROJECTOR"
+                            row = col.row(align=True)
+                            row.prop(cobj.Lumiere, "projector_img_blur")
             
             #---Gradient material
                 elif cobj.Lumiere.projector_options == "Gradient":
@@ -6626,6 +9536,25 @@ class LumiereSoftboxPreferences(bpy.types.Panel):
             op.from_panel = True
             op.scale_gapx = True
             
+        #---Array
+            col = box.column(align=True)
+            row = col.row(align=True)
+            row.prop(cobj.Lumiere, "array_light", text='Array', toggle=True)
+            if cobj.Lumiere.array_light:
+                row.prop(cobj.Lumiere, "array_pattern", text='')
+                row = col.row(align=True)
+                if cobj.Lumiere.array_pattern == "Image":
+                    row.prop_search(cobj.Lumiere, "array_image", bpy.data, "images", text="")
+                    row = col.row(align=True)
+                elif cobj.Lumiere.array_pattern == "Noise":
+                    row.prop(cobj.Lumiere, "array_scale", text='Scale')
+                row.prop(cobj.Lumiere, "array_amount", text='Amount')
+                row = col.row(align=True)
+                row.prop(cobj.Lumiere, "array_color", text='Color')
+                row.prop(cobj.Lumiere, "array_offset", text='Offset')
+                row = col.row(align=True)
+                row.prop(cobj.Lumiere, "array_seed", text='Seed')
+
         #-----------------------------------#
         #SCALE
         #-----------------------------------#
@@ -6699,7 +9628,7 @@ class LumiereSoftboxPreferences(bpy.types.Panel):
             
         #---Gradient
             if cobj.Lumiere.texture_type == "Gradient":
-                repeat_u = softbox_mat.node_tree.nodes["Math"].inputs[1]
+                repeat_u = softbox_mat.node_tree.nodes["Repeat_Texture"].inputs[1]
                 col = box.column(align=True)
                 row = col.row(align=True)
                 row.prop(cobj.Lumiere, "typgradient", text="")
@@ -6749,8 +9678,8 @@ class LumiereSoftboxPreferences(bpy.types.Panel):
                     row.prop(cobj.Lumiere, "img_expand", text="")
                 
             #---Texture options expanded
-                repeat_u = softbox_mat.node_tree.nodes["Math"].inputs[1] 
-                repeat_v = softbox_mat.node_tree.nodes["Math.002"].inputs[1] 
+                repeat_u = softbox_mat.node_tree.nodes["Repeat_Texture"].inputs[1] 
+                repeat_v = softbox_mat.node_tree.nodes["Repeat_Texture"].inputs[2] 
             
                 row = col.row(align=True)                                   
                 if cobj.Lumiere.img_expand and cobj.Lumiere.img_name != "":
@@ -6844,12 +9773,9 @@ class LumiereLightParameterPreferences(bpy.types.Panel):
         
         if object.Lumiere.typlight == "Panel":
             self.softbox_mat = bpy.data.materials["Mat_SOFTBOX_" + object.data.name]
-            for ob in context.scene.objects:
-                if ob.type != 'EMPTY' and ob.data.name == "SOFTBOX_" + object.data.name:
-                    softbox_obj = ob 
                     
         self.lamp = get_lamp(context, object.data.name) 
-        lamp = get_lamp(context, object.data.name) 
+        lamp = self.lamp
         
         split = box.split(.17)
 
@@ -6983,6 +9909,110 @@ class LumiereLightParameterPreferences(bpy.types.Panel):
                 elif cobj.Lumiere.items_light_type == "Projector":
                     LumiereProjectorPreferences.draw(self, context)
                             
+#########################################################################################################
+# global variable to store the lights drawn in the panel in : 
+# {scene name : (key, [(group name, [light names])], [light names without group])}
+Lumiere_panel = {}
+
+# global variable to store the cached lights last copied in the list of the panel : {scene name : cached lights}
+Lumiere_panel_list = {}
+
+def panel_lights_key(scene):
+    """Return the state of the scene used to know if the lights of the panel are still valid"""
+
+    return((tuple(scene.layers), len(scene.objects), tuple(group.name for group in bpy.data.groups), 
+            sum(len(group.objects) for group in bpy.data.groups)))
+
+def panel_lights_rebuild(scene):
+    """Sort the visible lights of the scene by group, one pass over the objects"""
+
+    layers = scene.layers
+    groups = defaultdict(list)
+    lights_on_layer = []
+
+    for ob in scene.objects:
+        if ob.type != 'EMPTY' and ob.data.name.startswith("Lumiere") and \
+           any(visible and on_layer for visible, on_layer in zip(layers, ob.layers)):
+            if ob.users_group:
+                for group in ob.users_group:
+                    groups[group.name].append(ob.name)
+            else:
+                lights_on_layer.append(ob.name)
+
+    lights_on_group = [(group.name, groups[group.name]) for group in bpy.data.groups if group.name in groups]
+    cached = (panel_lights_key(scene), lights_on_group, lights_on_layer)
+    Lumiere_panel[scene.name] = cached
+
+    return(cached)
+
+def panel_lights(context):
+    """Return the lights of the panel by group and the lights without group, rebuild them if needed"""
+
+    scene = context.scene
+    cached = Lumiere_panel.get(scene.name)
+    if cached is None or cached[0] != panel_lights_key(scene):
+        cached = panel_lights_rebuild(scene)
+
+    key, lights_on_group, lights_on_layer = cached
+
+#---Renamed or removed light or group : rebuild one time
+    names = lights_on_layer + [name for group_name, lights in lights_on_group for name in lights]
+    if any(name not in bpy.data.objects for name in names) or \
+       any(group_name not in bpy.data.groups for group_name, lights in lights_on_group):
+        key, lights_on_group, lights_on_layer = panel_lights_rebuild(scene)
+
+    return(lights_on_group, lights_on_layer)
+
+def panel_list_sync(scene, cached):
+    """Copy the cached lights in the list of the panel, only if they changed"""
+
+    key, lights_on_group, lights_on_layer = cached
+    lights = OrderedDict()
+    for group_name, names in lights_on_group:
+        for name in names:
+            lights.setdefault(name, group_name)
+    for name in lights_on_layer:
+        lights.setdefault(name, "")
+
+    panel_list = scene.Lumiere_panel_lights
+    if [(item.name, item.group) for item in panel_list] != list(lights.items()):
+        panel_list.clear()
+        for name, group_name in lights.items():
+            item = panel_list.add()
+            item.name = name
+            item.group = group_name
+    Lumiere_panel_list[scene.name] = cached
+
+@persistent
+def panel_tag_update(scene):
+    """Rebuild the lights of the panel if the layers, the groups or the visibility of a light changed, then refresh the list of the panel"""
+
+    cached = Lumiere_panel.get(scene.name)
+    key = panel_lights_key(scene)
+
+#---A light moved on another layer : the key only knows the layers of the scene
+    if cached is not None and cached[0] == key and bpy.data.objects.is_updated:
+        listed = set(cached[2]).union(*(names for group_name, names in cached[1]))
+        for name in Lumiere_lights.get(scene.name, {}).values():
+            ob = bpy.data.objects.get(name)
+            if ob is not None and ob.is_updated and ob.data.name.startswith("Lumiere") and \
+               any(visible and on_layer for visible, on_layer in zip(scene.layers, ob.layers)) != (ob.name in listed):
+                cached = None
+                break
+
+#---The draw functions can't write in the scene, the list is refreshed here
+    if cached is None or cached[0] != key:
+        cached = panel_lights_rebuild(scene)
+    if Lumiere_panel_list.get(scene.name) is not cached:
+        panel_list_sync(scene, cached)
+
+@persistent
+def panel_reset(dummy):
+    """Forget all the lights of the panel after undo / redo / loading a file"""
+
+    Lumiere_panel.clear()
+    Lumiere_panel_list.clear()
+
 """
 #########################################################################################################
 # UI
@@ -7006,8 +10036,6 @@ class LumierePreferences(bpy.types.Panel):
         cobj = context.active_object
         layout = self.layout
         row = layout.row(align=True)
-        objects_on_layer = []
-        objects_on_group = []
         self.group = ""
         pcoll = Lumiere_custom_icons["Lumiere"]
 
@@ -7027,28 +10055,27 @@ class LumierePreferences(bpy.types.Panel):
         else:
             row.operator("object.create_light", text="New", icon='BLANK1')
 
+        row.prop(scene.Lumiere, "list_mode", text="", icon='COLLAPSEMENU' if scene.Lumiere.list_mode else 'SORTALPHA')
+
         row = col.row(align=True)
 #----------------------------------
+# LIST MODE
+#----------------------------------         
+        if scene.Lumiere.list_mode:
+            layout.template_list("LIGHTS_UL_panel_list", "", scene, "Lumiere_panel_lights", scene, "Lumiere_panel_lights_index", rows=8)
+
+        #---Parameters of the active light only
+            if cobj is not None and cobj.type != 'EMPTY' and cobj.data.name.startswith("Lumiere"):
+                self.object = cobj
+                self.box = layout.column().box()
+                LumiereLightParameterPreferences.draw(self, context)
+            return
+
+#----------------------------------
 # EDIT MODE
 #----------------------------------         
-        g = -1
-        dct_group = defaultdict(list)
-    #---For each Group
-        for layer in bpy.data.scenes[scene.name].layers:
-            g += 1
-            for group in bpy.data.groups:
-                light_on_group = [obj for obj in group.objects if obj.type != 'EMPTY' and obj.layers[g] and layer == True and obj.data.name.startswith("Lumiere") ]
-                if light_on_group != [] and layer == True : 
-                    dct_group[group].append(light_on_group)
-                    objects_on_group.extend(light_on_group)
-                    
-    #---For each layer
-        l = -1  
-        for layer in bpy.data.scenes[scene.name].layers:
-            l += 1
-            light_on_layer = [obj for obj in context.scene.objects if not obj.users_group and  obj.type != 'EMPTY' and obj.layers[l] and layer == True and obj.data.name.startswith("Lumiere")]
-            if layer == True and light_on_layer != []: 
-                objects_on_layer.extend(light_on_layer)
+    #---Lights of the visible layers by group and without group
+        lights_on_group, lights_on_layer = panel_lights(context)
             
         """
         #########################################################################################################
@@ -7060,9 +10087,11 @@ class LumierePreferences(bpy.types.Panel):
                 
         col = layout.column()
     #---For each group of lights
-        for group in dct_group:
+        for group_name, list_group in lights_on_group:
+            group = bpy.data.groups.get(group_name)
+            if group is None:
+                continue
             self.group = group
-            list_group = [item for it in dct_group[group] for item in it]
             
             row = layout.row(align=True)
             box = row.box()
@@ -7091,16 +10120,15 @@ class LumierePreferences(bpy.types.Panel):
                 row.scale_y = .15
                 row.operator("object.separator", text=" ", icon='BLANK1')
 
-                for self.object in group.objects:
-                    if self.object in list(set(list_group)):
-                        self.box = box
-                        LumiereLightParameterPreferences.draw(self, context)
-                        col = box.column(align=True)                
-                        row = col.row(align=True)
-                        row.scale_y = .15
-                        row.alert = True
-                        row.operator("object.separator", text=" ", icon='BLANK1')
-                        row.alert = False
+                for self.object in [bpy.data.objects[name] for name in list_group]:
+                    self.box = box
+                    LumiereLightParameterPreferences.draw(self, context)
+                    col = box.column(align=True)                
+                    row = col.row(align=True)
+                    row.scale_y = .15
+                    row.alert = True
+                    row.operator("object.separator", text=" ", icon='BLANK1')
+                    row.alert = False
         """
         #########################################################################################################
         #########################################################################################################
@@ -7111,7 +10139,7 @@ class LumierePreferences(bpy.types.Panel):
         
         col = layout.column()
     #---For each light on the selected layer(s)
-        for self.object in list(set(objects_on_layer)):
+        for self.object in [bpy.data.objects[name] for name in lights_on_layer]:
             col = layout.column()
             box = col.box()     
             self.box = box
@@ -7124,6 +10152,20 @@ class LumierePreferences(bpy.types.Panel):
 # global variable to store icons in
 Lumiere_custom_icons = {}
 
+def register_properties():
+    """Register the classes and the properties of the lights, all the background Blender of the thumbnails needs"""
+
+    bpy.utils.register_module(__name__)
+    bpy.types.Group.Lumiere = bpy.props.PointerProperty(type=LumiereGrp)
+    bpy.types.Scene.Lumiere = bpy.props.PointerProperty(type=LumiereScn)
+    bpy.types.Object.Lumiere = bpy.props.PointerProperty(type=LumiereObj)
+    bpy.types.Scene.Lumiere_groups_list = CollectionProperty(type=GroupProp)
+    bpy.types.Scene.Lumiere_groups_list_index = bpy.props.IntProperty()
+    bpy.types.Scene.Lumiere_all_lights_list = CollectionProperty(type=LightsProp)
+    bpy.types.Scene.Lumiere_all_lights_list_index = bpy.props.IntProperty()
+    bpy.types.Scene.Lumiere_panel_lights = CollectionProperty(type=PanelLightProp)
+    bpy.types.Scene.Lumiere_panel_lights_index = bpy.props.IntProperty(update=update_panel_light_index)
+
 def register():
     #--- Begin icons
     import bpy.utils.previews
@@ -7139,19 +10181,45 @@ def register():
         pcoll.load(key, os.path.join(icons_dir, f), 'IMAGE')
 
     Lumiere_custom_icons["Lumiere"] = pcoll
+    Lumiere_custom_icons["Thumbnails"] = bpy.utils.previews.new()
     #--- End icons
     
-    bpy.utils.register_module(__name__)
-    bpy.types.Group.Lumiere = bpy.props.PointerProperty(type=LumiereGrp)
-    bpy.types.Scene.Lumiere = bpy.props.PointerProperty(type=LumiereScn)
-    bpy.types.Object.Lumiere = bpy.props.PointerProperty(type=LumiereObj)
-    bpy.types.Scene.Lumiere_groups_list = CollectionProperty(type=GroupProp)
-    bpy.types.Scene.Lumiere_groups_list_index = bpy.props.IntProperty()
-    bpy.types.Scene.Lumiere_all_lights_list = CollectionProperty(type=LightsProp)
-    bpy.types.Scene.Lumiere_all_lights_list_index = bpy.props.IntProperty()
+    register_properties()
     update_panel(None, bpy.context)
+    bpy.app.handlers.load_post.append(light_registry_reset)
+    bpy.app.handlers.undo_post.append(light_registry_reset)
+    bpy.app.handlers.redo_post.append(light_registry_reset)
+    bpy.app.handlers.scene_update_post.append(bvh_tag_update)
+    bpy.app.handlers.scene_update_post.append(panel_tag_update)
+    bpy.app.handlers.scene_update_post.append(thumbnail_update)
+    bpy.app.handlers.load_post.append(panel_reset)
+    bpy.app.handlers.undo_post.append(panel_reset)
+    bpy.app.handlers.redo_post.append(panel_reset)
+    bpy.app.handlers.load_post.append(bvh_reset)
+    bpy.app.handlers.load_post.append(array_reload)
+    bpy.app.handlers.load_post.append(template_upgrade)
+    bpy.app.handlers.undo_post.append(bvh_reset)
+    bpy.app.handlers.redo_post.append(bvh_reset)
     
 def unregister():
+    for handler in (bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post):
+        if light_registry_reset in handler:
+            handler.remove(light_registry_reset)
+        if bvh_reset in handler:
+            handler.remove(bvh_reset)
+        if panel_reset in handler:
+            handler.remove(panel_reset)
+    if array_reload in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(array_reload)
+    if template_upgrade in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(template_upgrade)
+    for handler in (bvh_tag_update, panel_tag_update, thumbnail_update):
+        if handler in bpy.app.handlers.scene_update_post:
+            bpy.app.handlers.scene_update_post.remove(handler)
+    Lumiere_lights.clear()
+    Lumiere_no_companion.clear()
+    bvh_reset(None)
+    panel_reset(None)
     for pcoll in Lumiere_custom_icons.values():
         bpy.utils.previews.remove(pcoll)
     Lumiere_custom_icons.clear()
@@ -7159,6 +10227,8 @@ def unregister():
     del bpy.types.Scene.Lumiere_groups_list_index
     del bpy.types.Scene.Lumiere_all_lights_list
     del bpy.types.Scene.Lumiere_all_lights_list_index
+    del bpy.types.Scene.Lumiere_panel_lights
+    del bpy.types.Scene.Lumiere_panel_lights_index
     del bpy.types.Scene.Lumiere
     del bpy.types.Object.Lumiere
     bpy.utils.unregister_module(__name__)   
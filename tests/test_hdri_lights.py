@@ -0,0 +1,63 @@
+"""Strength of the lights extracted from an environment image, run inside Blender :
+blender -b --python-expr "import sys, unittest; sys.argv = ['']; unittest.main(module=None, argv=['', 'discover', '-s', 'tests'])"
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import bpy
+    import lumiere_beta
+except ImportError:
+    lumiere_beta = None
+
+
+def environment(width=64, height=32):
+    """Dim image with one bright spot, the channels are not equal to check the color"""
+
+    image = bpy.data.images.new("test_hdri", width, height, alpha=True, float_buffer=True)
+    pixels = [0.1] * (width * height * 4)
+    for y in range(14, 18):
+        for x in range(40, 44):
+            index = (y * width + x) * 4
+            pixels[index:index + 3] = [20.0, 15.0, 10.0]
+    image.pixels = pixels
+
+    return(image)
+
+
+@unittest.skipIf(lumiere_beta is None, "Blender is needed to import the addon")
+class ExtractTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        lumiere_beta.register()
+
+    @classmethod
+    def tearDownClass(cls):
+        lumiere_beta.unregister()
+
+    def setUp(self):
+        self.image = environment()
+        world = bpy.data.worlds.new("test_world")
+        world.use_nodes = True
+        self.mapping = world.node_tree.nodes.new("ShaderNodeMapping")
+
+    def test_sun_strength(self):
+        strength = 2.0
+        specs = lumiere_beta.hdri_light_specs(self.image, 2, "Sun", self.mapping, strength, 10)
+        lights, timing = lumiere_beta.create_lights_batch(bpy.context, specs)
+        irradiances = [max(c * strength for c in color) for u, v, color in lumiere_beta.hdri_median_cut(self.image, 2)]
+
+        self.assertEqual(len(lights), len(irradiances))
+        for dupli, irradiance in zip(lights, irradiances):
+            lamp = lumiere_beta.get_lamp(bpy.context, dupli.Lumiere.lightname)
+            self.assertEqual(lamp.data.type, 'SUN')
+            self.assertAlmostEqual(lamp.data.node_tree.nodes["Emission"].inputs[1].default_value, irradiance, places=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
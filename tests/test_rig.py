@@ -0,0 +1,136 @@
+"""Round trip of the binary rig, the rig section of the addon is compiled alone : no need of Blender"""
+
+import ast
+import json
+import math
+import os
+import struct
+import types
+import unittest
+
+
+def load_rig():
+    """Compile the constants and the functions of the binary rig, they only need struct and json"""
+
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lumiere_beta.py")
+    with open(path, encoding="utf-8") as file:
+        tree = ast.parse(file.read(), path)
+
+    module = ast.parse("")
+    module.body = [node for node in tree.body
+                   if (isinstance(node, ast.FunctionDef) and node.name in ("rig_pack_prop", "rig_pack", "rig_unpack")) or
+                      (isinstance(node, ast.Assign) and
+                       all(isinstance(target, ast.Name) and target.id.startswith(("Lumiere_rig_", "RIG_")) for target in node.targets))]
+    namespace = {"struct": struct, "json": json}
+    exec(compile(module, path, "exec"), namespace)
+
+    return(types.SimpleNamespace(**namespace))
+
+
+rig = load_rig()
+
+
+def normalize(value):
+    """Compare the sequences of the records without the tuple / list difference"""
+
+    if isinstance(value, dict):
+        return({key: normalize(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return([normalize(item) for item in value])
+    return(value)
+
+
+def lights():
+    """Lights in the format of export_props_light, the floats are exact in single precision"""
+
+    return({
+        "Lumiere": {
+            "Lumiere": {"typlight": 0, "energy": 12.5, "lightcolor": [1.0, 0.5, 0.25, 1.0],
+                        "definition": ["Key light of the", "portrait"], "lightname": "Lumiere",
+                        "range": 0.75, "texture_type": 1, "show": True, "img_name": "",
+                        "scale_xy": [2.0, 0.5], "nbcol": [3, 2], "tags": {"studio": [1, 2, 3, 4, 5]}},
+            "location": (1.0, -2.0, 3.5),
+            "rotation": (0.5, 0.0, -1.25),
+            "scale": (1.0, 1.0, 2.0),
+            "group": {"Portrait": ["Lights of the", "portrait"], "Studio": " "},
+            "smooth": 0.125,
+            "repeat": 2.0,
+            "interpolation": "EASE",
+            "gradient": {0.0: (1.0, 1.0, 1.0, 1.0), 0.5: (0.5, 0.25, 0.0, 1.0), 1.0: (0.0, 0.0, 0.0, 1.0)},
+        },
+        "Lumiere.001": {
+            "Lumiere": {"typlight": 6, "definition": " ", "hdri_name": "studio.hdr", "hdri_rotation": 1.5},
+            "location": (0.0, 0.0, 0.0),
+            "rotation": (0.0, 0.0, 0.0),
+            "scale": (1.0, 1.0, 1.0),
+            "group": {},
+            "hdri_path": "//textures/studio.hdr",
+            "hdri_col": [0.5, 0.5, 0.5, 1.0],
+            "img_path": "//textures/background.png",
+            "img_col": [0.0, 0.0, 0.0, 1.0],
+        },
+    })
+
+
+def inexact_light():
+    """Light with floats rounded by the single precision of the records"""
+
+    return({
+        "Lumiere": {"typlight": 1, "energy": 0.1, "lightcolor": [0.9, 1 / 3, 0.7, 1.0], "range": 2.7, "scale_xy": [0.3, 1.1]},
+        "location": (0.1, -1 / 3, 2.7),
+        "rotation": (math.pi / 2, 0.0, -0.2),
+        "scale": (1.1, 1.1, 1.1),
+        "group": {},
+        "smooth": 0.3,
+        "repeat": 1.7,
+        "interpolation": "LINEAR",
+        "gradient": {0.1: (0.9, 0.1, 1 / 3, 1.0), 0.7: (0.2, 0.4, 0.6, 0.8)},
+    })
+
+
+class RigTest(unittest.TestCase):
+
+    def assertFloatsAlmostEqual(self, first, second):
+        self.assertEqual(len(first), len(second))
+        for a, b in zip(first, second):
+            self.assertAlmostEqual(a, b, places=6)
+
+    def test_round_trip(self):
+        original = lights()
+        self.assertEqual(normalize(rig.rig_unpack(rig.rig_pack(original))), normalize(original))
+
+    def test_names(self):
+        original = lights()
+        unpacked = rig.rig_unpack(rig.rig_pack(original), names={"Lumiere.001"})
+        self.assertEqual(normalize(unpacked), normalize({"Lumiere.001": original["Lumiere.001"]}))
+
+    def test_magic(self):
+        data = bytearray(rig.rig_pack(lights()))
+        data[:4] = b"JSON"
+        with self.assertRaises(ValueError):
+            rig.rig_unpack(bytes(data))
+
+    def test_single_precision(self):
+        original = inexact_light()
+        unpacked = rig.rig_unpack(rig.rig_pack({"Lumiere": original}))["Lumiere"]
+
+        for key in ("location", "rotation", "scale"):
+            self.assertFloatsAlmostEqual(unpacked[key], original[key])
+        self.assertFloatsAlmostEqual(unpacked["Lumiere"]["lightcolor"], original["Lumiere"]["lightcolor"])
+        self.assertFloatsAlmostEqual(unpacked["Lumiere"]["scale_xy"], original["Lumiere"]["scale_xy"])
+        for key in ("energy", "range"):
+            self.assertAlmostEqual(unpacked["Lumiere"][key], original["Lumiere"][key], places=6)
+        for key in ("smooth", "repeat"):
+            self.assertAlmostEqual(unpacked[key], original[key], places=6)
+        self.assertEqual(unpacked["interpolation"], original["interpolation"])
+
+        stops = sorted(unpacked["gradient"].items())
+        original_stops = sorted(original["gradient"].items())
+        self.assertEqual(len(stops), len(original_stops))
+        for (position, color), (original_position, original_color) in zip(stops, original_stops):
+            self.assertAlmostEqual(position, original_position, places=6)
+            self.assertFloatsAlmostEqual(color, original_color)
+
+
+if __name__ == "__main__":
+    unittest.main()